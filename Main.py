@@ -1,6 +1,8 @@
 import output_ovf as oo
 import calc_field as cf
 import get_icon as gi
+import planner
+from conditions import get_append_filename, get_antenna_dict
 
 try:
     import footer_widget as fw
@@ -32,31 +34,6 @@ CLOSE_BUTTON_HOVER = "#E6E6E6"
 CLOSE_BUTTON_FONT_COLOR = "black"
 FOOTER_FONT_COLOR = "#666"
 
-def decimal_normalize(value):
-    if isinstance(value, float) and value.is_integer():
-        return int(value)
-    return value
-
-def add_si_prefix(value, unit):
-    prefixes = {
-        -24: 'y', -21: 'z', -18: 'a', -15: 'f', -12: 'p', -9: 'n', -6: 'µ', -3: 'm',
-        0: '', 3: 'k', 6: 'M', 9: 'G', 12: 'T', 15: 'P', 18: 'E', 21: 'Z', 24: 'Y'
-    }
-    
-    if value == 0:
-        return f"{value}{unit}"
-    
-    exponent = int('{:.0e}'.format(value).split('e')[1])
-    si_exponent = 3 * (exponent // 3)
-    
-    if si_exponent not in prefixes:
-        return f"{value} {unit}"
-    
-    new_value = value / (10 ** si_exponent)
-    si_prefix = prefixes[si_exponent]
-    
-    return f"{decimal_normalize(round(new_value, 3))}{si_prefix}{unit}"
-
 def get_windows_display_scale():
         hdc = ctypes.windll.user32.GetDC(0)
         dpi = ctypes.windll.gdi32.GetDeviceCaps(hdc, 88)
@@ -392,6 +369,7 @@ class MainWindow(QWidget):
         self.output_filename = QLineEdit("antenna")
         self.output_extension = QComboBox()
         self.output_extension.addItem(".ovf")
+        self.output_extension.addItem(oo.COMPRESSED_OVF_EXTENSION)
         # self.output_extension.addItem(".txt")
         self.append_filename = QLineEdit()
         
@@ -404,6 +382,24 @@ class MainWindow(QWidget):
         output_layout.addWidget(self.append_filename, 2, 1)
         output_layout.addWidget(self.output_extension, 2, 2)
 
+        self.export_basis = QCheckBox("Export basis fields per time function (phased antennas).")
+        output_layout.addWidget(self.export_basis, 3, 0, 1, 3)
+
+        self.force_recompute = QCheckBox("Recompute even if the output already matches the conditions.")
+        output_layout.addWidget(self.force_recompute, 4, 0, 1, 3)
+
+        self.export_hdf5 = QCheckBox("Also write a chunked HDF5 (.h5) for analysis.")
+        self.export_hdf5.setEnabled(oo.h5py_available)
+        if not oo.h5py_available:
+            self.export_hdf5.setToolTip("h5py is not installed.")
+        output_layout.addWidget(self.export_hdf5, 5, 0, 1, 3)
+        self.export_hdf5.stateChanged.connect(lambda: self.update_append_text())
+
+        # preflight estimate of the run, updated with the conditions
+        self.plan_label = QLabel()
+        self.plan_label.setWordWrap(True)
+        output_layout.addWidget(self.plan_label, 6, 0, 1, 3)
+
         main_layout.addWidget(output_group)
 
         # self.append_filename.editingFinished.connect(lambda: self.update_append_text())
@@ -471,6 +467,27 @@ class MainWindow(QWidget):
         ant_layout.addWidget(QLabel("Current direction (degree) :"), 3, 0, 1, 2)
         ant_layout.addWidget(current_direction, 3, 2, 1, 2)
 
+        # Coplanar waveguide: Width is the signal line, the grounds return the current
+        ant_type = QComboBox()
+        ant_type.setObjectName("ant_type")
+        ant_type.addItem("Strip")
+        ant_type.addItem("CPW (GSG)")
+        ground_split = QLineEdit("0.5")
+        ground_split.setObjectName("ground_split")
+        ant_layout.addWidget(QLabel("Type :"), 4, 0)
+        ant_layout.addWidget(ant_type, 4, 1)
+        ant_layout.addWidget(QLabel("Ground split :"), 4, 2)
+        ant_layout.addWidget(ground_split, 4, 3)
+
+        gap = QLineEdit("5e-6")
+        gap.setObjectName("gap")
+        ground_width = QLineEdit("10e-6")
+        ground_width.setObjectName("ground_width")
+        ant_layout.addWidget(QLabel("Gap (m) :"), 5, 0)
+        ant_layout.addWidget(gap, 5, 1)
+        ant_layout.addWidget(QLabel("Ground width (m) :"), 5, 2)
+        ant_layout.addWidget(ground_width, 5, 3)
+
         layout.addWidget(ant_group)
 
         # Input Current group
@@ -506,6 +523,16 @@ class MainWindow(QWidget):
         input_layout.addWidget(QLabel("Waveform :"), 2, 2)
         input_layout.addWidget(waveform, 2, 3)
 
+        phase = QLineEdit("0")
+        phase.setObjectName("phase")
+        frequency = QLineEdit()
+        frequency.setObjectName("frequency")
+        frequency.setPlaceholderText("freq")
+        input_layout.addWidget(QLabel("Phase (degree) :"), 3, 0)
+        input_layout.addWidget(phase, 3, 1)
+        input_layout.addWidget(QLabel("Frequency (Hz) :"), 3, 2)
+        input_layout.addWidget(frequency, 3, 3)
+
         layout.addWidget(input_group)
 
         input_current.editingFinished.connect(lambda: (self.update_tab_inputs('current'), self.update_append_text()))
@@ -514,6 +541,7 @@ class MainWindow(QWidget):
         input_power_W.editingFinished.connect(lambda: (self.update_tab_inputs('power_W'), self.update_append_text()))
         impedance.editingFinished.connect(lambda: (self.update_tab_inputs('impedance'), self.update_append_text()))
         waveform.currentIndexChanged.connect(lambda: (self.update_tab_inputs('waveform'), self.update_append_text()))
+        ant_type.currentIndexChanged.connect(lambda: self.update_append_text())
 
         return widget
 
@@ -692,67 +720,55 @@ class MainWindow(QWidget):
             dir_path = self.dir_str.text()
             output_filename = self.output_filename.text()
             output_extension = self.output_extension.currentText()
-            path_len = len(dir_path) + len(output_filename) + len(output_extension) + 2
-            
 
             n_x = int(self.n_x.text()) if self.n_x.text() else 0
             n_y = int(self.n_y.text()) if self.n_y.text() else 0
             n_z = int(self.n_z.text()) if self.n_z.text() else 0
-            n_str = f"{n_x}x{n_y}x{n_z}cells"
 
             size_x = float(self.size_x.text()) if self.size_x.text() else 0
             size_y = float(self.size_y.text()) if self.size_y.text() else 0
             size_z = float(self.size_z.text()) if self.size_z.text() else 0
-            size_str = f"{add_si_prefix(size_x, 'm')}x{add_si_prefix(size_y, 'm')}x{add_si_prefix(size_z, 'm')}"
 
-            path_len += len(n_str) + len(size_str) + 1
-            
             ant_dict_list = self.get_antenna_parameters()
-            antenna_str = ""
-            for i, ant_dict in enumerate(ant_dict_list):
-                antenna_str += f"_ant{i+1}_t{add_si_prefix(ant_dict['ant_width'], 'm')}_x{add_si_prefix(ant_dict['ant_position_x'], 'm')}_y{add_si_prefix(ant_dict['ant_position_y'], 'm')}_s2a{add_si_prefix(ant_dict['distance'], 'm')}_{add_si_prefix(ant_dict['current_direction'], 'deg')}_I{add_si_prefix(ant_dict['input_current'], 'A')}"
-                path_len += len(antenna_str)
-                if path_len > 240:
-                    antenna_str = f"_{len(ant_dict_list)}Antennas"
-                    break
-            self.append_filename.setText(f"{n_str}_{size_str}{antenna_str}")
+            self.append_filename.setText(get_append_filename(dir_path, output_filename, output_extension, n_x, n_y, n_z, size_x, size_y, size_z, ant_dict_list))
 
-        except ValueError:
+            if min(n_x, n_y, n_z) > 0 and min(size_x, size_y, size_z) > 0:
+                plan = planner.plan_run(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict_list, output_extension=output_extension, export_hdf5=self.export_hdf5.isChecked())
+                self.plan_label.setText(planner.format_plan(plan))
+            else:
+                self.plan_label.setText("")
+
+        except (ValueError, ZeroDivisionError):
             pass
     
+    def get_antenna_conditions(self, tab):
+        antenna_conditions = {
+            'ant_width': tab.findChild(QLineEdit, "ant_width").text(),
+            'ant_thickness': tab.findChild(QLineEdit, "ant_thickness").text(),
+            'ant_position_x': tab.findChild(QLineEdit, "ant_position_x").text(),
+            'ant_position_y': tab.findChild(QLineEdit, "ant_position_y").text(),
+            'distance': tab.findChild(QLineEdit, "distance").text(),
+            'current_direction': tab.findChild(QLineEdit, "current_direction").text(),
+            'input_current': tab.findChild(QLineEdit, "input_current").text(),
+            'input_voltage': tab.findChild(QLineEdit, "input_voltage").text(),
+            'input_power_dBm': tab.findChild(QLineEdit, "input_power_dBm").text(),
+            'input_power_W': tab.findChild(QLineEdit, "input_power_W").text(),
+            'impedance': tab.findChild(QLineEdit, "impedance").text(),
+            'waveform': tab.findChild(QComboBox, "waveform").currentText(),
+            'phase': tab.findChild(QLineEdit, "phase").text(),
+            'frequency': tab.findChild(QLineEdit, "frequency").text(),
+            'ant_type': tab.findChild(QComboBox, "ant_type").currentText(),
+            'gap': tab.findChild(QLineEdit, "gap").text(),
+            'ground_width': tab.findChild(QLineEdit, "ground_width").text(),
+            'ground_split': tab.findChild(QLineEdit, "ground_split").text()
+        }
+        return antenna_conditions
+
     def get_antenna_parameters(self):
         antenna_params = []
         for i in range(self.tab_widget.count()):
             tab = self.tab_widget.widget(i)
-            
-            ant_width = float(tab.findChild(QLineEdit, "ant_width").text())
-            ant_thickness = float(tab.findChild(QLineEdit, "ant_thickness").text())
-            ant_position_x = float(tab.findChild(QLineEdit, "ant_position_x").text())
-            ant_position_y = float(tab.findChild(QLineEdit, "ant_position_y").text())
-            distance = float(tab.findChild(QLineEdit, "distance").text())
-            current_direction = float(tab.findChild(QLineEdit, "current_direction").text())
-            
-            input_current = float(tab.findChild(QLineEdit, "input_current").text()) if tab.findChild(QLineEdit, "input_current").text() else 0
-            input_voltage = float(tab.findChild(QLineEdit, "input_voltage").text())
-            input_power_dBm = float(tab.findChild(QLineEdit, "input_power_dBm").text()) if tab.findChild(QLineEdit, "input_power_dBm").text() else 0
-            input_power_W = float(tab.findChild(QLineEdit, "input_power_W").text()) if tab.findChild(QLineEdit, "input_power_W").text() else 0
-            impedance = float(tab.findChild(QLineEdit, "impedance").text())
-            waveform = tab.findChild(QComboBox, "waveform").currentText()
-            
-            antenna_params.append({
-                "ant_width": ant_width,
-                "ant_thickness": ant_thickness,
-                "ant_position_x": ant_position_x,
-                "ant_position_y": ant_position_y,
-                "distance": distance,
-                "current_direction": current_direction,
-                "input_current": input_current,
-                "input_voltage": input_voltage,
-                "input_power_dBm": input_power_dBm,
-                "input_power_W": input_power_W,
-                "impedance": impedance,
-                "waveform": waveform
-            })
+            antenna_params.append(get_antenna_dict(self.get_antenna_conditions(tab)))
         
         return antenna_params               
     
@@ -802,6 +818,26 @@ class MainWindow(QWidget):
             dir_path = self.dir_str.text()
             output_filename = self.output_filename.text() + "_" + self.append_filename.text() + self.output_extension.currentText()
             output_path = os.path.join(dir_path, output_filename)
+
+            # engine and tile budget of the preflight plan
+            plan = planner.plan_run(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, output_extension=self.output_extension.currentText(), export_hdf5=self.export_hdf5.isChecked())
+            for note in plan['notes']:
+                print(note)
+            field_kwargs = dict(cf.ENGINE_PRESETS[plan['engine']], memory_budget=plan['tile_memory_budget'])
+
+            # skip if the existing output was generated from exactly these conditions
+            fingerprint = cf.get_condition_fingerprint(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, **cf.ENGINE_PRESETS[plan['engine']])
+            basis_fingerprint = cf.get_condition_fingerprint(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, antenna_keys=cf.BASIS_ANTENNA_KEYS, **cf.ENGINE_PRESETS[plan['engine']])
+            analysis_path = oo.get_analysis_filename(output_path) if self.export_hdf5.isChecked() else None
+            analysis_attrs = {'fingerprint': fingerprint, 'engine': plan['engine'], 'ant_dicts': ant_dict}
+            if not check and not self.force_recompute.isChecked():
+                if self.export_basis.isChecked():
+                    if oo.is_basis_up_to_date(output_path, basis_fingerprint):
+                        print(f"{oo.get_basis_text_filename(output_path)} is up to date (skipped)")
+                        total_steps = 0
+                elif oo.read_ovf_fingerprint(output_path) == fingerprint and (analysis_path is None or oo.read_hdf5_fingerprint(analysis_path) == fingerprint):
+                    print(f"{output_path} is up to date (skipped)")
+                    total_steps = 0
             
             for step in range(total_steps):
                 progress = int((step + 1) / total_steps * 90)
@@ -809,12 +845,20 @@ class MainWindow(QWidget):
                 QApplication.processEvents()
 
                 if check:
-                    result.append(cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, check, step)[0])
+                    result.append(cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, check, step, **field_kwargs)[0])
                     if step == total_steps - 1:
                         image_paths = result
+                elif self.export_basis.isChecked():
+                    if step == 0:
+                        expressions, coef_arr = cf.get_basis_terms(ant_dict)
+                    result.append(cf.get_raw_basis_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, coef_arr, step, **field_kwargs))
+                    if step == total_steps - 1:
+                        basis_list, basis_expressions = cf.reduce_basis_fields(result, expressions)
+                        for line in oo.write_basis_files(output_path, n_x, n_y, n_z, basis_list, basis_expressions, oo.get_fingerprint_desc(basis_fingerprint)):
+                            print(line)
                 else:
-                    B_pump_x_array, B_pump_y_array, B_pump_z_array = cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, current_step=step)
-                    oo.write_oommf_binary_file_step(step, output_path, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array)
+                    B_pump_x_array, B_pump_y_array, B_pump_z_array = cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict, current_step=step, **field_kwargs)
+                    oo.write_ovf_step(step, output_path, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array, oo.get_fingerprint_desc(fingerprint), analysis_path, (size_x, size_y, size_z), analysis_attrs)
 
             self.progress_bar.setValue(100)
             QApplication.processEvents()
@@ -838,26 +882,15 @@ class MainWindow(QWidget):
             'dir_str': self.dir_str.text(),
             'output_filename': self.output_filename.text(),
             'output_extension': self.output_extension.currentText(),
+            'export_basis': self.export_basis.isChecked(),
+            'export_hdf5': self.export_hdf5.isChecked(),
             'antennas': []
         }
         
         # Save conditions for each antenna tab
         for i in range(self.tab_widget.count()):
             tab = self.tab_widget.widget(i)
-            antenna_conditions = {
-                'ant_width': tab.findChild(QLineEdit, "ant_width").text(),
-                'ant_thickness': tab.findChild(QLineEdit, "ant_thickness").text(),
-                'ant_position_x': tab.findChild(QLineEdit, "ant_position_x").text(),
-                'ant_position_y': tab.findChild(QLineEdit, "ant_position_y").text(),
-                'distance': tab.findChild(QLineEdit, "distance").text(),
-                'current_direction': tab.findChild(QLineEdit, "current_direction").text(),
-                'input_current': tab.findChild(QLineEdit, "input_current").text(),
-                'input_voltage': tab.findChild(QLineEdit, "input_voltage").text(),
-                'input_power_dBm': tab.findChild(QLineEdit, "input_power_dBm").text(),
-                'input_power_W': tab.findChild(QLineEdit, "input_power_W").text(),
-                'impedance': tab.findChild(QLineEdit, "impedance").text(),
-                'waveform': tab.findChild(QComboBox, "waveform").currentText()
-            }
+            antenna_conditions = self.get_antenna_conditions(tab)
             conditions['antennas'].append(antenna_conditions)
         
         with open(os.path.join(self.dir_str.text(), 'cond_' + self.output_filename.text() + '_' + self.append_filename.text() + '.json'), 'w') as f:
@@ -883,6 +916,8 @@ class MainWindow(QWidget):
             self.dir_str.setText(conditions['dir_str'])
             self.output_filename.setText(conditions['output_filename'])
             self.output_extension.setCurrentText(conditions['output_extension'])
+            self.export_basis.setChecked(conditions.get('export_basis', False))
+            self.export_hdf5.setChecked(conditions.get('export_hdf5', False))
             
             # Remove existing antenna tabs
             while self.tab_widget.count() > 0:
@@ -905,6 +940,12 @@ class MainWindow(QWidget):
                 tab.findChild(QLineEdit, "input_power_W").setText(antenna_conditions['input_power_W'])
                 tab.findChild(QLineEdit, "impedance").setText(antenna_conditions['impedance'])
                 tab.findChild(QComboBox, "waveform").setCurrentText(antenna_conditions['waveform'])
+                tab.findChild(QLineEdit, "phase").setText(antenna_conditions.get('phase', "0"))
+                tab.findChild(QLineEdit, "frequency").setText(antenna_conditions.get('frequency', ""))
+                tab.findChild(QComboBox, "ant_type").setCurrentText(antenna_conditions.get('ant_type', "Strip"))
+                tab.findChild(QLineEdit, "gap").setText(antenna_conditions.get('gap', "5e-6"))
+                tab.findChild(QLineEdit, "ground_width").setText(antenna_conditions.get('ground_width', "10e-6"))
+                tab.findChild(QLineEdit, "ground_split").setText(antenna_conditions.get('ground_split', "0.5"))
             
             self.update_append_text()
 
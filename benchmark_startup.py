@@ -0,0 +1,105 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# modules that should not be loaded until a plot or a resampling is requested
+HEAVY_MODULES = ('matplotlib', 'mpl_toolkits', 'scipy')
+
+IMPORT_SCRIPT = """
+import sys, time
+t0 = time.perf_counter()
+import {module}
+t1 = time.perf_counter()
+heavy = sorted({{name.split('.')[0] for name in sys.modules}} & set({heavy}))
+print(t1 - t0)
+print(','.join(heavy))
+"""
+
+WINDOW_SCRIPT = """
+import sys, time, ctypes
+import Main
+from PyQt5.QtWidgets import QApplication
+if not hasattr(ctypes, 'windll'):
+    Main.get_windows_display_scale = lambda: 1.0
+app = QApplication(sys.argv)
+app.setWindowIcon(Main.gi.iconFromBase64())
+ex = Main.MainWindow()
+ex.show()
+app.processEvents()
+print(time.perf_counter())
+"""
+
+def get_benchmark_condition(dir_path: str):
+    # smallest useful condition file: one strip antenna over a single z-slice
+    antenna_conditions = {
+        'ant_width': "1e-6", 'ant_thickness': "1e-7", 'ant_position_x': "0", 'ant_position_y': "0",
+        'distance': "1e-7", 'current_direction': "0", 'input_current': "0.01", 'input_voltage': "0.5",
+        'input_power_dBm': "", 'input_power_W': "", 'impedance': "50", 'waveform': "sin",
+        'phase': "0", 'frequency': ""
+    }
+    conditions = {
+        'n_x': "64", 'n_y': "64", 'n_z': "1",
+        'size_x': "2e-6", 'size_y': "2e-6", 'size_z': "1e-8",
+        'dir_str': dir_path, 'output_filename': "benchmark", 'output_extension': ".ovf",
+        'export_basis': False, 'antennas': [antenna_conditions]
+    }
+    condition_filename = os.path.join(dir_path, "cond_benchmark.json")
+    with open(condition_filename, 'w') as f:
+        json.dump(conditions, f)
+    return condition_filename
+
+def run_python(args, env=None):
+    return subprocess.run([sys.executable] + args, cwd=HERE, env=env, capture_output=True, text=True, check=True)
+
+def time_import(module: str):
+    # import time of one module in a fresh interpreter, and the heavy modules it drags in
+    result = run_python(['-c', IMPORT_SCRIPT.format(module=module, heavy=HEAVY_MODULES)])
+    lines = result.stdout.splitlines()
+    heavy = [name for name in lines[1].split(',') if name] if len(lines) > 1 else []
+    return float(lines[0]), heavy
+
+def time_to_window():
+    # from process start to the first processed event loop iteration of the shown main window
+    env = dict(os.environ)
+    env.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    t0 = time.perf_counter()
+    result = run_python(['-c', WINDOW_SCRIPT], env)
+    # perf_counter is system-wide on Linux and Windows, so the child's value is comparable
+    t_window = float(result.stdout.splitlines()[-1])
+    return t_window - t0
+
+def time_to_first_ovf():
+    # wall time of a headless run that writes one small OVF from a condition file
+    with tempfile.TemporaryDirectory() as dir_path:
+        condition_filename = get_benchmark_condition(dir_path)
+        t0 = time.perf_counter()
+        run_python(['headless.py', 'run', condition_filename, '--force'])
+        return time.perf_counter() - t0
+
+def run_benchmark(repeat=3, window=True):
+    results = {}
+    for module in ('calc_field', 'headless', 'Main'):
+        timings = [time_import(module) for _ in range(repeat)]
+        results[f'import {module}'] = min(t for t, _ in timings)
+        print(f"import {module}: {results[f'import {module}'] * 1e3:.0f} ms (heavy modules loaded: {', '.join(timings[0][1]) or 'none'})")
+
+    results['first ovf'] = min(time_to_first_ovf() for _ in range(repeat))
+    print(f"time to first OVF (headless): {results['first ovf'] * 1e3:.0f} ms")
+
+    if window:
+        results['window'] = min(time_to_window() for _ in range(repeat))
+        print(f"time to window: {results['window'] * 1e3:.0f} ms")
+    return results
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Startup benchmark of the GUI and the headless entry point.")
+    parser.add_argument('--repeat', type=int, default=3, help="runs per measurement (the minimum is reported)")
+    parser.add_argument('--no-window', action='store_true', help="skip the GUI measurement (no Qt platform available)")
+    args = parser.parse_args()
+    run_benchmark(args.repeat, not args.no_window)
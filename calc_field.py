@@ -1,13 +1,40 @@
 import os
 import csv
+import json
+import hashlib
 import numpy as np
-import matplotlib.pyplot as plt
-from mpl_toolkits.axes_grid1 import Divider, Size
-from mpl_toolkits.axes_grid1.mpl_axes import Axes
-from matplotlib.colors import LinearSegmentedColormap
-import tempfile
-from scipy.ndimage import affine_transform
-from scipy.interpolate import RegularGridInterpolator
+# matplotlib, mpl_toolkits and scipy are imported inside the functions that need them,
+# so that the GUI window and headless batch runs start without loading them
+
+# |B| below this value [T] is treated as zero
+FIELD_ZERO_THRESHOLD = 1e-15
+# relative field level at which the wide computation domain is truncated
+FIELD_DECAY_TOL = 1e-4
+# segment engine: most (segment, cell) pairs evaluated at once
+SEGMENT_MAX_BATCH = 2**20
+# rotate engine: most (conductor, cell) pairs of a parallel antenna group evaluated at once
+CONDUCTOR_MAX_BATCH = 2**20
+# direct and segment engines: memory budget [bytes] of the x-y tiles a slice is evaluated in
+TILE_MEMORY_BUDGET = 2**25
+# peak kernel temporaries per cell [bytes] (cell-averaged cpw, segment engine)
+TILE_BYTES_PER_CELL = 256
+# LUT engine: interpolation error of the tables relative to the peak |B| at each height
+LUT_TOL = 1e-5
+# LUT engine: refinement of a table stops at this many (offset, height) points
+LUT_MAX_POINTS = 2**22
+# LUT engine: tables are stored here and reused by later runs (None: memory only)
+LUT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'antenna_field_lut')
+# named engine configurations (keyword arguments of get_magnetic_field) for batch runs and the oracle
+ENGINE_PRESETS = {
+    'rotate': {},
+    'direct': {'engine': 'direct'},
+    'direct_tiers': {'engine': 'direct', 'band_tol': 1e-4, 'band_far_field': 'line', 'far_field_tol': 1e-5},
+    'cell_average': {'engine': 'direct', 'sampling': 'cell_average'},
+    'segment': {'engine': 'segment'},
+    'lut': {'engine': 'lut'}
+}
+# bump whenever a change alters the written field, so that fingerprinted outputs are regenerated
+ENGINE_VERSION = "4"
 
 def calc_magnetic_field(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: float, input_current: float, in_or_out_of_plane: bool):
 
@@ -22,11 +49,106 @@ def calc_magnetic_field(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: f
     
     return B_pump
 
+def xlog1p_ratio(x, num, den):
+    # x * log(1 + num / den) with the limit 0 at x == 0, also where den == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        value = x * np.log1p(num / den)
+    return np.where(x == 0, 0., value)
+
+def calc_magnetic_field_stable(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: float, input_current: float, in_or_out_of_plane: bool):
+    # Same field as calc_magnetic_field, finite everywhere including conductor edges and faces.
+    # log(a / b) -> log1p((a - b) / b) and v * (atan(u1 / v) - atan(u2 / v)) -> |v| * atan2((u1 - u2) * |v|, v^2 + u1 * u2)
+
+    ant_half_width = ant_width / 2
+    ant_half_thickness = ant_thickness / 2
+
+    u_p = xy_plane_arr + ant_half_width
+    u_m = xy_plane_arr - ant_half_width
+    v_p = z_mesh + ant_half_thickness + np.zeros_like(u_p)
+    v_m = z_mesh - ant_half_thickness + np.zeros_like(u_p)
+
+    # in_or_out_of_plane is True -> in-plane field. Else out-of-plane field.
+    if in_or_out_of_plane:
+        log_num = 4 * z_mesh * ant_half_thickness
+        B_pump = xlog1p_ratio(u_p / 2, log_num, u_p**2 + v_m**2) - xlog1p_ratio(u_m / 2, log_num, u_m**2 + v_m**2) + np.abs(v_p) * np.arctan2(2 * ant_half_width * np.abs(v_p), v_p**2 + u_p * u_m) - np.abs(v_m) * np.arctan2(2 * ant_half_width * np.abs(v_m), v_m**2 + u_p * u_m)
+    else:
+        log_num = 4 * xy_plane_arr * ant_half_width
+        B_pump = xlog1p_ratio(v_p / 2, log_num, v_p**2 + u_m**2) - xlog1p_ratio(v_m / 2, log_num, v_m**2 + u_m**2) + np.abs(u_p) * np.arctan2(2 * ant_half_thickness * np.abs(u_p), u_p**2 + v_p * v_m) - np.abs(u_m) * np.arctan2(2 * ant_half_thickness * np.abs(u_m), u_m**2 + v_p * v_m)
+
+    return 4*np.pi*1e-7 * input_current/(8*np.pi*ant_half_width*ant_half_thickness) * B_pump
+
+def calc_strip_corner_sum(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: float, order: int):
+    # Sum over the conductor corners c of +-Phi_order(zeta - c), zeta = xy + i z, where Phi_0(w) = w log(w) and
+    # Phi_n is its n-th antiderivative w^(n+1) / (n+1)! * (log(w) - (H_(n+1) - 1)).
+    # mu0 I / (2 pi W T) * (sum for order 0) = B_in + i B_out for points below the conductor.
+    ant_half_width = ant_width / 2
+    ant_half_thickness = ant_thickness / 2
+    factorial = np.prod(np.arange(1, order + 2))
+    harmonic = sum(1 / k for k in range(2, order + 2))
+
+    corner_sum = np.zeros(np.broadcast(xy_plane_arr, z_mesh).shape, dtype=complex)
+    for sign_u, u in ((1, ant_half_width), (-1, -ant_half_width)):
+        for sign_v, v in ((1, ant_half_thickness), (-1, -ant_half_thickness)):
+            # points lie on or below the conductor (Im w >= 0), which keeps the principal log continuous
+            w = (xy_plane_arr - u) + 1j * np.maximum(z_mesh - v, 0.)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                phi = np.where(w == 0, 0., w**(order + 1) / factorial * (np.log(w) - harmonic))
+            corner_sum += sign_u * sign_v * phi
+    return corner_sum
+
+def calc_magnetic_field_cell_average(xy_plane_arr, z_value: float, cell_widths, cell_length_z: float, ant_width: float, ant_thickness: float, input_current: float):
+    # Field averaged over cells instead of sampled at their centers.
+    # Over a cell the offset xy varies as the sum of two uniform offsets of widths cell_widths
+    # (|cos| * cell size y and |sin| * cell size x) and the depth as one of width cell_length_z.
+    # Near the conductor: exact nested box averages of the corner antiderivatives.
+    # Elsewhere: midpoint plus the second-order term (W1^2 + W2^2 - Lz^2) / 24 * F''(zeta), F'' = sum +-1 / (zeta - c),
+    # with relative error below ~1e-6 since the cell is smaller than 1/8 of the distance to the conductor.
+    ant_half_width = ant_width / 2
+    ant_half_thickness = ant_thickness / 2
+    coef = 4*np.pi*1e-7 * input_current / (2*np.pi*ant_width*ant_thickness)
+
+    xy_plane_arr = np.asarray(xy_plane_arr, dtype=float)
+    cell_extent = max(sum(cell_widths), cell_length_z)
+    conductor_distance = np.hypot(np.maximum(np.abs(xy_plane_arr) - ant_half_width, 0.), max(z_value - ant_half_thickness, 0.))
+    near = conductor_distance < 8 * cell_extent
+
+    B_pump = np.zeros(xy_plane_arr.shape, dtype=complex)
+
+    far = ~near
+    if np.any(far):
+        xy_far = xy_plane_arr[far]
+        B_pump[far] = calc_magnetic_field_stable(xy_far, z_value, ant_width, ant_thickness, input_current, True) + 1j * calc_magnetic_field_stable(xy_far, z_value, ant_width, ant_thickness, input_current, False)
+
+        inverse_sum = np.zeros(xy_far.shape, dtype=complex)
+        for sign_u, u in ((1, ant_half_width), (-1, -ant_half_width)):
+            for sign_v, v in ((1, ant_half_thickness), (-1, -ant_half_thickness)):
+                inverse_sum += sign_u * sign_v / ((xy_far - u) + 1j * (z_value - v))
+        B_pump[far] += coef * (cell_widths[0]**2 + cell_widths[1]**2 - cell_length_z**2) / 24 * inverse_sum
+
+    if np.any(near):
+        # one antiderivative per averaged direction; d/d(zeta) along z is i d/dz.
+        # Widths below 1e-4 of the cell (e.g. |cos| * size at 90 deg) are dropped: error < 1e-9, no cancellation.
+        steps = [width for width in cell_widths if width > 1e-4 * cell_extent] + ([1j * cell_length_z] if cell_length_z > 1e-4 * cell_extent else [])
+        zeta_offsets = [(0., 1.)]
+        for step in steps:
+            zeta_offsets = [(offset + sign * step / 2, weight * sign / step) for offset, weight in zeta_offsets for sign in (1, -1)]
+
+        xy_near = xy_plane_arr[near]
+        corner_sum = np.zeros(xy_near.shape, dtype=complex)
+        for offset, weight in zeta_offsets:
+            corner_sum += weight * calc_strip_corner_sum(xy_near + offset.real, z_value + offset.imag, ant_width, ant_thickness, len(steps))
+        B_pump[near] = coef * corner_sum
+
+    return B_pump.real, B_pump.imag
+
 def get_nearest_index(list, num):
     idx = np.abs(np.asarray(list) - num).argmin()
     return idx
 
-def rotate_around_point(arr, angle, center, sclice_len=None):    
+def rotate_around_point(arr, angle, center, sclice_len=None, aspect=1.):    
+    # aspect: column spacing / row spacing of the grid, so that the rotation is by angle in physical units
+    from scipy.ndimage import affine_transform
+
     # degrees to radians
     angle_rad = np.deg2rad(angle)
     
@@ -34,8 +156,8 @@ def rotate_around_point(arr, angle, center, sclice_len=None):
     sin_val = np.sin(angle_rad)
     
     transform_matrix = np.array([
-        [cos_val, -sin_val],
-        [sin_val, cos_val]
+        [cos_val, -sin_val * aspect],
+        [sin_val / aspect, cos_val]
     ])
     
     offset = np.array(center) - np.dot(transform_matrix, center)
@@ -73,16 +195,537 @@ def resize_2d_array_interpolate(arr, new_x, new_y):
     new_x_vals = np.linspace(0, original_x - 1, new_x)
     new_y_vals = np.linspace(0, original_y - 1, new_y)
     
+    return resample_2d_array_interpolate(arr, x, y, new_x_vals, new_y_vals)
+
+def resample_2d_array_interpolate(arr, x, y, new_x_vals, new_y_vals):
+    # bilinear interpolation from the grid (x, y) onto (new_x_vals, new_y_vals);
+    # points beyond the outermost grid points take the edge value
+    from scipy.interpolate import RegularGridInterpolator
+
     interp_func = RegularGridInterpolator((x, y), arr)
     
-    new_grid_x, new_grid_y = np.meshgrid(new_x_vals, new_y_vals, indexing='ij')
+    new_grid_x, new_grid_y = np.meshgrid(np.clip(new_x_vals, x[0], x[-1]), np.clip(new_y_vals, y[0], y[-1]), indexing='ij')
     new_points = np.array([new_grid_x.ravel(), new_grid_y.ravel()]).T
     
-    new_arr = interp_func(new_points).reshape(new_x, new_y)
+    new_arr = interp_func(new_points).reshape(len(new_x_vals), len(new_y_vals))
     
     return new_arr
 
-def get_magnetic_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, size_z: int, ant_dicts, check=False, current_step=None):
+def sample_wide_map(arr, y_pos, x_pos):
+    # padded map at fractional (row, column) indices; points on the lattice are taken as they are
+    y_idx, x_idx = np.rint(y_pos), np.rint(x_pos)
+    if np.allclose(y_pos, y_idx, rtol=0., atol=1e-9) and np.allclose(x_pos, x_idx, rtol=0., atol=1e-9):
+        return arr[np.ix_(y_idx.astype(np.intp), x_idx.astype(np.intp))]
+    return resample_2d_array_interpolate(arr, np.arange(arr.shape[0]), np.arange(arr.shape[1]), y_pos, x_pos)
+
+def get_cell_centers(n: int, size: float):
+    size_cell = size / n
+    return np.linspace(size_cell / 2, size - size_cell / 2, n)
+
+def get_slice_interpolation_weights(z_arr, new_z_arr):
+    # for each new z: the two bracketing slices of z_arr and the weight of the upper one
+    if len(z_arr) == 1:
+        return [(0, 0, 0.)] * len(new_z_arr)
+
+    new_z_arr = np.clip(new_z_arr, z_arr[0], z_arr[-1])
+    z_upper = np.clip(np.searchsorted(z_arr, new_z_arr, side='right'), 1, len(z_arr) - 1)
+    z_lower = z_upper - 1
+    weight = (new_z_arr - z_arr[z_lower]) / (z_arr[z_upper] - z_arr[z_lower])
+    return list(zip(z_lower.tolist(), z_upper.tolist(), weight.tolist()))
+
+def get_array_stats(arr):
+    arr = np.asarray(arr)
+    arr_min = float(np.min(arr))
+    arr_max = float(np.max(arr))
+
+    stats = {
+        'min': arr_min,
+        'max': arr_max,
+        'abs_max': max(abs(arr_min), abs(arr_max))
+    }
+
+    return stats
+
+def get_field_stats(B_pump_x, B_pump_y, B_pump_z):
+    # min / max / abs-max of each component and max of |B| of one slice
+    field_stats = {
+        'B_pump_x': get_array_stats(B_pump_x),
+        'B_pump_y': get_array_stats(B_pump_y),
+        'B_pump_z': get_array_stats(B_pump_z),
+        'norm_max': float(np.sqrt(np.max(B_pump_x ** 2 + B_pump_y ** 2 + B_pump_z ** 2)))
+    }
+
+    return field_stats
+
+def scale_stats(stats, exp):
+    return {key: value / (10**exp) for key, value in stats.items()}
+
+def get_decay_distance(ant_width: float, ant_thickness: float, z_value: float, decay_tol: float):
+    # distance from the antenna axis beyond which |B| < decay_tol * max|B|.
+    # The tail of the strip field follows the line-current field mu0*I/(2*pi*r).
+    B_peak = abs(calc_magnetic_field_stable(np.zeros(1), z_value, ant_width, ant_thickness, 1., True)[0])
+    r_decay = 4*np.pi*1e-7 / (2*np.pi * decay_tol * B_peak)
+
+    return ant_width / 2 + np.sqrt(max(r_decay**2 - z_value**2, 0.))
+
+def get_lattice_spacing(size_cell_axis: float, size_cell: float) -> float:
+    # spacing of the padded map on one axis: the cell size of that axis divided into steps of at most size_cell
+    return size_cell_axis / max(1, int(np.ceil(size_cell_axis / size_cell - 1e-9)))
+
+def get_wide_domain(x_arr, y_arr, size_cell_x: float, size_cell_y: float, size_cell: float, ant_position_x: float, ant_position_y: float, current_direction: float, decay_distance: float):
+    # cell centers of the sample sampled from the rotated map in get_magnetic_field
+    sample_x = np.array([x_arr[0], x_arr[-1]])
+    sample_y = np.array([y_arr[0], y_arr[-1]])
+
+    # sample corners mapped into the antenna frame by rotate_around_point
+    cos_val = np.cos(np.deg2rad(current_direction))
+    sin_val = np.sin(np.deg2rad(current_direction))
+    corner_x, corner_y = np.meshgrid(sample_x - ant_position_x, sample_y - ant_position_y)
+    source_x = ant_position_x + sin_val * corner_y + cos_val * corner_x
+    source_y = ant_position_y + cos_val * corner_y - sin_val * corner_x
+
+    # field is negligible farther than decay_distance from the antenna axis
+    source_y_min = max(source_y.min(), ant_position_y - decay_distance)
+    source_y_max = min(source_y.max(), ant_position_y + decay_distance)
+
+    x_min = min(sample_x[0], source_x.min(), ant_position_x)
+    x_max = max(sample_x[1], source_x.max(), ant_position_x)
+    y_min = min(sample_y[0], source_y_min, ant_position_y)
+    y_max = max(sample_y[1], source_y_max, ant_position_y)
+
+    # lattice through the cell centers of the sample on each axis separately, so the sample is read
+    # on lattice points also when the cells are not square
+    spacing_x = get_lattice_spacing(size_cell_x, size_cell)
+    spacing_y = get_lattice_spacing(size_cell_y, size_cell)
+    wide_x_arr = x_arr[0] + spacing_x * np.arange(np.floor((x_min - x_arr[0]) / spacing_x) - 1, np.ceil((x_max - x_arr[0]) / spacing_x) + 2)
+    wide_y_arr = y_arr[0] + spacing_y * np.arange(np.floor((y_min - y_arr[0]) / spacing_y) - 1, np.ceil((y_max - y_arr[0]) / spacing_y) + 2)
+
+    return wide_x_arr, wide_y_arr
+
+def get_band_distance(ant_width: float, ant_thickness: float, z_value: float, band_tol: float, band_far_field='zero'):
+    if band_far_field == 'line':
+        # |sum_n (zeta'/zeta)^(2n)| <= q / (1 - q), q = (rho / r)^2, bounds the relative error of the line current
+        rho = np.sqrt(ant_width**2 + ant_thickness**2) / 2
+        r_band = rho / np.sqrt(band_tol / (1 + band_tol))
+        return np.sqrt(max(r_band**2 - z_value**2, 0.))
+
+    return get_decay_distance(ant_width, ant_thickness, z_value, band_tol)
+
+def calc_line_current_field(xy_plane_arr, z_mesh, input_current: float, in_or_out_of_plane: bool):
+    # field of a thin wire carrying input_current at the antenna axis
+    if in_or_out_of_plane:
+        return 4*np.pi*1e-7 * input_current/(2*np.pi) * z_mesh / (xy_plane_arr**2 + z_mesh**2)
+    return 4*np.pi*1e-7 * input_current/(2*np.pi) * xy_plane_arr / (xy_plane_arr**2 + z_mesh**2)
+
+def calc_multipole_field(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: float, input_current: float, in_or_out_of_plane: bool):
+    # thin-wire field with the quadrupole correction of the rectangular cross section.
+    # B_in + i*B_out = mu0*I/(2*pi) * i * <1/(zeta - zeta')>, zeta = xy + i*z, <zeta'^2> = (w^2 - t^2)/12
+    zeta = xy_plane_arr + 1j * z_mesh
+    B_pump = 4*np.pi*1e-7 * input_current/(2*np.pi) * 1j * (1 / zeta + (ant_width**2 - ant_thickness**2) / 12 / zeta**3)
+
+    if in_or_out_of_plane:
+        return B_pump.real
+    return B_pump.imag
+
+def get_far_field_distance(ant_width: float, ant_thickness: float, z_value: float, far_field_tol: float):
+    # the remainder of calc_multipole_field is bounded by q^2 / (1 - q), q = (rho / r)^2
+    rho = np.sqrt(ant_width**2 + ant_thickness**2) / 2
+    q = (np.sqrt(far_field_tol**2 + 4 * far_field_tol) - far_field_tol) / 2
+    r_far = rho / np.sqrt(q)
+
+    return np.sqrt(max(r_far**2 - z_value**2, 0.))
+
+def get_antenna_conductors(ant_dict):
+    # (offset across the antenna axis, width, current) of each conductor of an antenna.
+    # ant_type 'cpw': ground-signal-ground with the signal width ant_width; the grounds return the current,
+    # ground_split of it in the ground on the positive-offset side.
+    # ant_type 'group': parallel antennas merged by get_parallel_groups, conductors listed in ant_dict['conductors'].
+    if ant_dict.get('ant_type') == 'group':
+        return ant_dict['conductors']
+    if ant_dict.get('ant_type') == 'cpw':
+        input_current = ant_dict['input_current']
+        ground_width = ant_dict['ground_width']
+        ground_offset = ant_dict['ant_width'] / 2 + ant_dict['gap'] + ground_width / 2
+        ground_split = ant_dict.get('ground_split', 0.5)
+        return [(0., ant_dict['ant_width'], input_current), (ground_offset, ground_width, -input_current * ground_split), (-ground_offset, ground_width, -input_current * (1 - ground_split))]
+    return [(0., ant_dict['ant_width'], ant_dict['input_current'])]
+
+def get_antenna_extent(ant_dict):
+    # total width of all conductors, centered on the antenna axis
+    return max(2 * abs(offset) + width for offset, width, _ in get_antenna_conductors(ant_dict))
+
+def get_conductor_dicts(ant_dict):
+    # each conductor of an antenna as a strip antenna of its own
+    angle_rad = np.deg2rad(ant_dict['current_direction'])
+    return [dict(ant_dict, ant_type='strip', ant_width=width, input_current=current, ant_position_x=ant_dict['ant_position_x'] - offset * np.sin(angle_rad), ant_position_y=ant_dict['ant_position_y'] + offset * np.cos(angle_rad)) for offset, width, current in get_antenna_conductors(ant_dict)]
+
+def get_antenna_arrays(ant_dicts):
+    # structure of arrays over antennas: one float64 array per parameter of the straight antennas (strip, cpw)
+    keys = ('ant_width', 'ant_thickness', 'ant_position_x', 'ant_position_y', 'distance', 'current_direction', 'input_current')
+    return {key: np.array([ant_dict[key] for ant_dict in ant_dicts], dtype=np.float64) for key in keys}
+
+def get_parallel_groups(ant_dicts):
+    # Straight antennas with the same direction, thickness and distance differ only by their offset across the
+    # common axis, so the rotate engine evaluates each such group as the conductors of one antenna ('group'):
+    # one padded map and one rotation per group instead of per antenna. Groups keep the order of first appearance;
+    # an antenna without parallel partners is returned unchanged.
+    if len(ant_dicts) == 0:
+        return []
+    antenna_arrays = get_antenna_arrays(ant_dicts)
+    group_keys = np.stack((antenna_arrays['current_direction'], antenna_arrays['ant_thickness'], antenna_arrays['distance']), axis=1)
+    _, first_index, group_index = np.unique(group_keys, axis=0, return_index=True, return_inverse=True)
+    group_index = group_index.ravel()
+
+    groups = []
+    for group in np.argsort(first_index):
+        members = np.flatnonzero(group_index == group)
+        reference = ant_dicts[members[0]]
+        if len(members) == 1:
+            groups.append(reference)
+            continue
+
+        # offset of each member's axis from the axis of the first member
+        angle_rad = np.deg2rad(reference['current_direction'])
+        axis_offsets = (antenna_arrays['ant_position_y'][members] - reference['ant_position_y']) * np.cos(angle_rad) - (antenna_arrays['ant_position_x'][members] - reference['ant_position_x']) * np.sin(angle_rad)
+        conductors = [(axis_offset + offset, width, current) for member, axis_offset in zip(members, axis_offsets) for offset, width, current in get_antenna_conductors(ant_dicts[member])]
+        groups.append(dict(reference, ant_type='group', conductors=conductors))
+    return groups
+
+def calc_conductors_field(xy_plane_arr, z_mesh, conductors, ant_thickness: float, in_or_out_of_plane: bool, max_batch=CONDUCTOR_MAX_BATCH):
+    # field of parallel conductors sharing one offset array, broadcast over a conductor axis
+    # in batches of at most max_batch (conductor x cell) pairs and summed
+    offsets, widths, currents = (np.array(values, dtype=np.float64) for values in zip(*conductors))
+    conductor_axis = (slice(None),) + (np.newaxis,) * np.ndim(xy_plane_arr)
+    batch_size = max(1, max_batch // max(np.size(xy_plane_arr), 1))
+
+    B_pump = 0.
+    for begin in range(0, len(offsets), batch_size):
+        batch = slice(begin, begin + batch_size)
+        B_pump = B_pump + np.sum(calc_magnetic_field_stable(xy_plane_arr - offsets[batch][conductor_axis], z_mesh, widths[batch][conductor_axis], ant_thickness, currents[batch][conductor_axis], in_or_out_of_plane), axis=0)
+    return B_pump
+
+def calc_antenna_field_direct(x_mesh, y_mesh, z_value: float, ant_dict, band_tol=None, band_far_field='zero', far_field_tol=None, report=None, cell_size=None):
+    angle_rad = np.deg2rad(ant_dict['current_direction'])
+
+    # signed distance of each cell center from the antenna axis, shared by all conductors
+    xy_plane_arr = (y_mesh - ant_dict['ant_position_y']) * np.cos(angle_rad) - (x_mesh - ant_dict['ant_position_x']) * np.sin(angle_rad)
+
+    # cell (size_cell_x, size_cell_y, size_cell_z) seen across the antenna axis
+    cell_widths = None if cell_size is None else (cell_size[1] * abs(np.cos(angle_rad)), cell_size[0] * abs(np.sin(angle_rad)), cell_size[2])
+
+    B_pump_in = 0.
+    B_pump_out = 0.
+    error_bound = 0.
+    for offset, ant_width, input_current in get_antenna_conductors(ant_dict):
+        conductor_report = None if report is None else {}
+        B_in, B_out = calc_strip_field_direct(xy_plane_arr - offset, z_value, ant_width, ant_dict['ant_thickness'], input_current, band_tol, band_far_field, far_field_tol, conductor_report, cell_widths)
+        B_pump_in = B_pump_in + B_in
+        B_pump_out = B_pump_out + B_out
+
+        # cell counts add up per conductor, the error bounds of the conductors of one antenna add up
+        if report is not None:
+            for key in ('evaluated_cells', 'far_field_cells', 'total_cells'):
+                report[key] = report.get(key, 0) + conductor_report[key]
+            error_bound += conductor_report['error_bound']
+
+    if report is not None:
+        report['error_bound'] = max(report.get('error_bound', 0.), error_bound)
+
+    B_pump_x = B_pump_in * np.sin(angle_rad * (-1))
+    B_pump_y = B_pump_in * np.cos(angle_rad)
+    B_pump_z = B_pump_out
+
+    return B_pump_x, B_pump_y, B_pump_z
+
+def calc_strip_field_direct(xy_plane_arr, z_value: float, ant_width: float, ant_thickness: float, input_current: float, band_tol=None, band_far_field='zero', far_field_tol=None, report=None, cell_widths=None):
+    # in-plane and out-of-plane field of one strip, with the band and far-field tiers (report counts per conductor)
+    if cell_widths is None:
+        def calc_exact_field(xy_arr):
+            return calc_magnetic_field_stable(xy_arr, z_value, ant_width, ant_thickness, input_current, True), calc_magnetic_field_stable(xy_arr, z_value, ant_width, ant_thickness, input_current, False)
+    else:
+        def calc_exact_field(xy_arr):
+            return calc_magnetic_field_cell_average(xy_arr, z_value, cell_widths[:2], cell_widths[2], ant_width, ant_thickness, input_current)
+
+    if band_tol is None and far_field_tol is None:
+        B_pump_in, B_pump_out = calc_exact_field(xy_plane_arr)
+        error_bound = 0.
+        exact = np.ones(xy_plane_arr.shape, dtype=bool)
+        far = np.zeros(xy_plane_arr.shape, dtype=bool)
+    else:
+        B_pump_in = np.zeros_like(xy_plane_arr)
+        B_pump_out = np.zeros_like(xy_plane_arr)
+        error_bound = 0.
+
+        if band_tol is None:
+            band = np.ones(xy_plane_arr.shape, dtype=bool)
+        else:
+            band_distance = get_band_distance(ant_width, ant_thickness, z_value, band_tol, band_far_field)
+            band = np.abs(xy_plane_arr) <= band_distance
+
+            # the field decreases monotonically outside the band, so its edge bounds the error
+            edge = np.array([band_distance])
+            B_line_edge = np.hypot(calc_line_current_field(edge, z_value, input_current, True), calc_line_current_field(edge, z_value, input_current, False))[0]
+            if band_far_field == 'line':
+                outside = ~band
+                B_pump_in[outside] = calc_line_current_field(xy_plane_arr[outside], z_value, input_current, True)
+                B_pump_out[outside] = calc_line_current_field(xy_plane_arr[outside], z_value, input_current, False)
+                error_bound = band_tol * B_line_edge
+            else:
+                B_edge = np.hypot(calc_magnetic_field_stable(edge, z_value, ant_width, ant_thickness, input_current, True), calc_magnetic_field_stable(edge, z_value, ant_width, ant_thickness, input_current, False))[0]
+                error_bound = max(B_edge, B_line_edge)
+
+        if far_field_tol is None:
+            far = np.zeros(xy_plane_arr.shape, dtype=bool)
+        else:
+            # accuracy tier: multipole expansion beyond far_distance, exact closed form inside
+            far_distance = get_far_field_distance(ant_width, ant_thickness, z_value, far_field_tol)
+            far = band & (np.abs(xy_plane_arr) > far_distance)
+            B_pump_in[far] = calc_multipole_field(xy_plane_arr[far], z_value, ant_width, ant_thickness, input_current, True)
+            B_pump_out[far] = calc_multipole_field(xy_plane_arr[far], z_value, ant_width, ant_thickness, input_current, False)
+
+            edge = np.array([far_distance])
+            B_line_edge = np.hypot(calc_line_current_field(edge, z_value, input_current, True), calc_line_current_field(edge, z_value, input_current, False))[0]
+            error_bound = max(error_bound, far_field_tol * B_line_edge)
+
+        exact = band & ~far
+        B_pump_in[exact], B_pump_out[exact] = calc_exact_field(xy_plane_arr[exact])
+
+    if report is not None:
+        report['evaluated_cells'] = report.get('evaluated_cells', 0) + int(np.count_nonzero(exact))
+        report['far_field_cells'] = report.get('far_field_cells', 0) + int(np.count_nonzero(far))
+        report['total_cells'] = report.get('total_cells', 0) + exact.size
+        report['error_bound'] = max(report.get('error_bound', 0.), float(error_bound))
+
+    return B_pump_in, B_pump_out
+
+def calc_strip_unit_field(xy_plane_arr, z_mesh, ant_width: float, ant_thickness: float):
+    # (in-plane, out-of-plane) field of a strip carrying 1 A
+    return np.array([calc_magnetic_field_stable(xy_plane_arr, z_mesh, ant_width, ant_thickness, 1., True), calc_magnetic_field_stable(xy_plane_arr, z_mesh, ant_width, ant_thickness, 1., False)])
+
+def build_strip_lut(ant_width: float, ant_thickness: float, z_min: float, z_max: float, lut_tol=LUT_TOL, max_points=LUT_MAX_POINTS):
+    # Table of the 1 A strip field over offsets 0 <= d <= d_max and heights z_min <= z <= z_max.
+    # The in-plane field is even and the out-of-plane field odd in d, so only d >= 0 is stored.
+    # Beyond d_max the multipole expansion is accurate to lut_tol. Both axes are refined (tensor grid)
+    # where the midpoint of an interval differs from the linear interpolation of its ends by more than
+    # lut_tol / 2 of the peak |B| at that height, so bilinear lookup stays within ~lut_tol.
+    d_max = get_far_field_distance(ant_width, ant_thickness, z_min, lut_tol)
+    d_arr = np.union1d(np.linspace(0, d_max, 65), [min(ant_width / 2, d_max)])
+    z_arr = np.linspace(z_min, z_max, 5) if z_max > z_min else np.array([z_min])
+
+    while True:
+        table = calc_strip_unit_field(d_arr[np.newaxis, :], z_arr[:, np.newaxis], ant_width, ant_thickness)
+        scale = np.max(np.hypot(table[0], table[1]), axis=1)
+
+        d_mid = (d_arr[:-1] + d_arr[1:]) / 2
+        table_d_mid = calc_strip_unit_field(d_mid[np.newaxis, :], z_arr[:, np.newaxis], ant_width, ant_thickness)
+        error_d = np.max(np.max(np.abs(table_d_mid - (table[:, :, :-1] + table[:, :, 1:]) / 2), axis=0) / scale[:, np.newaxis], axis=0)
+        refine_d = error_d > lut_tol / 2
+        error = float(np.max(error_d))
+
+        refine_z = np.zeros(len(z_arr) - 1, dtype=bool)
+        if len(z_arr) > 1:
+            z_mid = (z_arr[:-1] + z_arr[1:]) / 2
+            table_z_mid = calc_strip_unit_field(d_arr[np.newaxis, :], z_mid[:, np.newaxis], ant_width, ant_thickness)
+            error_z = np.max(np.max(np.abs(table_z_mid - (table[:, :-1] + table[:, 1:]) / 2), axis=0) / np.minimum(scale[:-1], scale[1:])[:, np.newaxis], axis=1)
+            refine_z = error_z > lut_tol / 2
+            error += float(np.max(error_z))
+
+        n_points = (len(d_arr) + np.count_nonzero(refine_d)) * (len(z_arr) + np.count_nonzero(refine_z))
+        if not (np.any(refine_d) or np.any(refine_z)) or n_points > max_points:
+            break
+        d_arr = np.sort(np.concatenate((d_arr, d_mid[refine_d])))
+        if np.any(refine_z):
+            z_arr = np.sort(np.concatenate((z_arr, z_mid[refine_z])))
+
+    lut = {
+        'ant_width': ant_width,
+        'ant_thickness': ant_thickness,
+        'd': d_arr,
+        'z': z_arr,
+        'table': table,
+        'error': error
+    }
+    return lut
+
+def get_strip_lut_key(ant_width: float, ant_thickness: float, lut_tol: float) -> str:
+    canonical = json.dumps([ant_width, ant_thickness, lut_tol, ENGINE_VERSION])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:16]
+
+# tables built or loaded by this process
+strip_lut_memory = {}
+
+def get_strip_lut(ant_width: float, ant_thickness: float, z_min: float, z_max: float, lut_tol=LUT_TOL, cache_dir=LUT_CACHE_DIR):
+    # a table of this cross-section covering [z_min, z_max]: from memory, from cache_dir, or built and stored
+    key = get_strip_lut_key(ant_width, ant_thickness, lut_tol)
+
+    def covers(z_arr):
+        return z_arr[0] <= z_min and z_max <= z_arr[-1]
+
+    for lut in strip_lut_memory.get(key, []):
+        if covers(lut['z']):
+            return lut
+
+    if cache_dir is not None and os.path.isdir(cache_dir):
+        for filename in sorted(os.listdir(cache_dir)):
+            if not (filename.startswith(f"lut_{key}_") and filename.endswith('.npz')):
+                continue
+            with np.load(os.path.join(cache_dir, filename)) as data:
+                if not covers(data['z']):
+                    continue
+                lut = {name: data[name] for name in ('d', 'z', 'table')}
+                lut.update(ant_width=ant_width, ant_thickness=ant_thickness, error=float(data['error']))
+            strip_lut_memory.setdefault(key, []).append(lut)
+            return lut
+
+    lut = build_strip_lut(ant_width, ant_thickness, z_min, z_max, lut_tol)
+    strip_lut_memory.setdefault(key, []).append(lut)
+
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        filename = os.path.join(cache_dir, f"lut_{key}_{z_min:.6e}_{z_max:.6e}.npz")
+        tmp_filename = f"{filename}.{os.getpid()}.tmp.npz"
+        np.savez(tmp_filename, d=lut['d'], z=lut['z'], table=lut['table'], error=lut['error'])
+        os.replace(tmp_filename, filename)
+    return lut
+
+def calc_strip_field_lut(xy_plane_arr, z_value: float, lut, input_current: float):
+    # table row at z_value blended from its two bracketing rows, then linear interpolation in |d|;
+    # offsets beyond the table use the multipole expansion
+    z_arr, d_arr, table = lut['z'], lut['d'], lut['table']
+    if len(z_arr) == 1:
+        row = table[:, 0]
+    else:
+        z_idx = int(np.clip(np.searchsorted(z_arr, z_value, side='right') - 1, 0, len(z_arr) - 2))
+        weight = float(np.clip((z_value - z_arr[z_idx]) / (z_arr[z_idx + 1] - z_arr[z_idx]), 0., 1.))
+        row = (1 - weight) * table[:, z_idx] + weight * table[:, z_idx + 1]
+
+    abs_xy = np.abs(xy_plane_arr)
+    B_pump_in = input_current * np.interp(abs_xy, d_arr, row[0])
+    B_pump_out = input_current * np.sign(xy_plane_arr) * np.interp(abs_xy, d_arr, row[1])
+
+    far = abs_xy > d_arr[-1]
+    if np.any(far):
+        B_pump_in[far] = calc_multipole_field(xy_plane_arr[far], z_value, lut['ant_width'], lut['ant_thickness'], input_current, True)
+        B_pump_out[far] = calc_multipole_field(xy_plane_arr[far], z_value, lut['ant_width'], lut['ant_thickness'], input_current, False)
+    return B_pump_in, B_pump_out
+
+def calc_antenna_field_lut(x_mesh, y_mesh, z_value: float, ant_dict, luts):
+    # calc_antenna_field_direct with every conductor looked up in its table (luts: one per conductor)
+    angle_rad = np.deg2rad(ant_dict['current_direction'])
+    xy_plane_arr = (y_mesh - ant_dict['ant_position_y']) * np.cos(angle_rad) - (x_mesh - ant_dict['ant_position_x']) * np.sin(angle_rad)
+
+    B_pump_in = 0.
+    B_pump_out = 0.
+    for (offset, ant_width, input_current), lut in zip(get_antenna_conductors(ant_dict), luts):
+        B_in, B_out = calc_strip_field_lut(xy_plane_arr - offset, z_value, lut, input_current)
+        B_pump_in = B_pump_in + B_in
+        B_pump_out = B_pump_out + B_out
+
+    return B_pump_in * np.sin(angle_rad * (-1)), B_pump_in * np.cos(angle_rad), B_pump_out
+
+def get_strip_segment_vertices(ant_dict, size_x: float, size_y: float):
+    # straight strip as one segment long enough that the missing ends change the field by < ~1e-4 in the sample
+    half_length = 100 * np.hypot(size_x, size_y)
+    angle_rad = np.deg2rad(ant_dict['current_direction'])
+    direction = np.array([np.cos(angle_rad), np.sin(angle_rad)])
+    center = np.array([ant_dict['ant_position_x'], ant_dict['ant_position_y']])
+    return [center - half_length * direction, center + half_length * direction]
+
+def log_r_plus(b, r, rest_sq):
+    # log(b + r), r = sqrt(b^2 + rest_sq), without cancellation for b < 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(b >= 0, np.log(np.abs(b + r)), np.log(rest_sq / (r - b)))
+
+def calc_bar_corner_terms(X, Y, H):
+    # Phi(X, Y, H) and Phi(X, H, Y) at one corner of a rectangular bar, where
+    # Phi(a, b, c) = a log(b + r) + b log(a + r) - |c| atan2(a b, |c| r) (the terms with a zero coefficient -> 0)
+    X_sq, Y_sq, H_sq = X**2, Y**2, H**2
+    r = np.sqrt(X_sq + Y_sq + H_sq)
+    log_X = log_r_plus(X, r, Y_sq + H_sq)
+    log_Y = log_r_plus(Y, r, X_sq + H_sq)
+    log_H = log_r_plus(H, r, X_sq + Y_sq)
+
+    with np.errstate(invalid='ignore'):
+        phi_y = np.where(X == 0, 0., X * log_Y) + np.where(Y == 0, 0., Y * log_X) - np.abs(H) * np.arctan2(X * Y, np.abs(H) * r)
+        phi_h = np.where(X == 0, 0., X * log_H) + np.where(H == 0, 0., H * log_X) - np.abs(Y) * np.arctan2(X * H, np.abs(Y) * r)
+    return phi_y, phi_h
+
+def calc_bar_field(X, Y, H, length: float, ant_width: float, ant_thickness: float, input_current: float):
+    # Closed-form Biot-Savart field of a straight bar of rectangular cross-section with uniform current density.
+    # (X, Y, H): point relative to the center of the start face, along the current, across it in the plane and up.
+    # Returns the in-plane field across the bar and the field along H, as sums over the 8 corners of the
+    # antiderivatives of H / r^3 and Y / r^3.
+    ant_half_width = ant_width / 2
+    ant_half_thickness = ant_thickness / 2
+
+    B_across = 0.
+    B_up = 0.
+    for sign_x, x_corner in ((1, 0.), (-1, length)):
+        for sign_y, y_corner in ((1, -ant_half_width), (-1, ant_half_width)):
+            for sign_h, h_corner in ((1, -ant_half_thickness), (-1, ant_half_thickness)):
+                phi_y, phi_h = calc_bar_corner_terms(X - x_corner, Y - y_corner, H - h_corner)
+                B_across = B_across + sign_x * sign_y * sign_h * phi_y
+                B_up = B_up - sign_x * sign_y * sign_h * phi_h
+
+    return 4*np.pi*1e-7 * input_current / (4*np.pi*ant_width*ant_thickness) * B_across, 4*np.pi*1e-7 * input_current / (4*np.pi*ant_width*ant_thickness) * B_up
+
+def calc_antenna_field_segments(x_mesh, y_mesh, z_value: float, ant_dict, vertices, max_batch=SEGMENT_MAX_BATCH):
+    # Field of a polyline antenna of finite rectangular bars (one per segment, butted at the vertices) at one z slice.
+    # (segments x cells) pairs are evaluated in batches of at most max_batch.
+    vertices = np.asarray(vertices, dtype=float)
+    segments = np.diff(vertices, axis=0)
+    lengths = np.linalg.norm(segments, axis=1)
+    tangents = segments / lengths[:, None]
+    # normal of the strip kernel: offset = (y - y0) cos - (x - x0) sin
+    normals = np.stack([-tangents[:, 1], tangents[:, 0]], axis=1)
+
+    x_arr = x_mesh.ravel()
+    y_arr = y_mesh.ravel()
+    B_pump = [np.zeros(x_arr.shape) for _ in range(3)]
+
+    n_segments = len(lengths)
+    segment_chunk = max(1, min(n_segments, max_batch))
+    cell_chunk = max(1, max_batch // segment_chunk)
+    for cell_begin in range(0, len(x_arr), cell_chunk):
+        cells = slice(cell_begin, cell_begin + cell_chunk)
+        for segment_begin in range(0, n_segments, segment_chunk):
+            chunk = slice(segment_begin, segment_begin + segment_chunk)
+            dx = x_arr[None, cells] - vertices[chunk, 0:1]
+            dy = y_arr[None, cells] - vertices[chunk, 1:2]
+            X = dx * tangents[chunk, 0:1] + dy * tangents[chunk, 1:2]
+            Y = dx * normals[chunk, 0:1] + dy * normals[chunk, 1:2]
+
+            # the sample lies z_value below the antenna center
+            B_across, B_up = calc_bar_field(X, Y, -z_value, lengths[chunk, None], ant_dict['ant_width'], ant_dict['ant_thickness'], ant_dict['input_current'])
+            B_pump[0][cells] += np.sum(B_across * normals[chunk, 0:1], axis=0)
+            B_pump[1][cells] += np.sum(B_across * normals[chunk, 1:2], axis=0)
+            B_pump[2][cells] += np.sum(B_up, axis=0)
+
+    return tuple(B.reshape(x_mesh.shape) for B in B_pump)
+
+def get_tile_shape(n_x: int, n_y: int, memory_budget=TILE_MEMORY_BUDGET):
+    # square tile (n_x, n_y cells) whose kernel temporaries fit in memory_budget
+    tile_cells = max(int(memory_budget // TILE_BYTES_PER_CELL), 1)
+    tile_n_x = min(n_x, max(int(np.sqrt(tile_cells)), 1))
+    tile_n_y = min(n_y, max(tile_cells // tile_n_x, 1))
+    return tile_n_x, tile_n_y
+
+def get_magnetic_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, size_z: int, ant_dicts, check=False, current_step=None, decay_tol=FIELD_DECAY_TOL, engine='rotate', band_tol=None, band_far_field='zero', far_field_tol=None, report=None, sampling='center', max_batch=SEGMENT_MAX_BATCH, memory_budget=TILE_MEMORY_BUDGET, lut_tol=LUT_TOL, lut_cache_dir=LUT_CACHE_DIR):
+    # engine: 'rotate' rotates and resamples a padded field map, 'direct' evaluates every cell center.
+    # band_tol (direct engine only): cells outside the band around the antenna axis are set to zero
+    # (band_far_field='zero', |B| < band_tol * max|B|) or to the thin-wire field (band_far_field='line',
+    # relative error < band_tol). far_field_tol (direct engine only): cells far from the antenna use the
+    # multipole expansion with relative error < far_field_tol. The absolute error bound [T] is stored in
+    # report['error_bound'].
+    # engine 'segment' evaluates straight strips as long finite bars with the closed-form Biot-Savart segment engine;
+    # antennas with ant_type 'polyline' (ant_dict['vertices'] = [(x, y), ...] in sample coordinates) always use it.
+    # max_batch bounds the (segment x cell) pairs evaluated at once.
+    # sampling (direct engine only): 'center' samples the field at cell centers, 'cell_average' averages it
+    # analytically over each cell (cells in the band and far-field tiers stay point-sampled).
+    # engine 'lut' looks every cell up in (offset, height) tables of each conductor cross-section, built once over
+    # the heights of all slices with interpolation error < lut_tol of the peak field and kept in lut_cache_dir.
+    # The direct, segment and lut engines evaluate each slice in x-y tiles sized from memory_budget [bytes] and
+    # superpose all their antennas tile by tile into the slice, so peak memory does not grow with the mesh.
     # size of cell
     size_cell_x = size_x / n_x
     size_cell_y = size_y / n_y
@@ -93,19 +736,12 @@ def get_magnetic_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, s
     z_arr = np.linspace(size_cell_z / 2, size_z - size_cell_z / 2, n_z)
 
     size_cell = size_cell_x if size_cell_x < size_cell_y else size_cell_y
-    size_xy = size_x if size_x > size_y else size_y
-    # n_xy = int(size_xy // size_cell)
-    n_xy = int(round(size_xy / size_cell))
-
-    xy_arr = np.linspace(size_cell / 2, size_xy - size_cell / 2, n_xy)
-
-    wide_xy_const = 2
-    wide_xy_arr = np.linspace(- size_xy * (wide_xy_const - 1) + size_cell / 2, size_xy * wide_xy_const - size_cell / 2, n_xy * (1 + (wide_xy_const - 1) * 2))
-
-    # x_mesh, y_mesh = np.meshgrid(xy_arr, xy_arr)
-    # wide_x_mesh, wide_y_mesh = np.meshgrid(wide_xy_arr, wide_xy_arr)
 
-    _, wide_y_mesh = np.meshgrid(wide_xy_arr, wide_xy_arr)
+    if not current_step is None:
+        # Only process the current_step when checking
+        z_range = range(current_step, current_step + 1)
+    else:
+        z_range = range(n_z)
 
     # Initialize B_pump to store the values for each z point
     B_pump_x_list = []
@@ -114,91 +750,143 @@ def get_magnetic_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, s
 
     plot_data = []
 
-    for i, ant_dict in enumerate(ant_dicts):
+    # antennas evaluated cell by cell: the direct and segment engines, and polylines with any engine
+    def is_tiled(ant_dict):
+        return engine != 'rotate' or ant_dict.get('ant_type') == 'polyline'
+
+    tiled_ant_dicts = [ant_dict for ant_dict in ant_dicts if is_tiled(ant_dict)]
+    if len(tiled_ant_dicts) != 0:
+        cell_size = (size_cell_x, size_cell_y, size_cell_z) if sampling == 'cell_average' else None
+
+        # straight bars of each antenna for the segment engine, tables of its conductors for the lut engine
+        tiled_bars = []
+        tiled_luts = []
+        for ant_dict in tiled_ant_dicts:
+            bars = None
+            luts = None
+            if ant_dict.get('ant_type') == 'polyline':
+                bars = [(ant_dict, ant_dict['vertices'])]
+            elif engine == 'segment':
+                bars = [(conductor_dict, get_strip_segment_vertices(conductor_dict, size_x, size_y)) for conductor_dict in get_conductor_dicts(ant_dict)]
+            elif engine == 'lut':
+                z_offset = ant_dict['ant_thickness'] / 2 + ant_dict['distance']
+                luts = [get_strip_lut(ant_width, ant_dict['ant_thickness'], z_offset + z_arr[0], z_offset + z_arr[-1], lut_tol, lut_cache_dir) for _, ant_width, _ in get_antenna_conductors(ant_dict)]
+            tiled_bars.append(bars)
+            tiled_luts.append(luts)
+
+        tile_n_x, tile_n_y = get_tile_shape(n_x, n_y, memory_budget)
+
+        for z_pnt in z_range:
+            B_pump = [np.zeros((n_y, n_x)) for _ in range(3)]
+
+            for tile_y in range(0, n_y, tile_n_y):
+                for tile_x in range(0, n_x, tile_n_x):
+                    tile = (slice(tile_y, tile_y + tile_n_y), slice(tile_x, tile_x + tile_n_x))
+                    x_mesh, y_mesh = np.meshgrid(x_arr[tile[1]], y_arr[tile[0]])
+
+                    for ant_dict, bars, luts in zip(tiled_ant_dicts, tiled_bars, tiled_luts):
+                        # depth between center of antenna thickness
+                        z_value = ant_dict['ant_thickness'] / 2 + ant_dict['distance'] + z_arr[z_pnt]
+
+                        if luts is not None:
+                            B_tile = calc_antenna_field_lut(x_mesh, y_mesh, z_value, ant_dict, luts)
+                        elif bars is None:
+                            B_tile = calc_antenna_field_direct(x_mesh, y_mesh, z_value, ant_dict, band_tol, band_far_field, far_field_tol, report, cell_size)
+                        else:
+                            B_bars = [calc_antenna_field_segments(x_mesh, y_mesh, z_value, bar_dict, vertices, max_batch) for bar_dict, vertices in bars]
+                            B_tile = tuple(sum(B_bar[c] for B_bar in B_bars) for c in range(3))
+
+                        # superpose into the slice; components below the zero threshold are dropped
+                        for c in range(3):
+                            if get_array_stats(B_tile[c])['abs_max'] >= FIELD_ZERO_THRESHOLD:
+                                B_pump[c][tile] += B_tile[c]
+
+            B_pump_x_list.append(B_pump[0])
+            B_pump_y_list.append(B_pump[1])
+            B_pump_z_list.append(B_pump[2])
+
+    # parallel antennas of the rotate engine share one padded map and its rotation
+    for ant_dict in get_parallel_groups([ant_dict for ant_dict in ant_dicts if not is_tiled(ant_dict)]):
         ant_width = ant_dict['ant_width']
         # ant_half_width = ant_width / 2
         ant_thickness = ant_dict['ant_thickness']
         ant_half_thickness = ant_thickness / 2
 
-        ant_position_x = ant_dict['ant_position_x']
-        ant_position_y = ant_dict['ant_position_y']
-        # xy_plane_arr = y_mesh - ant_position_y
-        xy_plane_arr = wide_y_mesh - ant_position_y
+        # depth between center of antenna thickness
+        distance_between_antenna_and_sample = ant_dict['distance']
+        z_value_list = [ant_half_thickness + distance_between_antenna_and_sample + z_arr[z_pnt] for z_pnt in z_range]
 
-        center_x_idx = get_nearest_index(wide_xy_arr, ant_position_x)
-        center_y_idx = get_nearest_index(wide_xy_arr, ant_position_y)
+        # polylines have no single direction
+        current_direction = ant_dict.get('current_direction', 0.)
 
-        center_x_idx = get_nearest_index(wide_xy_arr, ant_position_x)
-        center_y_idx = get_nearest_index(wide_xy_arr, ant_position_y)
+        B_pump_list = []
 
-        sample_x_idx_begin = get_nearest_index(wide_xy_arr, x_arr[0])
-        sample_x_idx_end = get_nearest_index(wide_xy_arr, x_arr[-1]) + 1 * max(1, int(round(size_cell / size_cell_x)))
-        sample_y_idx_begin = get_nearest_index(wide_xy_arr, y_arr[0])
-        sample_y_idx_end = get_nearest_index(wide_xy_arr, y_arr[-1]) + 1 * max(1, int(round(size_cell / size_cell_y)))
+        ant_position_x = ant_dict['ant_position_x']
+        ant_position_y = ant_dict['ant_position_y']
 
-        if not current_step is None:
-            # Only process the current_step when checking
-            z_range = range(current_step, current_step + 1)
-        else:
-            z_range = range(n_z)
-        
-        # depth between center of antenna thickness
-        distance_between_antenna_and_sample = ant_dict['distance']
-        z_value_list = [ant_half_thickness + distance_between_antenna_and_sample + z_arr[z_pnt] for z_pnt in z_range]
+        # all conductors share the offset array; the domain is padded for their total width
+        conductors = get_antenna_conductors(ant_dict)
 
-        input_current = ant_dict['input_current']
-        current_direction = ant_dict['current_direction']
+        # rectangular domain padded only as far as the rotation and the field decay require
+        decay_distance = get_decay_distance(get_antenna_extent(ant_dict), ant_thickness, max(z_value_list), decay_tol)
+        wide_x_arr, wide_y_arr = get_wide_domain(x_arr, y_arr, size_cell_x, size_cell_y, size_cell, ant_position_x, ant_position_y, current_direction, decay_distance)
 
-        for z, z_value in enumerate(z_value_list):
-            # cell center
-            z_mesh = np.full_like(wide_y_mesh, z_value)
+        center_x_idx = get_nearest_index(wide_x_arr, ant_position_x)
+        center_y_idx = get_nearest_index(wide_y_arr, ant_position_y)
 
-            B_pump_x = rotate_around_point(calc_magnetic_field(xy_plane_arr, z_mesh, ant_width, ant_thickness, input_current, True), current_direction, (center_y_idx, center_x_idx)) * np.sin(np.deg2rad(current_direction) * (-1))
-            B_pump_x = resize_2d_array_interpolate(B_pump_x[sample_y_idx_begin:sample_y_idx_end, sample_x_idx_begin:sample_x_idx_end], n_y, n_x)
-            if max(list(map(lambda x: max(x), abs(B_pump_x)))) < 1e-15:
-                B_pump_x = np.full_like(B_pump_x, 0.)
+        # the unrotated map only varies across the antenna axis: conductors are evaluated on one column.
+        # The map is rotated about the lattice point nearest to the antenna, so the column is shifted by the
+        # distance of that point from the antenna axis
+        cos_val = np.cos(np.deg2rad(current_direction))
+        sin_val = np.sin(np.deg2rad(current_direction))
+        center_offset = (wide_y_arr[center_y_idx] - ant_position_y) * cos_val - (wide_x_arr[center_x_idx] - ant_position_x) * sin_val
+        xy_plane_arr = (wide_y_arr - wide_y_arr[center_y_idx] + center_offset)[:, np.newaxis]
 
-            # print(np.shape(B_pump_x))
-            
-            if i == 0:
-                B_pump_x_list.append(B_pump_x)
-            else:
-                B_pump_x_list[z] += B_pump_x
+        # indices of the sample cell centers in the padded map (lattice points on both axes)
+        spacing_x = get_lattice_spacing(size_cell_x, size_cell)
+        spacing_y = get_lattice_spacing(size_cell_y, size_cell)
+        sample_x_pos = (x_arr - wide_x_arr[0]) / spacing_x
+        sample_y_pos = (y_arr - wide_y_arr[0]) / spacing_y
 
-            # B_pump_y = np.full_like(B_pump_x, 0.)
-            B_pump_y = rotate_around_point(calc_magnetic_field(xy_plane_arr, z_mesh, ant_width, ant_thickness, input_current, True), current_direction, (center_y_idx, center_x_idx)) * np.cos(np.deg2rad(current_direction))
-            B_pump_y = resize_2d_array_interpolate(B_pump_y[sample_y_idx_begin:sample_y_idx_end, sample_x_idx_begin:sample_x_idx_end], n_y, n_x)
-            if max(list(map(lambda x: max(x), abs(B_pump_y)))) < 1e-15:
-                B_pump_y = np.full_like(B_pump_y, 0.)
+        for z_value in z_value_list:
+            # in-plane field is rotated once and projected on x and y
+            B_pump_in = np.repeat(calc_conductors_field(xy_plane_arr, z_value, conductors, ant_thickness, True), len(wide_x_arr), axis=1)
+            B_pump_in = rotate_around_point(B_pump_in, current_direction, (center_y_idx, center_x_idx), aspect=spacing_x / spacing_y)
 
-            if i == 0:
-                B_pump_y_list.append(B_pump_y)
-            else:
-                B_pump_y_list[z] += B_pump_y
+            B_pump_x = B_pump_in * np.sin(np.deg2rad(current_direction) * (-1))
+            B_pump_x = sample_wide_map(B_pump_x, sample_y_pos, sample_x_pos)
 
-            # print(np.sin(np.deg2rad(current_direction)), np.cos(np.deg2rad(current_direction)))
+            B_pump_y = B_pump_in * np.cos(np.deg2rad(current_direction))
+            B_pump_y = sample_wide_map(B_pump_y, sample_y_pos, sample_x_pos)
 
+            B_pump_z = np.repeat(calc_conductors_field(xy_plane_arr, z_value, conductors, ant_thickness, False), len(wide_x_arr), axis=1)
+            B_pump_z = rotate_around_point(B_pump_z, current_direction, (center_y_idx, center_x_idx), aspect=spacing_x / spacing_y)
+            B_pump_z = sample_wide_map(B_pump_z, sample_y_pos, sample_x_pos)
 
-            B_pump_z = rotate_around_point(calc_magnetic_field(xy_plane_arr, z_mesh, ant_width, ant_thickness, input_current, False), current_direction, (center_y_idx, center_x_idx))
-            B_pump_z = resize_2d_array_interpolate(B_pump_z[sample_y_idx_begin:sample_y_idx_end, sample_x_idx_begin:sample_x_idx_end], n_y, n_x)
-            if max(list(map(lambda x: max(x), abs(B_pump_z)))) < 1e-15:
-                    B_pump_z = np.full_like(B_pump_z, 0.)
+            B_pump_list.append((B_pump_x, B_pump_y, B_pump_z))
+
+        for z, (B_pump_x, B_pump_y, B_pump_z) in enumerate(B_pump_list):
+            if get_array_stats(B_pump_x)['abs_max'] < FIELD_ZERO_THRESHOLD:
+                B_pump_x = np.full_like(B_pump_x, 0.)
+            if get_array_stats(B_pump_y)['abs_max'] < FIELD_ZERO_THRESHOLD:
+                B_pump_y = np.full_like(B_pump_y, 0.)
+            if get_array_stats(B_pump_z)['abs_max'] < FIELD_ZERO_THRESHOLD:
+                B_pump_z = np.full_like(B_pump_z, 0.)
 
-            if i == 0:
+            if z == len(B_pump_x_list):
+                B_pump_x_list.append(B_pump_x)
+                B_pump_y_list.append(B_pump_y)
                 B_pump_z_list.append(B_pump_z)
             else:
+                B_pump_x_list[z] += B_pump_x
+                B_pump_y_list[z] += B_pump_y
                 B_pump_z_list[z] += B_pump_z
-
-            # print("max(B_pump_x) [T] :", np.max(B_pump_x))
-            # print("max(B_pump_y) [T] :", np.max(B_pump_y))
-            # print("max(B_pump_z) [T] :", np.max(B_pump_z))
-            # print("max pumping field [T] :", np.max(np.sqrt(B_pump_x**2 + B_pump_y**2 + B_pump_z**2)))
-
-            # print((center_x_idx, center_y_idx))
     
     if check:
-        for B_pump_x, B_pump_y, B_pump_z in zip(B_pump_x_list, B_pump_y_list, B_pump_z_list):
-            plot_data.append(get_field_temp_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, current_step, current_direction))
+        # statistics are computed once per slice and reused for plotting
+        field_stats_list = [get_field_stats(B_pump_x, B_pump_y, B_pump_z) for B_pump_x, B_pump_y, B_pump_z in zip(B_pump_x_list, B_pump_y_list, B_pump_z_list)]
+        for B_pump_x, B_pump_y, B_pump_z, field_stats in zip(B_pump_x_list, B_pump_y_list, B_pump_z_list, field_stats_list):
+            plot_data.append(get_field_temp_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, current_step, field_stats))
 
     if len(plot_data) != 0:
         return plot_data
@@ -208,15 +896,124 @@ def get_magnetic_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, s
 
     return B_pump_x_list, B_pump_y_list, B_pump_z_list
 
+# antenna parameters that determine the static field; drive settings (voltage, power, impedance,
+# waveform, phase, frequency) only enter the mumax3 script and are left out of the fingerprint
+FIELD_ANTENNA_KEYS = ('ant_type', 'ant_width', 'ant_thickness', 'ant_position_x', 'ant_position_y', 'distance', 'current_direction', 'input_current', 'gap', 'ground_width', 'ground_split', 'vertices')
+# the basis export also depends on the time functions, which decide how the antennas combine into basis fields
+BASIS_ANTENNA_KEYS = FIELD_ANTENNA_KEYS + ('waveform', 'frequency', 'phase')
+
+def get_condition_fingerprint(n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dicts, dtype='<f4', antenna_keys=FIELD_ANTENNA_KEYS, **field_kwargs):
+    # sha256 of the canonical JSON of everything that determines the written field
+    # (antenna_keys=BASIS_ANTENNA_KEYS for the basis export)
+    condition = {
+        'mesh': [n_x, n_y, n_z, size_x, size_y, size_z],
+        'antennas': [{key: ant_dict[key] for key in antenna_keys if key in ant_dict} for ant_dict in ant_dicts],
+        'engine_version': ENGINE_VERSION,
+        'field_kwargs': field_kwargs,
+        'dtype': dtype
+    }
+    canonical = json.dumps(condition, sort_keys=True, separators=(',', ':'), default=float)
+    return "sha256:" + hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+def get_time_function_expression(waveform: str, frequency, phase: float):
+    # mumax3 expression of the time function; frequency None -> the script variable freq
+    freq_str = 'freq' if frequency is None else f"{frequency:g}"
+    phase_str = '' if phase == 0 else f" + {phase:.12g}" if phase > 0 else f" - {-phase:.12g}"
+
+    if waveform == "Square wave":
+        return f"(2*heaviside(sin(2*pi*{freq_str}*t{phase_str})) - 1)"
+    return f"sin(2*pi*{freq_str}*t{phase_str})"
+
+def get_basis_terms(ant_dicts):
+    # Raw basis terms and their antenna coefficients.
+    # Sin-wave antennas sharing a frequency reduce to a quadrature pair:
+    # sin(wt + phi) = cos(phi) * sin(wt) + sin(phi) * cos(wt).
+    # Square-wave antennas share a term only if frequency and phase are equal.
+    expressions = []
+    coef_list = []
+
+    for k, ant_dict in enumerate(ant_dicts):
+        waveform = ant_dict.get('waveform', "Sin wave")
+        frequency = ant_dict.get('frequency')
+        phase = np.deg2rad(ant_dict.get('phase', 0.))
+
+        if waveform == "Square wave":
+            terms = [(get_time_function_expression(waveform, frequency, phase), 1.)]
+        else:
+            sin_expression = get_time_function_expression(waveform, frequency, 0.)
+            cos_expression = sin_expression.replace('sin(', 'cos(', 1)
+            terms = [(sin_expression, np.cos(phase)), (cos_expression, np.sin(phase))]
+
+        for expression, coef in terms:
+            if expression not in expressions:
+                expressions.append(expression)
+                coef_list.append(np.zeros(len(ant_dicts)))
+            coef_list[expressions.index(expression)][k] += coef
+
+    return expressions, np.array(coef_list)
+
+def get_raw_basis_field(n_x: int, n_y: int, n_z: int, size_x: int, size_y: int, size_z: int, ant_dicts, coef_arr, current_step: int, **field_kwargs):
+    # field of each raw basis term at one z slice, every antenna evaluated once
+    raw_basis = [[np.zeros((n_y, n_x)) for _ in range(3)] for _ in range(len(coef_arr))]
+
+    for k, ant_dict in enumerate(ant_dicts):
+        B_pump = get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, [ant_dict], current_step=current_step, **field_kwargs)
+        for j in range(len(coef_arr)):
+            if coef_arr[j][k] != 0:
+                for c in range(3):
+                    raw_basis[j][c] += coef_arr[j][k] * B_pump[c]
+
+    return raw_basis
+
+def reduce_basis_fields(raw_basis_list, expressions, basis_tol=1e-6, use_svd=True):
+    # raw_basis_list[z][j] = (Bx, By, Bz) of raw term j at slice z.
+    # Gram matrix over all slices and components -> orthogonal basis truncated at basis_tol.
+    n_terms = len(expressions)
+    gram = np.zeros((n_terms, n_terms))
+    for raw_basis in raw_basis_list:
+        raw_arr = np.array([np.ravel(raw_basis[j]) for j in range(n_terms)])
+        gram += raw_arr @ raw_arr.T
+
+    # raw terms, dropping those whose field vanishes (e.g. the cos term of in-phase antennas)
+    singular_values = np.sqrt(np.clip(np.diag(gram), 0., None))
+    projection = np.eye(n_terms)[:, singular_values > basis_tol * max(singular_values.max(), FIELD_ZERO_THRESHOLD)]
+
+    if use_svd:
+        # orthogonal basis, used only if it needs fewer fields than the raw terms
+        eigen_values, eigen_vectors = np.linalg.eigh(gram)
+        order = np.argsort(eigen_values)[::-1]
+        singular_values = np.sqrt(np.clip(eigen_values[order], 0., None))
+        keep = singular_values > basis_tol * max(singular_values.max(), FIELD_ZERO_THRESHOLD)
+        if np.count_nonzero(keep) < projection.shape[1]:
+            projection = eigen_vectors[:, order][:, keep]
+
+    basis_list = []
+    basis_expressions = []
+    for r in range(projection.shape[1]):
+        B_pump_x_list = [sum(projection[j][r] * raw_basis[j][0] for j in range(n_terms)) for raw_basis in raw_basis_list]
+        B_pump_y_list = [sum(projection[j][r] * raw_basis[j][1] for j in range(n_terms)) for raw_basis in raw_basis_list]
+        B_pump_z_list = [sum(projection[j][r] * raw_basis[j][2] for j in range(n_terms)) for raw_basis in raw_basis_list]
+        basis_list.append((B_pump_x_list, B_pump_y_list, B_pump_z_list))
+
+        terms = [(projection[j][r], expressions[j]) for j in range(n_terms) if abs(projection[j][r]) > basis_tol]
+        if len(terms) == 1 and terms[0][0] == 1.:
+            basis_expressions.append(terms[0][1])
+        else:
+            basis_expressions.append(" ".join(f"{'-' if coef < 0 else '+'} {abs(coef):.12g}*{expression}" for coef, expression in terms).lstrip('+ '))
+
+    return basis_list, basis_expressions
 
-def get_data_dict(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z):
+
+def get_data_dict(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, field_stats=None):
+    if field_stats is None:
+        field_stats = get_field_stats(B_pump_x, B_pump_y, B_pump_z)
     
-    x_exp, x_unit = get_si_prefix(max(abs(x_arr)), "m")
-    y_exp, y_unit = get_si_prefix(max(abs(y_arr)), "m")
+    x_exp, x_unit = get_si_prefix(np.max(np.abs(x_arr)), "m")
+    y_exp, y_unit = get_si_prefix(np.max(np.abs(y_arr)), "m")
 
-    B_pump_x_exp, B_pump_x_unit = get_si_prefix(max(list(map(lambda x: max(x), abs(B_pump_x)))), "T")
-    B_pump_y_exp, B_pump_y_unit = get_si_prefix(max(list(map(lambda x: max(x), abs(B_pump_y)))), "T")
-    B_pump_z_exp, B_pump_z_unit = get_si_prefix(max(list(map(lambda x: max(x), abs(B_pump_z)))), "T")
+    B_pump_x_exp, B_pump_x_unit = get_si_prefix(field_stats['B_pump_x']['abs_max'], "T")
+    B_pump_y_exp, B_pump_y_unit = get_si_prefix(field_stats['B_pump_y']['abs_max'], "T")
+    B_pump_z_exp, B_pump_z_unit = get_si_prefix(field_stats['B_pump_z']['abs_max'], "T")
 
 
     plot_data = {
@@ -234,9 +1031,12 @@ def get_data_dict(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z):
 
     return plot_data
 
-def get_map_scale(arr):
-    z_min = min(list(map(lambda x: min(x), arr)))
-    z_max = max(list(map(lambda x: max(x), arr)))
+def get_map_scale(arr, stats=None):
+    if stats is None:
+        stats = get_array_stats(arr)
+
+    z_min = stats['min']
+    z_max = stats['max']
 
     if z_min > 0 and z_max > 0:
         z_min = 0
@@ -256,59 +1056,135 @@ def get_map_scale(arr):
     
     return z_min, z_max
 
-def get_field_temp_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, z, current_direction):
-    # color map
-    cmap = gen_cmap_rgb([(0,0,0.5),(0,0,1),(0,1,1),(0,1,0),(1,1,0),(1,0.5,0),(1,0,0)])
-
-    plt, fig, axes, caxes, shrink = figure_size_setting(3)
-
-    B_pump_max = max(list(map(lambda x: max(x), np.sqrt(B_pump_x ** 2 + B_pump_y ** 2 + B_pump_z ** 2))))
-    B_pump_max_exp, B_pump_max_unit = get_si_prefix(B_pump_max, "T")
-
-    fig.suptitle(f"Z-slice: {z}, max(Bpump) = {B_pump_max / (10 ** B_pump_max_exp):.2f} {B_pump_max_unit}")
-
-    for i in range(3):
-        ax = axes[i]
-        cax = caxes[i]
-        x_exp, x_unit = get_si_prefix(max(abs(x_arr)), "m")
-        y_exp, y_unit = get_si_prefix(max(abs(y_arr)), "m")
-        B_pump = [B_pump_x, B_pump_y, B_pump_z][i]
-        z_exp, z_unit = get_si_prefix(max(list(map(lambda x: max(x), abs(B_pump)))), "T")
-        z_min, z_max = get_map_scale(B_pump / (10**z_exp))
-        im = ax.pcolor(x_arr / (10**x_exp), y_arr / (10**y_exp), B_pump / (10**z_exp), cmap=cmap, rasterized=True, vmin=z_min, vmax=z_max)
-        ax.locator_params(axis='x',nbins=10)
-        ax.locator_params(axis='y',nbins=10)
-        
-        cbar = fig.colorbar(im, cax=cax, shrink=shrink)             #show colorbar
-        cbar.set_label(f'Pumped field ({z_unit})', labelpad=2, fontsize=7)
-
-        ax.set_xlabel(f'x ({x_unit})', labelpad=0, fontsize=7)      #x-axis label
-        ax.set_ylabel(f'y ({y_unit})', labelpad=1, fontsize=7)      #y-axis label
-
-        field = ["Bx", "By", "Bz"][i]
-
-        ax.set_title(f"{field}: max(|{field}|) = {max(list(map(lambda x: max(x), abs(B_pump))))  / (10**z_exp):.2f} {z_unit}")
-    
+# colors of the field maps
+FIELD_CMAP_COLORS = [(0,0,0.5),(0,0,1),(0,1,1),(0,1,0),(1,1,0),(1,0.5,0),(1,0,0)]
+
+class FieldFigure:
+    # Layout of the Bx / By / Bz maps of one mesh (figure, axes, colorbars, colormap, labels), built once;
+    # update() only replaces the image data, color limits and titles of a slice, so stacks of many slices
+    # are rendered without rebuilding the figure. The figure is not registered with pyplot.
+    # color_scale 'map': limits of get_map_scale, with a title per map (check window);
+    # 'print': 0..max for Bx and By, min..max(|Bz|) for Bz, no titles (publication figures of print_field_figure).
+    def __init__(self, x_arr, y_arr, color_scale='map', num_plots=3):
+        self.x_arr = np.asarray(x_arr)
+        self.y_arr = np.asarray(y_arr)
+        self.color_scale = color_scale
+        self.cmap = gen_cmap_rgb(FIELD_CMAP_COLORS)
+        _, self.fig, self.axes, caxes, shrink = figure_size_setting(num_plots, pyplot=False)
+
+        x_exp, x_unit = get_si_prefix(np.max(np.abs(self.x_arr)), "m")
+        y_exp, y_unit = get_si_prefix(np.max(np.abs(self.y_arr)), "m")
+        zeros = np.zeros((len(self.y_arr), len(self.x_arr)))
+
+        self.images = []
+        self.colorbars = []
+        for ax, cax in zip(self.axes, caxes):
+            im = ax.pcolormesh(self.x_arr / (10**x_exp), self.y_arr / (10**y_exp), zeros, cmap=self.cmap, shading='nearest', rasterized=True)
+            ax.locator_params(axis='x',nbins=10)
+            ax.locator_params(axis='y',nbins=10)
+
+            cbar = self.fig.colorbar(im, cax=cax, shrink=shrink)
+            ax.set_xlabel(f'x ({x_unit})', labelpad=0, fontsize=7)
+            ax.set_ylabel(f'y ({y_unit})', labelpad=1, fontsize=7)
+            self.images.append(im)
+            self.colorbars.append(cbar)
+
+        self.suptitle = self.fig.suptitle("") if color_scale == 'map' else None
+
+    def matches(self, x_arr, y_arr, color_scale='map') -> bool:
+        return self.color_scale == color_scale and np.array_equal(self.x_arr, x_arr) and np.array_equal(self.y_arr, y_arr)
+
+    def update(self, B_pump_x, B_pump_y, B_pump_z, z=None, field_stats=None):
+        if field_stats is None:
+            field_stats = get_field_stats(B_pump_x, B_pump_y, B_pump_z)
+
+        if self.suptitle is not None:
+            B_pump_max = field_stats['norm_max']
+            B_pump_max_exp, B_pump_max_unit = get_si_prefix(B_pump_max, "T")
+            self.suptitle.set_text(f"Z-slice: {z}, max(Bpump) = {B_pump_max / (10 ** B_pump_max_exp):.2f} {B_pump_max_unit}")
+
+        for i, (ax, im, cbar) in enumerate(zip(self.axes, self.images, self.colorbars)):
+            B_pump = [B_pump_x, B_pump_y, B_pump_z][i]
+            stats = field_stats[['B_pump_x', 'B_pump_y', 'B_pump_z'][i]]
+            z_exp, z_unit = get_si_prefix(stats['abs_max'], "T")
+            if self.color_scale == 'map':
+                z_min, z_max = get_map_scale(B_pump / (10**z_exp), scale_stats(stats, z_exp))
+            else:
+                scaled = scale_stats(stats, z_exp)
+                z_min, z_max = (0, scaled['max']) if i != 2 else (scaled['min'], scaled['abs_max'])
+
+            im.set_array(B_pump / (10**z_exp))
+            im.set_clim(z_min, z_max)
+            cbar.set_label(f'Pumped field ({z_unit})', labelpad=2, fontsize=7)
+
+            if self.suptitle is not None:
+                field = ["Bx", "By", "Bz"][i]
+                ax.set_title(f"{field}: max(|{field}|) = {stats['abs_max'] / (10**z_exp):.2f} {z_unit}")
+        return self
+
+    def save(self, filename: str, **kwargs) -> str:
+        self.fig.savefig(filename, **kwargs)
+        return filename
+
+    def save_figure(self, output_dir_path: str, outname: str, formats=('png', 'pdf')):
+        # publication export as save_figure / save_figure_png / save_figure_pdf; returns the written paths
+        paths = []
+        for extension in formats:
+            dpi = {'dpi': 300} if extension == 'png' else {}
+            paths.append(self.save(os.path.join(output_dir_path, f"{outname}.{extension}"), transparent=True, bbox_inches='tight', **dpi))
+        return paths
+
+# figure of the last mesh plotted by get_field_temp_figure, reused for its next slices
+field_figure_cache = {}
+
+def get_field_figure(x_arr, y_arr, color_scale='map') -> FieldFigure:
+    figure = field_figure_cache.get(color_scale)
+    if figure is None or not figure.matches(x_arr, y_arr, color_scale):
+        figure = FieldFigure(x_arr, y_arr, color_scale)
+        field_figure_cache[color_scale] = figure
+    return figure
+
+def get_slice_figure_name(outname: str, z: int) -> str:
+    return f"{outname}_z{z:04d}"
+
+def export_field_figures(x_arr, y_arr, B_pump_x_list, B_pump_y_list, B_pump_z_list, output_dir_path: str, outname: str, steps=None, formats=('png', 'pdf'), color_scale='map'):
+    # figures of many slices from one FieldFigure, named <outname>_z<step>.<format>; returns the written paths
+    figure = FieldFigure(x_arr, y_arr, color_scale)
+    steps = range(len(B_pump_x_list)) if steps is None else steps
+    paths = []
+    for step, B_pump_x, B_pump_y, B_pump_z in zip(steps, B_pump_x_list, B_pump_y_list, B_pump_z_list):
+        figure.update(B_pump_x, B_pump_y, B_pump_z, step)
+        paths += figure.save_figure(output_dir_path, get_slice_figure_name(outname, step), formats)
+    return paths
+
+def get_field_temp_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, z, field_stats=None):
+    import tempfile
+
+    figure = get_field_figure(x_arr, y_arr).update(B_pump_x, B_pump_y, B_pump_z, z, field_stats)
     with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmp:
-        plt.savefig(tmp.name)
-    plt.close(fig)
+        figure.save(tmp.name)
 
     return tmp.name
 
-def print_field_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z):
+def print_field_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z, field_stats=None):
     # color map
-    cmap = gen_cmap_rgb([(0,0,0.5),(0,0,1),(0,1,1),(0,1,0),(1,1,0),(1,0.5,0),(1,0,0)])
+    cmap = gen_cmap_rgb(FIELD_CMAP_COLORS)
 
     plt, fig, axes, caxes, shrink = figure_size_setting(3)
 
+    if field_stats is None:
+        field_stats = get_field_stats(B_pump_x, B_pump_y, B_pump_z)
+
     for i in range(3):
         ax = axes[i]
         cax = caxes[i]
-        x_exp, x_unit = get_si_prefix(max(abs(x_arr)), "m")
-        y_exp, y_unit = get_si_prefix(max(abs(y_arr)), "m")
+        x_exp, x_unit = get_si_prefix(np.max(np.abs(x_arr)), "m")
+        y_exp, y_unit = get_si_prefix(np.max(np.abs(y_arr)), "m")
         B_pump = [B_pump_x, B_pump_y, B_pump_z][i]
-        z_exp, z_unit = get_si_prefix(max(list(map(lambda x: max(x), abs(B_pump)))), "T")
-        z_min, z_max = 0 if i != 2 else min(list(map(lambda x: min(x), B_pump / (10**z_exp)))), max(list(map(lambda x: max(x), B_pump / (10**z_exp)))) if i != 2 else max(list(map(lambda x: max(x), abs(B_pump / (10**z_exp)))))
+        stats = field_stats[['B_pump_x', 'B_pump_y', 'B_pump_z'][i]]
+        z_exp, z_unit = get_si_prefix(stats['abs_max'], "T")
+        stats = scale_stats(stats, z_exp)
+        z_min, z_max = 0 if i != 2 else stats['min'], stats['max'] if i != 2 else stats['abs_max']
         im = ax.pcolor(x_arr / (10**x_exp), y_arr / (10**y_exp), B_pump / (10**z_exp), cmap=cmap, rasterized=True, vmin=z_min, vmax=z_max)
         ax.locator_params(axis='x',nbins=10)
         ax.locator_params(axis='y',nbins=10)
@@ -324,6 +1200,8 @@ def print_field_figure(x_arr, y_arr, B_pump_x, B_pump_y, B_pump_z):
     return plt
 
 def figure_setting():
+    import matplotlib.pyplot as plt
+
     plt.rcParams['pdf.fonttype'] = 42           #true type font
     plt.rcParams['ps.fonttype'] = 42
     plt.rcParams['font.family'] = 'Arial'       #text font
@@ -345,7 +1223,11 @@ def figure_setting():
     plt.rcParams['text.usetex'] = False
     return plt
 
-def figure_size_setting(num_plots=3):
+def figure_size_setting(num_plots=3, pyplot=True):
+    # pyplot False: the figure is not registered with pyplot (reused templates, worker processes)
+    from mpl_toolkits.axes_grid1 import Divider, Size
+    from mpl_toolkits.axes_grid1.mpl_axes import Axes
+
     plt = figure_setting()
     ax_w_px = 400  # Width of plot area in pixels
     ax_h_px = 400  # Height of plot area in pixels
@@ -361,7 +1243,11 @@ def figure_size_setting(num_plots=3):
     fig_w_inch = num_plots * (ax_w_inch + colorbar_margin_inch + colorbar_width_inch) + (num_plots - 1) * inter_plot_margin_inch + ax_margin_inch[0] + ax_margin_inch[2]
     fig_h_inch = ax_h_inch + ax_margin_inch[1] + ax_margin_inch[3]
 
-    fig = plt.figure(dpi=fig_dpi, figsize=(fig_w_inch, fig_h_inch))
+    if pyplot:
+        fig = plt.figure(dpi=fig_dpi, figsize=(fig_w_inch, fig_h_inch))
+    else:
+        from matplotlib.figure import Figure
+        fig = Figure(dpi=fig_dpi, figsize=(fig_w_inch, fig_h_inch))
     
     ax_p_w = [Size.Fixed(ax_margin_inch[0])] + [Size.Fixed(ax_w_inch), Size.Fixed(colorbar_margin_inch), Size.Fixed(colorbar_width_inch), Size.Fixed(inter_plot_margin_inch)] * (num_plots - 1) + [Size.Fixed(ax_w_inch), Size.Fixed(colorbar_margin_inch), Size.Fixed(colorbar_width_inch), Size.Fixed(ax_margin_inch[2])]
 
@@ -387,6 +1273,8 @@ def figure_size_setting(num_plots=3):
     return plt, fig, axes, caxes, shrink
 
 def gen_cmap_rgb(cols):
+    from matplotlib.colors import LinearSegmentedColormap
+
     nmax = float(len(cols)-1)
     cdict = {'red':[], 'green':[], 'blue':[]}
     for n, c in enumerate(cols):
@@ -0,0 +1,101 @@
+import os
+import json
+
+def decimal_normalize(value):
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+def add_si_prefix(value, unit):
+    prefixes = {
+        -24: 'y', -21: 'z', -18: 'a', -15: 'f', -12: 'p', -9: 'n', -6: 'µ', -3: 'm',
+        0: '', 3: 'k', 6: 'M', 9: 'G', 12: 'T', 15: 'P', 18: 'E', 21: 'Z', 24: 'Y'
+    }
+
+    if value == 0:
+        return f"{value}{unit}"
+
+    exponent = int('{:.0e}'.format(value).split('e')[1])
+    si_exponent = 3 * (exponent // 3)
+
+    if si_exponent not in prefixes:
+        return f"{value} {unit}"
+
+    new_value = value / (10 ** si_exponent)
+    si_prefix = prefixes[si_exponent]
+
+    return f"{decimal_normalize(round(new_value, 3))}{si_prefix}{unit}"
+
+def get_append_filename(dir_path: str, output_filename: str, output_extension: str, n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dict_list) -> str:
+    path_len = len(dir_path) + len(output_filename) + len(output_extension) + 2
+
+    n_str = f"{n_x}x{n_y}x{n_z}cells"
+    size_str = f"{add_si_prefix(size_x, 'm')}x{add_si_prefix(size_y, 'm')}x{add_si_prefix(size_z, 'm')}"
+
+    path_len += len(n_str) + len(size_str) + 1
+
+    antenna_str = ""
+    for i, ant_dict in enumerate(ant_dict_list):
+        ant_type_str = "_cpw" if ant_dict.get('ant_type') == "cpw" else ""
+        antenna_str += f"_ant{i+1}{ant_type_str}_t{add_si_prefix(ant_dict['ant_width'], 'm')}_x{add_si_prefix(ant_dict['ant_position_x'], 'm')}_y{add_si_prefix(ant_dict['ant_position_y'], 'm')}_s2a{add_si_prefix(ant_dict['distance'], 'm')}_{add_si_prefix(ant_dict['current_direction'], 'deg')}_I{add_si_prefix(ant_dict['input_current'], 'A')}"
+        path_len += len(antenna_str)
+        if path_len > 240:
+            antenna_str = f"_{len(ant_dict_list)}Antennas"
+            break
+    return f"{n_str}_{size_str}{antenna_str}"
+
+def get_antenna_dict(antenna_conditions):
+    # antenna parameters from the text fields of an antenna tab (or a saved condition file)
+    ant_dict = {
+        "ant_width": float(antenna_conditions['ant_width']),
+        "ant_thickness": float(antenna_conditions['ant_thickness']),
+        "ant_position_x": float(antenna_conditions['ant_position_x']),
+        "ant_position_y": float(antenna_conditions['ant_position_y']),
+        "distance": float(antenna_conditions['distance']),
+        "current_direction": float(antenna_conditions['current_direction']),
+        "input_current": float(antenna_conditions['input_current']) if antenna_conditions['input_current'] else 0,
+        "input_voltage": float(antenna_conditions['input_voltage']),
+        "input_power_dBm": float(antenna_conditions['input_power_dBm']) if antenna_conditions['input_power_dBm'] else 0,
+        "input_power_W": float(antenna_conditions['input_power_W']) if antenna_conditions['input_power_W'] else 0,
+        "impedance": float(antenna_conditions['impedance']),
+        "waveform": antenna_conditions['waveform'],
+        "phase": float(antenna_conditions.get('phase', "")) if antenna_conditions.get('phase', "") else 0,
+        "frequency": float(antenna_conditions.get('frequency', "")) if antenna_conditions.get('frequency', "") else None
+    }
+
+    # coplanar waveguide: ant_width is the signal line
+    if antenna_conditions.get('ant_type', "Strip") == "CPW (GSG)":
+        ant_dict["ant_type"] = "cpw"
+        ant_dict["gap"] = float(antenna_conditions['gap'])
+        ant_dict["ground_width"] = float(antenna_conditions['ground_width'])
+        ant_dict["ground_split"] = float(antenna_conditions['ground_split']) if antenna_conditions['ground_split'] else 0.5
+    return ant_dict
+
+def load_condition_file(condition_filename: str, dir_path=None):
+    # mesh, antennas and output path of a condition file saved by the GUI
+    with open(condition_filename, 'r') as f:
+        conditions = json.load(f)
+
+    n_x, n_y, n_z = int(conditions['n_x']), int(conditions['n_y']), int(conditions['n_z'])
+    size_x, size_y, size_z = float(conditions['size_x']), float(conditions['size_y']), float(conditions['size_z'])
+    ant_dicts = [get_antenna_dict(antenna_conditions) for antenna_conditions in conditions['antennas']]
+
+    if dir_path is None:
+        dir_path = conditions['dir_str'] if os.path.isdir(conditions['dir_str']) else os.path.dirname(os.path.abspath(condition_filename))
+    output_extension = conditions['output_extension']
+    append_filename = get_append_filename(dir_path, conditions['output_filename'], output_extension, n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts)
+    output_path = os.path.join(dir_path, conditions['output_filename'] + "_" + append_filename + output_extension)
+
+    condition = {
+        'n_x': n_x,
+        'n_y': n_y,
+        'n_z': n_z,
+        'size_x': size_x,
+        'size_y': size_y,
+        'size_z': size_z,
+        'ant_dicts': ant_dicts,
+        'output_path': output_path,
+        'export_basis': conditions.get('export_basis', False),
+        'export_hdf5': conditions.get('export_hdf5', False)
+    }
+    return condition
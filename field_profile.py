@@ -0,0 +1,92 @@
+import numpy as np
+
+import output_ovf as oo
+import calc_field as cf
+
+# points sampled along each line segment by default
+PROFILE_POINTS = 200
+# columns of the profile table written to .csv / .npy
+PROFILE_COLUMNS = ('line', 'z', 's', 'x', 'y', 'Bx', 'By', 'Bz')
+
+def get_line_points(lines, n_points=PROFILE_POINTS):
+    # lines: (n_lines, 4) segments (x0, y0, x1, y1) in sample coordinates [m];
+    # returns x, y and the distance s from the start of each line, each (n_lines, n_points)
+    lines = np.atleast_2d(np.asarray(lines, dtype=np.float64))
+    t = np.linspace(0., 1., n_points)
+    x_pts = lines[:, 0:1] + (lines[:, 2:3] - lines[:, 0:1]) * t
+    y_pts = lines[:, 1:2] + (lines[:, 3:4] - lines[:, 1:2]) * t
+    s_pts = np.hypot(lines[:, 2:3] - lines[:, 0:1], lines[:, 3:4] - lines[:, 1:2]) * t
+    return x_pts, y_pts, s_pts
+
+def get_bilinear_weights(axis, values, size: float):
+    # lower cell index and weight of the upper cell for each value on an axis of cell centers;
+    # values between the sample edge and the first / last center take the edge cell, outside the sample are NaN
+    if len(axis) == 1:
+        index = np.zeros(values.shape, dtype=np.intp)
+        weight = np.zeros(values.shape)
+    else:
+        position = np.interp(values, axis, np.arange(len(axis), dtype=np.float64))
+        index = np.minimum(np.floor(position).astype(np.intp), len(axis) - 2)
+        weight = position - index
+    weight = np.where((values < 0) | (values > size), np.nan, weight)
+    return index, weight
+
+def sample_field(B, x_arr, y_arr, size_x: float, size_y: float, x_pts, y_pts):
+    # field at arbitrary points of all z-slices at once by bilinear interpolation.
+    # B: (n_z, n_y, n_x, 3), e.g. the memory map of read_ovf_array; only the cells around the points are read.
+    # Returns (n_z, n_points, 3) in float64, NaN for points outside the sample.
+    i_x, w_x = get_bilinear_weights(x_arr, x_pts, size_x)
+    i_y, w_y = get_bilinear_weights(y_arr, y_pts, size_y)
+    i_x1 = np.minimum(i_x + 1, len(x_arr) - 1)
+    i_y1 = np.minimum(i_y + 1, len(y_arr) - 1)
+
+    w_x, w_y = w_x[np.newaxis, :, np.newaxis], w_y[np.newaxis, :, np.newaxis]
+    B_lower = np.asarray(B[:, i_y, i_x], dtype=np.float64) * (1 - w_x) + np.asarray(B[:, i_y, i_x1], dtype=np.float64) * w_x
+    B_upper = np.asarray(B[:, i_y1, i_x], dtype=np.float64) * (1 - w_x) + np.asarray(B[:, i_y1, i_x1], dtype=np.float64) * w_x
+    return B_lower * (1 - w_y) + B_upper * w_y
+
+def get_field_array(B_pump_x_list, B_pump_y_list, B_pump_z_list):
+    # slices of get_magnetic_field as one (n_z, n_y, n_x, 3) array
+    return np.stack((np.asarray(B_pump_x_list), np.asarray(B_pump_y_list), np.asarray(B_pump_z_list)), axis=-1)
+
+def extract_profiles(B, size_x: float, size_y: float, lines, n_points=PROFILE_POINTS):
+    # Profiles of Bx, By, Bz along line segments through every z-slice, as one table with the rows
+    # (line, z, s, x, y, Bx, By, Bz) ordered by line, slice and point; every line is sampled in one pass.
+    n_z, n_y, n_x, _ = B.shape
+    x_arr, y_arr = cf.get_cell_centers(n_x, size_x), cf.get_cell_centers(n_y, size_y)
+    x_pts, y_pts, s_pts = get_line_points(lines, n_points)
+    n_lines = x_pts.shape[0]
+
+    B_pts = sample_field(B, x_arr, y_arr, size_x, size_y, x_pts.ravel(), y_pts.ravel())
+    # (n_z, n_lines * n_points, 3) -> (n_lines, n_z, n_points, 3)
+    B_pts = B_pts.reshape(n_z, n_lines, n_points, 3).transpose(1, 0, 2, 3)
+
+    table = np.empty((n_lines, n_z, n_points, len(PROFILE_COLUMNS)))
+    table[..., 0] = np.arange(n_lines)[:, np.newaxis, np.newaxis]
+    table[..., 1] = np.arange(n_z)[np.newaxis, :, np.newaxis]
+    table[..., 2] = s_pts[:, np.newaxis, :]
+    table[..., 3] = x_pts[:, np.newaxis, :]
+    table[..., 4] = y_pts[:, np.newaxis, :]
+    table[..., 5:] = B_pts
+    return table.reshape(-1, len(PROFILE_COLUMNS))
+
+def extract_ovf_profiles(input_filename: str, size_x: float, size_y: float, lines, n_points=PROFILE_POINTS):
+    _, B = oo.read_ovf_array(input_filename)
+    return extract_profiles(B, size_x, size_y, lines, n_points)
+
+def read_lines_file(filename: str):
+    # line segments (x0, y0, x1, y1) per row of a .npy array or a .csv / whitespace separated text file
+    if filename.endswith('.npy'):
+        return np.atleast_2d(np.load(filename))
+    with open(filename, 'r') as f:
+        return np.atleast_2d(np.loadtxt((line.replace(',', ' ') for line in f), comments='#'))
+
+def write_profiles(output_filename: str, table) -> None:
+    # the whole table in one write: .npy (float64 rows) or .csv with a header line
+    if output_filename.endswith('.npy'):
+        np.save(output_filename, table)
+        return
+
+    formats = ['%d', '%d'] + ['%.9e'] * (len(PROFILE_COLUMNS) - 2)
+    header = ",".join(f"{column} ({unit})" if unit else column for column, unit in zip(PROFILE_COLUMNS, ('', '', 'm', 'm', 'm', 'T', 'T', 'T')))
+    np.savetxt(output_filename, table, fmt=formats, delimiter=',', header=header, comments='')
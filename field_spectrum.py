@@ -0,0 +1,154 @@
+import os
+import json
+
+import numpy as np
+
+import calc_field as cf
+
+# spatial FFTs of the field: 'x' / 'y' along one propagation axis, 'xy' over the plane
+SPECTRUM_AXES = ('x', 'y', 'xy')
+SPECTRUM_WINDOWS = ('none', 'hann', 'hamming', 'blackman')
+# columns of the 1D spectrum table
+SPECTRUM_COLUMNS = ('z', 'k', 'Bx', 'By', 'Bz')
+
+def get_window(window: str, n: int):
+    if window == 'none':
+        return np.ones(n)
+    return {'hann': np.hanning, 'hamming': np.hamming, 'blackman': np.blackman}[window](n)
+
+def get_wavenumbers(n: int, cell: float, zero_pad: int = 1, one_sided=True):
+    # angular wavenumbers [rad/m] of an FFT over n cells zero-padded to n * zero_pad;
+    # two-sided ones in ascending order (fftshift)
+    n_pad = n * zero_pad
+    if one_sided:
+        return 2 * np.pi * np.fft.rfftfreq(n_pad, cell)
+    return 2 * np.pi * np.fft.fftshift(np.fft.fftfreq(n_pad, cell))
+
+def get_spectrum_filename(output_filename: str, axis: str) -> str:
+    # <output stem>_spectrum_kx.csv / _ky.csv / _kxky.npz next to the output
+    root = os.path.splitext(output_filename)[0]
+    if axis == 'xy':
+        return f"{root}_spectrum_kxky.npz"
+    return f"{root}_spectrum_k{axis}.csv"
+
+def get_spectrum_info_filename(output_filename: str) -> str:
+    # <output stem>_spectrum.json: field fingerprint, window and zero-padding of each written spectrum
+    return f"{os.path.splitext(output_filename)[0]}_spectrum.json"
+
+def get_spectrum_info(fingerprint: str, window: str, zero_pad: int):
+    return {'fingerprint': fingerprint, 'window': window, 'zero_pad': zero_pad}
+
+def read_spectrum_info(output_filename: str):
+    # {axis: info} of the spectra written next to the output ({} if there are none)
+    try:
+        with open(get_spectrum_info_filename(output_filename), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def is_spectrum_up_to_date(output_filename: str, fingerprint: str, axes, window: str, zero_pad: int) -> bool:
+    # every spectrum of axes exists and was computed from this field with this window and zero-padding
+    spectrum_info = read_spectrum_info(output_filename)
+    return all(os.path.exists(get_spectrum_filename(output_filename, axis)) and spectrum_info.get(axis) == get_spectrum_info(fingerprint, window, zero_pad) for axis in axes)
+
+class FieldSpectrum:
+    # Excitation spectrum |B(k)| of the field, accumulated slice by slice while the slices are generated,
+    # so the field is never read back from the output. Each add() transforms the three components of a slice
+    # in one batched real FFT per axis. Amplitudes approximate the continuous Fourier transform
+    # (cell size times the sum): along 'x' / 'y' [T m] as the RMS over the transverse rows, over 'xy' [T m^2] per slice.
+    # Without a window this is exact for fields that decay inside the sample; a window suppresses the leakage of
+    # fields that do not, and is corrected for its coherent gain (amplitudes of periodic fields are kept).
+    def __init__(self, n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, axes=('x',), window='none', zero_pad=1):
+        self.n_x, self.n_y, self.n_z = n_x, n_y, n_z
+        self.cell_x, self.cell_y = size_x / n_x, size_y / n_y
+        self.axes = tuple(axes)
+        self.window = window
+        self.zero_pad = zero_pad
+
+        self.window_x = get_window(window, n_x)
+        self.window_y = get_window(window, n_y)
+        self.k_x = get_wavenumbers(n_x, self.cell_x, zero_pad)
+        self.k_y = get_wavenumbers(n_y, self.cell_y, zero_pad)
+        self.spectra = {}
+        if 'x' in self.axes:
+            self.spectra['x'] = np.zeros((n_z, len(self.k_x), 3))
+        if 'y' in self.axes:
+            self.spectra['y'] = np.zeros((n_z, len(self.k_y), 3))
+        if 'xy' in self.axes:
+            # float32 like the field itself: this one is as large as the padded mesh
+            self.k_y_full = get_wavenumbers(n_y, self.cell_y, zero_pad, one_sided=False)
+            self.spectra['xy'] = np.zeros((n_z, len(self.k_y_full), len(self.k_x), 3), dtype=np.float32)
+
+    def add(self, step: int, B_pump_x, B_pump_y, B_pump_z):
+        B_pump = np.stack((B_pump_x, B_pump_y, B_pump_z))  # (3, n_y, n_x)
+        if 'x' in self.spectra:
+            B_k = np.fft.rfft(B_pump * self.window_x, n=self.n_x * self.zero_pad, axis=2)
+            B_k = np.sqrt(np.mean(np.abs(B_k)**2, axis=1)) * self.cell_x / np.mean(self.window_x)
+            self.spectra['x'][step] = B_k.T
+        if 'y' in self.spectra:
+            B_k = np.fft.rfft(B_pump * self.window_y[:, np.newaxis], n=self.n_y * self.zero_pad, axis=1)
+            B_k = np.sqrt(np.mean(np.abs(B_k)**2, axis=2)) * self.cell_y / np.mean(self.window_y)
+            self.spectra['y'][step] = B_k.T
+        if 'xy' in self.spectra:
+            window_xy = np.outer(self.window_y, self.window_x)
+            B_k = np.fft.rfft2(B_pump * window_xy, s=(self.n_y * self.zero_pad, self.n_x * self.zero_pad), axes=(1, 2))
+            B_k = np.abs(np.fft.fftshift(B_k, axes=1)) * self.cell_x * self.cell_y / np.mean(window_xy)
+            self.spectra['xy'][step] = np.moveaxis(B_k, 0, -1)
+        return self
+
+    def get_table(self, axis: str):
+        # rows (z, k, |Bx(k)|, |By(k)|, |Bz(k)|) ordered by slice and wavenumber
+        spectrum = self.spectra[axis]
+        k_arr = self.k_x if axis == 'x' else self.k_y
+        table = np.empty((self.n_z, len(k_arr), len(SPECTRUM_COLUMNS)))
+        table[..., 0] = np.arange(self.n_z)[:, np.newaxis]
+        table[..., 1] = k_arr[np.newaxis, :]
+        table[..., 2:] = spectrum
+        return table.reshape(-1, len(SPECTRUM_COLUMNS))
+
+    def write(self, output_filename: str, fingerprint=None, figure=True):
+        # tables (and figures) of every axis next to the output; returns the written paths.
+        # fingerprint: of the field, recorded with the window and zero-padding for is_spectrum_up_to_date
+        paths = []
+        spectrum_info = read_spectrum_info(output_filename)
+        for axis in self.axes:
+            filename = get_spectrum_filename(output_filename, axis)
+            if axis == 'xy':
+                np.savez(filename, k_x=self.k_x, k_y=self.k_y_full, B_k=self.spectra['xy'], window=self.window, zero_pad=self.zero_pad)
+            else:
+                header = ",".join(f"{column} ({unit})" if unit else column for column, unit in zip(SPECTRUM_COLUMNS, ('', 'rad/m', 'T m', 'T m', 'T m')))
+                np.savetxt(filename, self.get_table(axis), fmt=['%d'] + ['%.9e'] * (len(SPECTRUM_COLUMNS) - 1), delimiter=',', header=header, comments='')
+            paths.append(filename)
+            if figure:
+                paths.append(self.save_figure(axis, os.path.splitext(filename)[0] + ".png"))
+            spectrum_info[axis] = get_spectrum_info(fingerprint, self.window, self.zero_pad)
+
+        with open(get_spectrum_info_filename(output_filename), 'w') as f:
+            json.dump(spectrum_info, f, indent=2)
+        return paths
+
+    def save_figure(self, axis: str, filename: str) -> str:
+        # |Bx(k)|, |By(k)|, |Bz(k)| maps: wavenumber against z-slice for 'x' / 'y', kx against ky of slice 0 for 'xy'
+        _, fig, axes, caxes, shrink = cf.figure_size_setting(3, pyplot=False)
+        cmap = cf.gen_cmap_rgb(cf.FIELD_CMAP_COLORS)
+        unit = "T m^2" if axis == 'xy' else "T m"
+        for i, (ax, cax) in enumerate(zip(axes, caxes)):
+            if axis == 'xy':
+                B_k = self.spectra['xy'][0, :, :, i]
+                im = ax.pcolormesh(self.k_x * 1e-6, self.k_y_full * 1e-6, B_k, cmap=cmap, shading='nearest', rasterized=True)
+                ax.set_xlabel('kx (rad/µm)', labelpad=0, fontsize=7)
+                ax.set_ylabel('ky (rad/µm)', labelpad=1, fontsize=7)
+            else:
+                k_arr = self.k_x if axis == 'x' else self.k_y
+                B_k = self.spectra[axis][:, :, i]
+                im = ax.pcolormesh(k_arr * 1e-6, np.arange(self.n_z), B_k, cmap=cmap, shading='nearest', rasterized=True)
+                ax.set_xlabel(f'k{axis} (rad/µm)', labelpad=0, fontsize=7)
+                ax.set_ylabel('Z-slice', labelpad=1, fontsize=7)
+
+            B_k_exp, B_k_unit = cf.get_si_prefix(np.max(B_k), unit)
+            im.set_array(B_k / (10**B_k_exp))
+            im.set_clim(0, np.max(B_k) / (10**B_k_exp) if np.max(B_k) > 0 else 1)
+            cbar = fig.colorbar(im, cax=cax, shrink=shrink)
+            cbar.set_label(f'|{["Bx", "By", "Bz"][i]}(k)| ({B_k_unit})', labelpad=2, fontsize=7)
+        fig.savefig(filename, dpi=300, bbox_inches='tight')
+        return filename
@@ -0,0 +1,103 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import output_ovf as oo
+import calc_field as cf
+from conditions import load_condition_file
+
+# z-slices rendered per pool task: enough to amortize the figure template, few enough to balance the workers
+FIGURE_SLICES_PER_TASK = 8
+
+def get_output_engine(output_path: str, n, size, ant_dicts):
+    # engine preset the output was written with (its header fingerprint matches the conditions with that preset);
+    # None if the output is missing or stale
+    fingerprint = oo.read_ovf_fingerprint(output_path)
+    if fingerprint is None:
+        return None
+    for engine, field_kwargs in cf.ENGINE_PRESETS.items():
+        if cf.get_condition_fingerprint(*n, *size, ant_dicts, **field_kwargs) == fingerprint:
+            return engine
+    return None
+
+def get_figure_jobs(inputs, size=None, dir_path=None, engine='rotate'):
+    # One job per input. Condition files (.json) are rendered from their output if it is up to date with any engine
+    # preset, and recomputed slice by slice with engine otherwise; OVF files (.ovf / .ovfz) need the sample size,
+    # which they do not store.
+    jobs = []
+    for input_filename in inputs:
+        if input_filename.endswith('.json'):
+            condition = load_condition_file(input_filename, dir_path)
+            n = (condition['n_x'], condition['n_y'], condition['n_z'])
+            job_size = (condition['size_x'], condition['size_y'], condition['size_z'])
+            output_path = condition['output_path']
+            up_to_date = get_output_engine(output_path, n, job_size, condition['ant_dicts']) is not None
+            if not up_to_date:
+                print(f"{output_path} is missing or not up to date: the field is computed with '{engine}'")
+            jobs.append({
+                'ovf_filename': output_path if up_to_date else None,
+                'ant_dicts': None if up_to_date else condition['ant_dicts'],
+                'engine': engine,
+                'n': n,
+                'size': job_size,
+                'outname': os.path.splitext(os.path.basename(output_path))[0]
+            })
+        else:
+            if size is None:
+                raise ValueError(f"{input_filename}: the sample size of an OVF file must be given")
+            header_info = oo.read_ovf_header(input_filename)
+            jobs.append({
+                'ovf_filename': input_filename,
+                'ant_dicts': None,
+                'engine': None,
+                'n': (header_info['n_x'], header_info['n_y'], header_info['n_z']),
+                'size': tuple(size),
+                'outname': os.path.splitext(os.path.basename(input_filename))[0]
+            })
+    return jobs
+
+def init_figure_worker():
+    # workers only write files: no GUI backend, and no font lookup warnings per process
+    import logging
+    import matplotlib
+
+    matplotlib.use('Agg')
+    logging.getLogger('matplotlib.font_manager').setLevel(logging.ERROR)
+
+def render_figure_task(job, steps, output_dir_path: str, formats, color_scale: str):
+    # figures of the given z-slices of one job from one template; returns the written paths
+    n_x, n_y, n_z = job['n']
+    size_x, size_y, size_z = job['size']
+    x_arr, y_arr = cf.get_cell_centers(n_x, size_x), cf.get_cell_centers(n_y, size_y)
+
+    if job['ovf_filename'] is not None:
+        _, read_slice = oo.get_ovf_slice_reader(job['ovf_filename'])
+
+    B_pump_lists = ([], [], [])
+    for step in steps:
+        if job['ovf_filename'] is not None:
+            B_slice = read_slice(step)
+            B_pump = (B_slice[:, :, 0], B_slice[:, :, 1], B_slice[:, :, 2])
+        else:
+            B_pump = cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, job['ant_dicts'], current_step=step, **cf.ENGINE_PRESETS[job['engine']])
+        for B_pump_list, B_c in zip(B_pump_lists, B_pump):
+            B_pump_list.append(B_c)
+
+    return cf.export_field_figures(x_arr, y_arr, *B_pump_lists, output_dir_path, job['outname'], steps, formats, color_scale)
+
+def export_figures(inputs, output_dir_path: str, size=None, workers=None, formats=('png', 'pdf'), slices_per_task=FIGURE_SLICES_PER_TASK, color_scale='map', dir_path=None, engine='rotate'):
+    # PNG / PDF figures of every z-slice of every input, named <output stem>_z<step>.<format>,
+    # rendered by a pool of worker processes (matplotlib draws on one thread per process); returns the written paths.
+    # engine: preset for condition files without an up-to-date output
+    os.makedirs(output_dir_path, exist_ok=True)
+    tasks = []
+    for job in get_figure_jobs(inputs, size, dir_path, engine):
+        n_z = job['n'][2]
+        for z_begin in range(0, n_z, slices_per_task):
+            tasks.append((job, list(range(z_begin, min(z_begin + slices_per_task, n_z)))))
+
+    paths = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_figure_worker) as executor:
+        futures = [executor.submit(render_figure_task, job, steps, output_dir_path, formats, color_scale) for job, steps in tasks]
+        for future in futures:
+            paths += future.result()
+    return paths
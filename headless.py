@@ -0,0 +1,221 @@
+import os
+import sys
+import argparse
+
+import output_ovf as oo
+import calc_field as cf
+import resample_ovf as ro
+import import_field as imf
+import work_queue as wq
+import oracle
+import planner
+import figure_export as fe
+import field_profile as fp
+import field_spectrum as fs
+from conditions import load_condition_file
+
+def run_condition(condition_filename: str, force=False, dir_path=None, engine='rotate', verify=0, export_hdf5=False, dry_run=False, memory_budget=None, spectrum_axes=(), spectrum_window='none', spectrum_zero_pad=1) -> bool:
+    # generate the output of one condition file; returns False if it was already up to date.
+    # engine: name of a preset of cf.ENGINE_PRESETS; verify: z-slices recomputed with the oracle reference;
+    # export_hdf5: also write the analysis HDF5 next to the OVF (also enabled by the condition file).
+    # A basis export follows the same plan, engine and up-to-date check, but has no OVF to verify or analyse.
+    # The run follows the preflight plan for memory_budget [bytes] (default: half the physical memory);
+    # dry_run: only print the plan.
+    # spectrum_axes: also write the k-space spectrum of the field (fs.SPECTRUM_AXES), computed from the slices
+    # while they are generated, with the given window and zero-padding factor.
+    condition = load_condition_file(condition_filename, dir_path)
+    n_x, n_y, n_z = condition['n_x'], condition['n_y'], condition['n_z']
+    size_x, size_y, size_z = condition['size_x'], condition['size_y'], condition['size_z']
+    ant_dicts = condition['ant_dicts']
+    output_path = condition['output_path']
+
+    if condition['export_basis'] and (verify > 0 or export_hdf5 or spectrum_axes):
+        # these check or analyse the OVF of the field, which a basis export does not write
+        raise ValueError(f"{condition_filename}: --verify, --hdf5 and --spectrum do not apply to a basis export")
+
+    export_hdf5 = (export_hdf5 or condition['export_hdf5']) and not condition['export_basis']
+    plan = planner.plan_run(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, engine, os.path.splitext(output_path)[1], export_hdf5, memory_budget)
+    if dry_run:
+        print(f"{output_path}: {planner.format_plan(plan)}")
+        return False
+    for note in plan['notes']:
+        print(f"{output_path}: {note}")
+
+    engine = plan['engine']
+    field_kwargs = cf.ENGINE_PRESETS[engine]
+    if condition['export_basis']:
+        fingerprint = cf.get_condition_fingerprint(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, antenna_keys=cf.BASIS_ANTENNA_KEYS, **field_kwargs)
+        if not force and oo.is_basis_up_to_date(output_path, fingerprint):
+            print(f"{oo.get_basis_text_filename(output_path)} is up to date (skipped)")
+            return False
+        expressions, coef_arr = cf.get_basis_terms(ant_dicts)
+        raw_basis_list = [cf.get_raw_basis_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, coef_arr, step, memory_budget=plan['tile_memory_budget'], **field_kwargs) for step in range(n_z)]
+        basis_list, basis_expressions = cf.reduce_basis_fields(raw_basis_list, expressions)
+        for line in oo.write_basis_files(output_path, n_x, n_y, n_z, basis_list, basis_expressions, oo.get_fingerprint_desc(fingerprint)):
+            print(line)
+        return True
+
+    fingerprint = cf.get_condition_fingerprint(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, **field_kwargs)
+    analysis_path = oo.get_analysis_filename(output_path) if export_hdf5 else None
+    if not force and oo.read_ovf_fingerprint(output_path) == fingerprint and (analysis_path is None or oo.read_hdf5_fingerprint(analysis_path) == fingerprint) and fs.is_spectrum_up_to_date(output_path, fingerprint, spectrum_axes, spectrum_window, spectrum_zero_pad):
+        print(f"{output_path} is up to date (skipped)")
+        return False
+
+    spectrum = fs.FieldSpectrum(n_x, n_y, n_z, size_x, size_y, spectrum_axes, spectrum_window, spectrum_zero_pad) if spectrum_axes else None
+    analysis_attrs = {'fingerprint': fingerprint, 'engine': engine, 'ant_dicts': ant_dicts}
+    for step in range(n_z):
+        B_pump_x_array, B_pump_y_array, B_pump_z_array = cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, current_step=step, memory_budget=plan['tile_memory_budget'], **field_kwargs)
+        if spectrum is not None:
+            spectrum.add(step, B_pump_x_array, B_pump_y_array, B_pump_z_array)
+        oo.write_ovf_step(step, output_path, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array, oo.get_fingerprint_desc(fingerprint), analysis_path, (size_x, size_y, size_z), analysis_attrs)
+    print(f"{output_path} written" + ("" if analysis_path is None else f" (and {analysis_path})"))
+    if spectrum is not None:
+        print("spectrum written: " + ", ".join(spectrum.write(output_path, fingerprint)))
+
+    if verify > 0:
+        reference = oracle.get_verify_reference(engine, ant_dicts)
+        passed, steps, errors = oracle.verify_output(output_path, n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, engine, reference, n_slices=verify)
+        print(f"verified slices {steps} against '{reference}': {oracle.format_errors(errors)} ({'ok' if passed else 'REGRESSION'})")
+        if not passed:
+            raise RuntimeError(f"{output_path}: '{engine}' exceeds the oracle tolerances against '{reference}'")
+    return True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate OVF files from condition files saved by the GUI.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="generate the outputs of condition files")
+    run_parser.add_argument('conditions', nargs='+', help="condition files (cond_*.json)")
+    run_parser.add_argument('--force', action='store_true', help="recompute even if the output already matches the conditions")
+    run_parser.add_argument('--dir', default=None, help="output directory (default: dir_str of the condition file if it exists, else its directory)")
+    run_parser.add_argument('--engine', default='rotate', choices=list(cf.ENGINE_PRESETS), help="engine preset")
+    run_parser.add_argument('--hdf5', action='store_true', help="also write the chunked analysis HDF5 (.h5) next to the OVF")
+    run_parser.add_argument('--dry-run', action='store_true', help="only print the predicted runtime, memory, output size and the chosen engine")
+    run_parser.add_argument('--memory-budget', type=float, default=None, metavar='BYTES', help="memory the run may use (default: half the physical memory)")
+    run_parser.add_argument('--spectrum', nargs='+', default=[], choices=fs.SPECTRUM_AXES, help="also write the k-space spectrum |B(k)| (table and figure): FFT along x and / or y, or 2D over the plane (xy)")
+    run_parser.add_argument('--window', default='none', choices=fs.SPECTRUM_WINDOWS, help="window applied before the spectrum FFT (for fields that do not decay inside the sample)")
+    run_parser.add_argument('--zero-pad', type=int, default=1, metavar='FACTOR', help="zero-pad the spectrum FFT to FACTOR times the cell count")
+    run_parser.add_argument('--verify', type=int, default=0, metavar='N', help="recompute N random z-slices with the reference engine and check the oracle tolerances")
+
+    resample_parser = subparsers.add_parser('resample', help="resample an existing OVF onto a different mesh")
+    resample_parser.add_argument('input', help="source OVF file (.ovf or .ovfz)")
+    resample_parser.add_argument('output', help="target OVF file (.ovf or .ovfz)")
+    resample_parser.add_argument('--n', type=int, nargs=3, required=True, metavar=('N_X', 'N_Y', 'N_Z'), help="cell counts of the target mesh")
+    resample_parser.add_argument('--size', type=float, nargs=3, default=None, metavar=('SIZE_X', 'SIZE_Y', 'SIZE_Z'), help="sample size of the source mesh [m]")
+    resample_parser.add_argument('--new-size', type=float, nargs=3, default=(None, None, None), metavar=('SIZE_X', 'SIZE_Y', 'SIZE_Z'), help="sample size of the target mesh [m] (default: source size)")
+    resample_parser.add_argument('--check', default=None, metavar='COND', help="condition file of the source; its antennas are used for an analytic spot-check and its sample size if --size is omitted")
+
+    import_parser = subparsers.add_parser('import', help="import an external field map (FEM export) onto the mumax3 mesh")
+    import_parser.add_argument('input', help="field map (.csv / .txt / .npy rows x, y, [z,] Bx, By, Bz, or .npz grid)")
+    import_parser.add_argument('output', help="target OVF file (.ovf or .ovfz)")
+    import_parser.add_argument('--n', type=int, nargs=3, required=True, metavar=('N_X', 'N_Y', 'N_Z'), help="cell counts of the target mesh")
+    import_parser.add_argument('--size', type=float, nargs=3, required=True, metavar=('SIZE_X', 'SIZE_Y', 'SIZE_Z'), help="sample size of the target mesh [m]")
+    import_parser.add_argument('--angle', type=float, default=0., help="in-plane rotation of the map [deg]")
+    import_parser.add_argument('--offset', type=float, nargs=3, default=(0., 0., 0.), metavar=('X', 'Y', 'Z'), help="position of the map origin in the sample [m]")
+    import_parser.add_argument('--length-scale', type=float, default=1., help="factor from the map coordinates to m")
+    import_parser.add_argument('--field-scale', type=float, default=1., help="factor from the map field to T")
+
+    submit_parser = subparsers.add_parser('submit', help="split condition files into z-slice tasks of a shared work queue")
+    submit_parser.add_argument('queue', help="queue directory on a filesystem shared by all workers")
+    submit_parser.add_argument('conditions', nargs='+', help="condition files (cond_*.json)")
+    submit_parser.add_argument('--slices-per-task', type=int, default=None, help="z-slices computed per task (default: planned for tasks of about a minute)")
+    submit_parser.add_argument('--force', action='store_true', help="recompute even if the output already matches the conditions")
+    submit_parser.add_argument('--engine', default='rotate', choices=list(cf.ENGINE_PRESETS), help="engine preset (the preflight plan may fall back to 'direct' as in 'run')")
+    submit_parser.add_argument('--dir', default=None, help="output directory (default: dir_str of the condition file if it exists, else its directory)")
+    submit_parser.add_argument('--local', type=int, default=0, metavar='N', help="also run N worker processes on this host and wait for them")
+    submit_parser.add_argument('--lease-timeout', type=float, default=wq.LEASE_TIMEOUT, help="seconds after which a task of a silent worker is handed out again")
+
+    worker_parser = subparsers.add_parser('worker', help="compute tasks of a work queue and merge finished outputs")
+    worker_parser.add_argument('queue', help="queue directory")
+    worker_parser.add_argument('--lease-timeout', type=float, default=wq.LEASE_TIMEOUT, help="seconds after which a task of a silent worker is handed out again")
+    worker_parser.add_argument('--wait', action='store_true', help="keep waiting for new tasks when the queue is empty")
+
+    merge_parser = subparsers.add_parser('merge', help="assemble the outputs of a work queue whose slices are complete")
+    merge_parser.add_argument('queue', help="queue directory")
+    merge_parser.add_argument('--lease-timeout', type=float, default=wq.LEASE_TIMEOUT, help="seconds after which the merge of a silent process is taken over")
+
+    figures_parser = subparsers.add_parser('figures', help="export PNG / PDF field figures of every z-slice in parallel")
+    figures_parser.add_argument('inputs', nargs='+', help="condition files (cond_*.json) or OVF files (.ovf / .ovfz, need --size)")
+    figures_parser.add_argument('--out', required=True, help="directory the figures are written to")
+    figures_parser.add_argument('--size', type=float, nargs=3, default=None, metavar=('SIZE_X', 'SIZE_Y', 'SIZE_Z'), help="sample size of the OVF inputs [m]")
+    figures_parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per CPU)")
+    figures_parser.add_argument('--formats', nargs='+', default=['png', 'pdf'], choices=['png', 'pdf'], help="figure formats")
+    figures_parser.add_argument('--slices-per-task', type=int, default=fe.FIGURE_SLICES_PER_TASK, help="z-slices rendered per worker task")
+    figures_parser.add_argument('--color-scale', default='map', choices=['map', 'print'], help="color limits and titles of the check window ('map') or of print_field_figure ('print')")
+    figures_parser.add_argument('--dir', default=None, help="output directory of the condition files (default: dir_str of the condition file if it exists, else its directory)")
+    figures_parser.add_argument('--engine', default='rotate', choices=list(cf.ENGINE_PRESETS), help="engine preset for condition files whose output is missing or not up to date")
+
+    profile_parser = subparsers.add_parser('profile', help="extract Bx, By, Bz along line segments through every z-slice")
+    profile_parser.add_argument('input', help="condition file (cond_*.json) or OVF file (.ovf / .ovfz, needs --size)")
+    profile_parser.add_argument('output', help="profile table (.csv or .npy) with the columns " + ", ".join(fp.PROFILE_COLUMNS))
+    profile_parser.add_argument('--line', type=float, nargs=4, action='append', default=[], metavar=('X0', 'Y0', 'X1', 'Y1'), help="line segment in sample coordinates [m] (repeatable)")
+    profile_parser.add_argument('--lines', default=None, metavar='FILE', help="line segments, one (x0, y0, x1, y1) row each (.csv / .txt / .npy)")
+    profile_parser.add_argument('--points', type=int, default=fp.PROFILE_POINTS, help="points sampled along each line")
+    profile_parser.add_argument('--size', type=float, nargs=2, default=None, metavar=('SIZE_X', 'SIZE_Y'), help="sample size of an OVF input [m]")
+    profile_parser.add_argument('--dir', default=None, help="output directory of the condition file (default: dir_str of the condition file if it exists, else its directory)")
+    profile_parser.add_argument('--engine', default='rotate', choices=list(cf.ENGINE_PRESETS), help="engine preset if the output of the condition file is missing or not up to date")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        if args.zero_pad < 1:
+            parser.error("--zero-pad must be at least 1")
+        for condition_filename in args.conditions:
+            run_condition(condition_filename, args.force, args.dir, args.engine, args.verify, args.hdf5, args.dry_run, args.memory_budget, args.spectrum, args.window, args.zero_pad)
+    elif args.command == 'resample':
+        ant_dicts = None
+        size = args.size
+        if args.check is not None:
+            condition = load_condition_file(args.check)
+            ant_dicts = condition['ant_dicts']
+            if size is None:
+                size = (condition['size_x'], condition['size_y'], condition['size_z'])
+        if size is None:
+            parser.error("resample needs --size or --check")
+
+        report = ro.resample_ovf_file(args.input, args.output, *size, *args.n, *args.new_size, ant_dicts=ant_dicts)
+        print(f"{args.output} written ({report['clamped_cells']} cells outside the source mesh)")
+        if 'relative_error' in report:
+            print(f"spot-check over {report['checked_cells']} cells: max error = {report['max_error']:.3e} T ({report['relative_error']:.3e} of max |B|)")
+    elif args.command == 'import':
+        report = imf.import_field_file(args.input, args.output, *args.n, *args.size, args.angle, args.offset, args.length_scale, args.field_scale)
+        print(f"{args.output} written from {report['source_points']} points ({report['outside_cells']} cells outside the map set to zero)")
+    elif args.command == 'submit':
+        wq.submit_conditions(args.queue, args.conditions, args.slices_per_task, args.force, args.dir, args.engine)
+        if args.local > 0:
+            wq.run_local_workers(args.queue, args.local, args.lease_timeout)
+    elif args.command == 'worker':
+        wq.run_worker(args.queue, args.lease_timeout, wait=args.wait)
+    elif args.command == 'figures':
+        paths = fe.export_figures(args.inputs, args.out, args.size, args.workers, args.formats, args.slices_per_task, args.color_scale, args.dir, args.engine)
+        print(f"{len(paths)} figures written to {args.out}")
+    elif args.command == 'profile':
+        lines = list(args.line)
+        if args.lines is not None:
+            lines += fp.read_lines_file(args.lines).tolist()
+        if len(lines) == 0:
+            parser.error("profile needs --line or --lines")
+
+        if args.input.endswith('.json'):
+            condition = load_condition_file(args.input, args.dir)
+            n = (condition['n_x'], condition['n_y'], condition['n_z'])
+            size = (condition['size_x'], condition['size_y'], condition['size_z'])
+            # the written output, whichever engine preset it was computed with
+            if fe.get_output_engine(condition['output_path'], n, size, condition['ant_dicts']) is not None:
+                table = fp.extract_ovf_profiles(condition['output_path'], *size[:2], lines, args.points)
+            else:
+                print(f"{condition['output_path']} is missing or not up to date: the field is computed with '{args.engine}'")
+                B_pump = cf.get_magnetic_field(*n, *size, condition['ant_dicts'], **cf.ENGINE_PRESETS[args.engine])
+                table = fp.extract_profiles(fp.get_field_array(*B_pump), *size[:2], lines, args.points)
+        else:
+            if args.size is None:
+                parser.error("profile of an OVF file needs --size")
+            table = fp.extract_ovf_profiles(args.input, *args.size, lines, args.points)
+        fp.write_profiles(args.output, table)
+        print(f"{args.output} written ({len(lines)} lines, {table.shape[0]} rows)")
+    elif args.command == 'merge':
+        print(f"{wq.merge_ready_jobs(args.queue, args.lease_timeout)} outputs merged")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
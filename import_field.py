@@ -0,0 +1,177 @@
+import os
+import itertools
+import numpy as np
+
+import output_ovf as oo
+import calc_field as cf
+
+# rows of a text field map parsed at once
+IMPORT_CHUNK_ROWS = 2**20
+# target cells interpolated at once
+IMPORT_CHUNK_POINTS = 2**20
+# coordinates closer than this fraction of the axis span are the same grid line
+GRID_MERGE_TOL = 1e-9
+
+def iter_text_rows(filename: str, chunk_rows=IMPORT_CHUNK_ROWS):
+    # numeric rows of a CSV / whitespace separated text export, chunk by chunk as 2D arrays;
+    # comment lines ('#', '%' as written by COMSOL) and a non-numeric header line are skipped
+    def is_data(line):
+        line = line.strip()
+        return line != "" and line[0] not in "#%" and (line[0].isdigit() or line[0] in "+-.")
+
+    with open(filename, 'r') as f:
+        lines = (line.replace(',', ' ') for line in f if is_data(line))
+        while True:
+            chunk = list(itertools.islice(lines, chunk_rows))
+            if not chunk:
+                break
+            yield np.loadtxt(chunk, dtype=np.float64, ndmin=2)
+
+def iter_field_map_rows(filename: str, chunk_rows=IMPORT_CHUNK_ROWS):
+    # rows (x, y, [z,] Bx, By, Bz) of a .csv / .txt export or of an (N, 5|6) .npy array
+    if filename.endswith('.npy'):
+        rows = np.load(filename, mmap_mode='r')
+        if rows.ndim != 2:
+            raise ValueError(f"{filename}: expected an (N, 5) or (N, 6) array, got shape {rows.shape}")
+        for start in range(0, rows.shape[0], chunk_rows):
+            yield np.asarray(rows[start:start + chunk_rows], dtype=np.float64)
+    else:
+        yield from iter_text_rows(filename, chunk_rows)
+
+def merge_grid_axis(values):
+    # sorted unique coordinates with round-off duplicates merged
+    values = np.unique(values)
+    if len(values) < 2:
+        return values
+    keep = np.concatenate(([True], np.diff(values) > GRID_MERGE_TOL * (values[-1] - values[0])))
+    return values[keep]
+
+def get_grid_index(axis, values):
+    # index of each coordinate on a merged grid axis
+    if len(axis) < 2:
+        return np.zeros(len(values), dtype=np.intp)
+    tol = GRID_MERGE_TOL * (axis[-1] - axis[0])
+    return np.clip(np.searchsorted(axis, values - tol), 0, len(axis) - 1)
+
+def read_field_map(filename: str, length_scale=1., field_scale=1., chunk_rows=IMPORT_CHUNK_ROWS):
+    # Read a field map sampled on a rectilinear grid (spacing may be non-uniform).
+    # .npz: arrays 'x', 'y', optional 'z' and 'B' of shape (n_z, n_y, n_x, 3) or (n_y, n_x, 3).
+    # .csv / .txt / .npy: one row per grid point, columns x, y, [z,] Bx, By, Bz in any order of points.
+    # Row files are read twice in chunks (grid axes, then values), so the point list is never held in memory.
+    # length_scale, field_scale: factors to m and T (e.g. 1e-6 for coordinates in um).
+    # Returns (x, y, z, B) with B of shape (3, n_z, n_y, n_x) in float32 (each component contiguous
+    # for the resampling); z is None for a 2D map.
+    if filename.endswith('.npz'):
+        with np.load(filename) as data:
+            x, y = np.asarray(data['x'], dtype=np.float64), np.asarray(data['y'], dtype=np.float64)
+            z = np.asarray(data['z'], dtype=np.float64) * length_scale if 'z' in data else None
+            B = np.asarray(data['B'], dtype=np.float32) * np.float32(field_scale)
+        if B.ndim == 3:
+            B = B[np.newaxis]
+        if B.shape[1:] != (len(y), len(x), 3) or (z is not None and B.shape[0] != len(z)):
+            raise ValueError(f"{filename}: B of shape {B.shape} does not match the coordinate arrays")
+        return x * length_scale, y * length_scale, z, np.ascontiguousarray(np.moveaxis(B, -1, 0))
+
+    # first pass: grid lines of each axis
+    n_cols = None
+    axes = None
+    n_rows = 0
+    for rows in iter_field_map_rows(filename, chunk_rows):
+        if n_cols is None:
+            n_cols = rows.shape[1]
+            if n_cols not in (5, 6):
+                raise ValueError(f"{filename}: expected 5 (x, y, Bx, By, Bz) or 6 (x, y, z, Bx, By, Bz) columns, got {n_cols}")
+            axes = [np.empty(0)] * (n_cols - 3)
+        axes = [merge_grid_axis(np.concatenate((axis, rows[:, i]))) for i, axis in enumerate(axes)]
+        n_rows += rows.shape[0]
+    if n_cols is None:
+        raise ValueError(f"{filename}: no data rows")
+
+    x, y = axes[0], axes[1]
+    z = axes[2] if n_cols == 6 else None
+    n_z = 1 if z is None else len(z)
+    if n_rows != n_z * len(y) * len(x):
+        raise ValueError(f"{filename}: {n_rows} points do not fill the {len(x)}x{len(y)}x{n_z} grid of their coordinates")
+
+    # second pass: values into the grid
+    B = np.zeros((3, n_z, len(y), len(x)), dtype=np.float32)
+    for rows in iter_field_map_rows(filename, chunk_rows):
+        i_z = get_grid_index(z, rows[:, 2]) if z is not None else 0
+        i_y, i_x = get_grid_index(y, rows[:, 1]), get_grid_index(x, rows[:, 0])
+        for c in range(3):
+            B[c, i_z, i_y, i_x] = rows[:, n_cols - 3 + c] * field_scale
+
+    return x * length_scale, y * length_scale, None if z is None else z * length_scale, B
+
+def get_fractional_index(axis, values):
+    # position of values on a (possibly non-uniform) grid axis in index units; -1 outside the axis.
+    # A single grid line has no extent and is taken as constant along its axis.
+    if len(axis) == 1:
+        return np.zeros_like(values)
+    return np.interp(values, axis, np.arange(len(axis), dtype=np.float64), left=-1., right=-1.)
+
+def resample_field_map(x, y, z, B, x_pts, y_pts, z_value, angle=0., offset=(0., 0., 0.)):
+    # Field of a map placed in the sample at the given points, in one fused affine resampling pass.
+    # The map is rotated by angle [deg] counterclockwise about its origin and its origin moved to offset;
+    # each sample point is mapped back into the map frame, converted to fractional grid indices and
+    # interpolated (trilinear, bilinear for a 2D map) before the in-plane components are rotated with the map.
+    # Points outside the map get zero field. Returns (Bx, By, Bz, outside) for the points.
+    from scipy.ndimage import map_coordinates
+
+    angle_rad = np.deg2rad(angle)
+    cos_val, sin_val = np.cos(angle_rad), np.sin(angle_rad)
+
+    dx, dy = x_pts - offset[0], y_pts - offset[1]
+    x_map = cos_val * dx + sin_val * dy
+    y_map = -sin_val * dx + cos_val * dy
+
+    i_x = get_fractional_index(x, x_map)
+    i_y = get_fractional_index(y, y_map)
+    if z is None:
+        i_z = np.zeros_like(i_x)
+    else:
+        i_z = get_fractional_index(z, np.full_like(i_x, z_value - offset[2]))
+    outside = (i_x < 0) | (i_y < 0) | (i_z < 0)
+
+    coordinates = np.array([i_z, i_y, i_x])
+    B_map = [map_coordinates(B[c], coordinates, order=1, mode='constant', cval=0.) for c in range(3)]
+    for B_c in B_map:
+        B_c[outside] = 0.
+
+    Bx = cos_val * B_map[0] - sin_val * B_map[1]
+    By = sin_val * B_map[0] + cos_val * B_map[1]
+    return Bx, By, B_map[2], outside
+
+def import_field_file(input_filename: str, output_filename: str, n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, angle=0., offset=(0., 0., 0.), length_scale=1., field_scale=1., chunk_points=IMPORT_CHUNK_POINTS):
+    # Import an external field map (FEM export) and write it as an OVF (or .ovfz) on the mumax3 mesh.
+    # offset: position of the map origin in sample coordinates (same frame as ant_position_x / y,
+    # z measured like the cell centers of the z-slices); angle: in-plane rotation [deg].
+    # A 2D map is applied unchanged to every z-slice.
+    # Returns a report with the number of target cells outside the map (set to zero).
+    x, y, z, B = read_field_map(input_filename, length_scale, field_scale)
+
+    x_arr, y_arr, z_arr = cf.get_cell_centers(n_x, size_x), cf.get_cell_centers(n_y, size_y), cf.get_cell_centers(n_z, size_z)
+    x_pts, y_pts = [arr.ravel() for arr in np.meshgrid(x_arr, y_arr)]
+
+    desc_lines = [f"imported from {os.path.basename(input_filename)} ({len(x)}x{len(y)}x{1 if z is None else len(z)} points, rotated {angle:g} deg, origin at {offset[0]:g}, {offset[1]:g}, {offset[2]:g} m)"]
+    report = {
+        'source_points': B[0].size,
+        'outside_cells': 0
+    }
+
+    B_slice = None
+    for step, z_value in enumerate(z_arr):
+        if B_slice is None or z is not None:
+            B_slice = [np.empty(n_x * n_y) for _ in range(3)]
+            outside_cells = 0
+            for start in range(0, n_x * n_y, chunk_points):
+                chunk = slice(start, start + chunk_points)
+                *B_chunk, outside = resample_field_map(x, y, z, B, x_pts[chunk], y_pts[chunk], z_value, angle, offset)
+                for c in range(3):
+                    B_slice[c][chunk] = B_chunk[c]
+                outside_cells += int(np.count_nonzero(outside))
+        report['outside_cells'] += outside_cells
+
+        oo.write_ovf_step(step, output_filename, n_x, n_y, n_z, *[B_c.reshape(n_y, n_x) for B_c in B_slice], desc_lines)
+
+    return report
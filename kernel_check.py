@@ -0,0 +1,323 @@
+import os
+import sys
+import tempfile
+import numpy as np
+
+import calc_field as cf
+import output_ovf as oo
+import oracle
+
+def get_random_antenna(rng):
+    ant_dict = {
+        'ant_width': 10 ** rng.uniform(-7, -5),
+        'ant_thickness': 10 ** rng.uniform(-8, -6.5),
+        'ant_position_x': 0.,
+        'ant_position_y': 0.,
+        'distance': 10 ** rng.uniform(-9, -6),
+        'current_direction': rng.uniform(0, 360),
+        'input_current': rng.uniform(1e-4, 1e-1)
+    }
+    return ant_dict
+
+def check_far_field_tier(n_trials=20, far_field_tol=1e-4, seed=0):
+    # multipole tier against the exact kernel, point by point and stitched into a mesh
+    rng = np.random.default_rng(seed)
+    max_rel_error = 0.
+    passed = True
+
+    for _ in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        ant_width = ant_dict['ant_width']
+        ant_thickness = ant_dict['ant_thickness']
+        z_value = ant_thickness / 2 + ant_dict['distance'] + rng.uniform(0, 1e-6)
+
+        far_distance = cf.get_far_field_distance(ant_width, ant_thickness, z_value, far_field_tol)
+        xy_plane_arr = far_distance * np.concatenate([-np.geomspace(1, 100, 200), np.geomspace(1, 100, 200)])
+
+        B_exact = np.hypot(cf.calc_magnetic_field(xy_plane_arr, z_value, ant_width, ant_thickness, 1., True), cf.calc_magnetic_field(xy_plane_arr, z_value, ant_width, ant_thickness, 1., False))
+        for in_or_out_of_plane in (True, False):
+            error = np.abs(cf.calc_multipole_field(xy_plane_arr, z_value, ant_width, ant_thickness, 1., in_or_out_of_plane) - cf.calc_magnetic_field(xy_plane_arr, z_value, ant_width, ant_thickness, 1., in_or_out_of_plane))
+            rel_error = np.max(error / B_exact)
+            max_rel_error = max(max_rel_error, rel_error)
+            if rel_error > far_field_tol:
+                passed = False
+
+        # stitched mesh: the antenna crosses a sample much wider than the far-field distance
+        size_xy = 8 * far_distance
+        ant_dict['ant_position_x'] = rng.uniform(0, size_xy)
+        ant_dict['ant_position_y'] = rng.uniform(0, size_xy)
+        report = {}
+        B_exact = cf.get_magnetic_field(64, 64, 2, size_xy, size_xy, 2e-7, [ant_dict], current_step=1, engine='direct')
+        B_tiered = cf.get_magnetic_field(64, 64, 2, size_xy, size_xy, 2e-7, [ant_dict], current_step=1, engine='direct', far_field_tol=far_field_tol, report=report)
+        error = max(np.max(np.abs(B_t - B_e)) for B_t, B_e in zip(B_tiered, B_exact))
+        if error > report['error_bound'] * (1 + 1e-6):
+            passed = False
+
+    return passed, max_rel_error
+
+def check_stable_kernel(n_trials=20, seed=0):
+    # stable kernel on meshes whose cell centers lie on conductor edges and faces
+    rng = np.random.default_rng(seed)
+    max_rel_error = 0.
+    passed = True
+
+    for _ in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        ant_width = ant_dict['ant_width']
+        ant_thickness = ant_dict['ant_thickness']
+
+        # edge-aligned offsets and heights, including the conductor faces and its inside
+        xy_plane_arr = np.concatenate([ant_width / 2 * np.arange(-8, 9), rng.uniform(-10, 10, 200) * ant_width])
+        z_values = np.concatenate([ant_thickness / 2 * np.arange(-2, 5), ant_thickness / 2 + rng.uniform(0, 1e-6, 20)])
+        xy_mesh, z_mesh = np.meshgrid(xy_plane_arr, z_values)
+
+        for in_or_out_of_plane in (True, False):
+            B_stable = cf.calc_magnetic_field_stable(xy_mesh, z_mesh, ant_width, ant_thickness, 1., in_or_out_of_plane)
+            if not np.all(np.isfinite(B_stable)):
+                passed = False
+                continue
+
+            # the original kernel where it is finite, and its one-sided limits on the edges
+            with np.errstate(divide='ignore', invalid='ignore'):
+                B_ref = cf.calc_magnetic_field(xy_mesh, z_mesh, ant_width, ant_thickness, 1., in_or_out_of_plane)
+                B_ref_limit = (cf.calc_magnetic_field(xy_mesh + 1e-9 * ant_width, z_mesh + 1e-9 * ant_thickness, ant_width, ant_thickness, 1., in_or_out_of_plane) + cf.calc_magnetic_field(xy_mesh - 1e-9 * ant_width, z_mesh + 1e-9 * ant_thickness, ant_width, ant_thickness, 1., in_or_out_of_plane)) / 2
+            B_scale = np.max(np.abs(B_stable))
+
+            finite = np.isfinite(B_ref)
+            rel_error = np.max(np.abs(B_stable[finite] - B_ref[finite])) / B_scale
+            limit_error = np.max(np.abs(B_stable[~finite] - B_ref_limit[~finite])) / B_scale if np.any(~finite) else 0.
+            max_rel_error = max(max_rel_error, rel_error)
+            if rel_error > 1e-9 or limit_error > 1e-4:
+                passed = False
+
+        # engines on a mesh whose cell centers hit the conductor edges, antenna touching the sample
+        ant_dict['distance'] = 0.
+        size_cell = ant_width / 4
+        ant_dict['ant_position_x'] = size_cell * 16.5
+        ant_dict['ant_position_y'] = size_cell * 16.5
+        ant_dict['current_direction'] = rng.choice([0., 90., 180., 270.])
+        for engine in ('rotate', 'direct'):
+            B_pump = cf.get_magnetic_field(32, 32, 2, 32 * size_cell, 32 * size_cell, 2 * size_cell, [ant_dict], current_step=0, engine=engine)
+            if not all(np.all(np.isfinite(B)) for B in B_pump):
+                passed = False
+
+    return passed, max_rel_error
+
+def check_cell_average(n_trials=8, n_gauss=32, seed=0):
+    # analytic cell average against Gauss-Legendre quadrature of the point kernel over the cell
+    rng = np.random.default_rng(seed)
+    gauss_points, gauss_weights = np.polynomial.legendre.leggauss(n_gauss)
+    g1, g2, g3 = np.meshgrid(gauss_points, gauss_points, gauss_points, indexing='ij')
+    weights = gauss_weights[:, None, None] * gauss_weights[None, :, None] * gauss_weights[None, None, :] / 8
+    max_rel_error = 0.
+
+    for trial in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        ant_width = ant_dict['ant_width']
+        ant_thickness = ant_dict['ant_thickness']
+        size_cell = 10 ** rng.uniform(-8, -6)
+        cell_widths = (size_cell * rng.uniform(0, 1), 0. if trial % 4 == 0 else size_cell * rng.uniform(0, 1))
+        cell_length_z = size_cell * rng.uniform(0.1, 1)
+
+        # cells touching the conductor and cells a few cells away
+        z_value = ant_thickness / 2 + cell_length_z / 2 + rng.choice([0., rng.uniform(0, 3 * size_cell)])
+        xy_plane_arr = np.concatenate([rng.uniform(-3, 3, 6), rng.uniform(-30, 30, 4)]) * (ant_width + size_cell)
+
+        B_in, B_out = cf.calc_magnetic_field_cell_average(xy_plane_arr, z_value, cell_widths, cell_length_z, ant_width, ant_thickness, 1.)
+        for xy, B_avg in zip(xy_plane_arr, B_in + 1j * B_out):
+            xy_mesh = xy + g1 * cell_widths[0] / 2 + g2 * cell_widths[1] / 2
+            z_mesh = z_value + g3 * cell_length_z / 2
+            B_ref = np.sum(weights * (cf.calc_magnetic_field_stable(xy_mesh, z_mesh, ant_width, ant_thickness, 1., True) + 1j * cf.calc_magnetic_field_stable(xy_mesh, z_mesh, ant_width, ant_thickness, 1., False)))
+            max_rel_error = max(max_rel_error, abs(B_avg - B_ref) / np.max(np.hypot(B_in, B_out)))
+
+    # quadrature of the kinked integrand near the conductor corners limits the reference to ~1e-6
+    return max_rel_error < 1e-5, max_rel_error
+
+def check_segment_engine(n_trials=10, seed=0):
+    # long straight bars against the strip kernel, and a bar split at collinear vertices against the whole bar
+    rng = np.random.default_rng(seed)
+    max_rel_error = 0.
+    passed = True
+
+    for _ in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        size_xy = 40 * ant_dict['ant_width']
+        ant_dict['ant_position_x'] = rng.uniform(0, size_xy)
+        ant_dict['ant_position_y'] = rng.uniform(0, size_xy)
+
+        B_strip = cf.get_magnetic_field(48, 48, 2, size_xy, size_xy, 2e-7, [ant_dict], current_step=0, engine='direct')
+        B_segment = cf.get_magnetic_field(48, 48, 2, size_xy, size_xy, 2e-7, [ant_dict], current_step=0, engine='segment', max_batch=1000)
+        B_scale = max(np.max(np.abs(B)) for B in B_strip)
+        rel_error = max(np.max(np.abs(B_s - B_d)) for B_s, B_d in zip(B_segment, B_strip)) / B_scale
+        max_rel_error = max(max_rel_error, rel_error)
+        if rel_error > 1e-5:
+            passed = False
+
+        start, end = np.array([rng.uniform(0, size_xy, 2) for _ in range(2)])
+        polyline = dict(ant_dict, ant_type='polyline', vertices=[start, end])
+        split_polyline = dict(polyline, vertices=[start, start + (end - start) * rng.uniform(0.2, 0.8), end])
+        B_whole = cf.get_magnetic_field(48, 48, 2, size_xy, size_xy, 2e-7, [polyline], current_step=1)
+        B_split = cf.get_magnetic_field(48, 48, 2, size_xy, size_xy, 2e-7, [split_polyline], current_step=1)
+        B_scale = max(np.max(np.abs(B)) for B in B_whole)
+        if max(np.max(np.abs(B_s - B_w)) for B_s, B_w in zip(B_split, B_whole)) > 1e-9 * B_scale:
+            passed = False
+
+    return passed, max_rel_error
+
+def check_parallel_groups(n_trials=6, seed=0):
+    # gratings merged into one rotate map against the sum of their antennas rotated one by one;
+    # axis-aligned on cell centers, so both rotations map cell centers onto cell centers
+    rng = np.random.default_rng(seed)
+    max_rel_error = 0.
+
+    for _ in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        ant_dict['current_direction'] = 90. * rng.integers(4)
+        size_cell = ant_dict['ant_width'] / 2
+        pitch = size_cell * rng.integers(3, 8)
+        angle_rad = np.deg2rad(ant_dict['current_direction'])
+        ant_dicts = []
+        for i in range(int(rng.integers(2, 6))):
+            ant_dicts.append(dict(ant_dict, ant_position_x=size_cell * 24.5 - i * pitch * np.round(np.sin(angle_rad)), ant_position_y=size_cell * 24.5 + i * pitch * np.round(np.cos(angle_rad)), input_current=ant_dict['input_current'] * rng.uniform(-1, 1)))
+        ant_dicts[-1] = dict(ant_dicts[-1], ant_type='cpw', gap=ant_dict['ant_width'] / 2, ground_width=ant_dict['ant_width'])
+
+        B_group = cf.get_magnetic_field(48, 48, 2, 48 * size_cell, 48 * size_cell, 2e-7, ant_dicts, current_step=1)
+        B_single = [cf.get_magnetic_field(48, 48, 2, 48 * size_cell, 48 * size_cell, 2e-7, [single_dict], current_step=1) for single_dict in ant_dicts]
+        B_sum = [sum(B[c] for B in B_single) for c in range(3)]
+        B_scale = max(np.max(np.abs(B)) for B in B_sum)
+        max_rel_error = max(max_rel_error, max(np.max(np.abs(B_g - B_s)) for B_g, B_s in zip(B_group, B_sum)) / B_scale)
+
+    return max_rel_error < 1e-9, max_rel_error
+
+def check_nonsquare_cells(n_trials=8, seed=0):
+    # rotate engine on non-square cells. Antennas along x on cells of any aspect ratio against the direct engine:
+    # the padded map is anchored on the cell centers of each axis, so the field is evaluated at the cell centers.
+    # Antennas in any direction on cells elongated by an odd factor against the square mesh of the same sample:
+    # the elongated mesh reads the same map at a subset of the square cell centers, so it is exactly as accurate.
+    rng = np.random.default_rng(seed)
+    max_rel_error = 0.
+
+    for trial in range(n_trials):
+        ant_dict = get_random_antenna(rng)
+        size_cell = ant_dict['ant_width'] / rng.uniform(1, 4)
+        ant_dict = dict(ant_dict, ant_position_x=size_cell * rng.uniform(15, 30), ant_position_y=size_cell * rng.uniform(15, 30))
+
+        if trial % 2 == 0:
+            ant_dict['current_direction'] = 180. * rng.integers(2)
+            n_x, n_y = int(rng.integers(30, 60)), int(rng.integers(30, 60))
+            size_x, size_y = 45 * size_cell, 45 * size_cell * rng.uniform(0.5, 2)
+            B_ref = cf.get_magnetic_field(n_x, n_y, 2, size_x, size_y, 2e-7, [ant_dict], current_step=1, engine='direct')
+            B_test = cf.get_magnetic_field(n_x, n_y, 2, size_x, size_y, 2e-7, [ant_dict], current_step=1)
+        else:
+            n, factor = 45, int(rng.choice([3, 5]))
+            B_ref = cf.get_magnetic_field(n, n, 2, n * size_cell, n * size_cell, 2e-7, [ant_dict], current_step=1)
+            if rng.integers(2) == 0:
+                B_test = cf.get_magnetic_field(n // factor, n, 2, n * size_cell, n * size_cell, 2e-7, [ant_dict], current_step=1)
+                B_ref = [B[:, factor // 2::factor] for B in B_ref]
+            else:
+                B_test = cf.get_magnetic_field(n, n // factor, 2, n * size_cell, n * size_cell, 2e-7, [ant_dict], current_step=1)
+                B_ref = [B[factor // 2::factor, :] for B in B_ref]
+
+        B_scale = max(np.max(np.abs(B)) for B in B_ref)
+        max_rel_error = max(max_rel_error, max(np.max(np.abs(B_t - B_r)) for B_t, B_r in zip(B_test, B_ref)) / B_scale)
+
+    return max_rel_error < 1e-9, max_rel_error
+
+def check_compressed_ovf(seed=0):
+    # .ovfz written slice by slice, with one and with several slices and every available codec, against the plain
+    # .ovf of the same data: inflated bytes, slices read back and fingerprint; returns the number of failed round trips
+    rng = np.random.default_rng(seed)
+    codecs = ['gzip'] + (['zstd'] if oo.get_default_codec() == 'zstd' else [])
+    desc_lines = oo.get_fingerprint_desc("sha256:" + "0" * 64)
+    n_failed = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for n_z in (1, 3):
+            n_x, n_y = 7, 5
+            B = rng.normal(size=(n_z, 3, n_y, n_x)) * 1e-3
+            ovf_path = os.path.join(tmp_dir, f"plain_{n_z}.ovf")
+            for z in range(n_z):
+                oo.write_ovf_step(z, ovf_path, n_x, n_y, n_z, *B[z], desc_lines)
+            with open(ovf_path, 'rb') as f:
+                ovf_bytes = f.read()
+
+            for codec in codecs:
+                ovfz_path = os.path.join(tmp_dir, f"compressed_{n_z}_{codec}{oo.COMPRESSED_OVF_EXTENSION}")
+                inflated_path = os.path.join(tmp_dir, f"inflated_{n_z}_{codec}.ovf")
+                for z in range(n_z):
+                    oo.write_compressed_ovf_step(z, ovfz_path, n_x, n_y, n_z, *B[z], codec=codec, desc_lines=desc_lines)
+                oo.inflate_compressed_ovf(ovfz_path, inflated_path)
+                with open(inflated_path, 'rb') as f:
+                    passed = f.read() == ovf_bytes
+                passed &= all(np.array_equal(B_z, B_ref) for (_, B_z), (_, B_ref) in zip(oo.iter_ovf_slices(ovfz_path), oo.iter_ovf_slices(ovf_path)))
+                passed &= oo.read_ovf_fingerprint(ovfz_path) == oo.read_ovf_fingerprint(ovf_path) is not None
+                n_failed += not passed
+
+    return n_failed == 0, n_failed
+
+def check_verify_scaled(scales=(0.8, 1.2)):
+    # oracle.verify_output accepts outputs written by each engine and rejects the same outputs scaled by 20 %:
+    # rotate with a rotated antenna (checked against itself), rotate along an axis and cell_average (against direct);
+    # returns the number of wrong verdicts
+    n_x, n_y, n_z = 48, 40, 2
+    size = (n_x * 20e-9, n_y * 20e-9, n_z * 20e-9)
+    ant_dict = {'ant_width': 200e-9, 'ant_thickness': 50e-9, 'ant_position_x': size[0] / 2, 'ant_position_y': size[1] / 2, 'distance': 30e-9, 'input_current': 0.01}
+    n_wrong = 0
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for candidate, current_direction in (('rotate', 30.), ('rotate', 90.), ('cell_average', 30.)):
+            ant_dicts = [dict(ant_dict, current_direction=current_direction)]
+            B = [cf.get_magnetic_field(n_x, n_y, n_z, *size, ant_dicts, current_step=z, **cf.ENGINE_PRESETS[candidate]) for z in range(n_z)]
+            for scale in (1.,) + tuple(scales):
+                output_path = os.path.join(tmp_dir, f"{candidate}_{current_direction:g}_{scale:g}.ovf")
+                for z in range(n_z):
+                    oo.write_ovf_step(z, output_path, n_x, n_y, n_z, *(scale * B_c for B_c in B[z]))
+                passed, _, _ = oracle.verify_output(output_path, n_x, n_y, n_z, *size, ant_dicts, candidate, n_slices=n_z)
+                n_wrong += passed != (scale == 1.)
+
+    return n_wrong == 0, n_wrong
+
+def run_checks():
+    passed = True
+
+    far_field_passed, far_field_error = check_far_field_tier()
+    print(f"far-field tier: max relative error = {far_field_error:.3e} ({'ok' if far_field_passed else 'FAILED'})")
+    passed &= far_field_passed
+
+    stable_passed, stable_error = check_stable_kernel()
+    print(f"stable kernel: max relative error = {stable_error:.3e} ({'ok' if stable_passed else 'FAILED'})")
+    passed &= stable_passed
+
+    cell_average_passed, cell_average_error = check_cell_average()
+    print(f"cell average: max relative error = {cell_average_error:.3e} ({'ok' if cell_average_passed else 'FAILED'})")
+    passed &= cell_average_passed
+
+    segment_passed, segment_error = check_segment_engine()
+    print(f"segment engine: max relative error = {segment_error:.3e} ({'ok' if segment_passed else 'FAILED'})")
+    passed &= segment_passed
+
+    groups_passed, groups_error = check_parallel_groups()
+    print(f"parallel groups: max relative error = {groups_error:.3e} ({'ok' if groups_passed else 'FAILED'})")
+    passed &= groups_passed
+
+    nonsquare_passed, nonsquare_error = check_nonsquare_cells()
+    print(f"non-square cells: max relative error = {nonsquare_error:.3e} ({'ok' if nonsquare_passed else 'FAILED'})")
+    passed &= nonsquare_passed
+
+    compressed_passed, compressed_failed = check_compressed_ovf()
+    print(f"compressed OVF: {compressed_failed} failed round trips ({'ok' if compressed_passed else 'FAILED'})")
+    passed &= compressed_passed
+
+    verify_passed, verify_wrong = check_verify_scaled()
+    print(f"verify scaled outputs: {verify_wrong} wrong verdicts ({'ok' if verify_passed else 'FAILED'})")
+    passed &= verify_passed
+
+    oracle_passed, oracle_lines = oracle.check_oracle()
+    for line in oracle_lines:
+        print(f"oracle {line}")
+    passed &= oracle_passed
+
+    return passed
+
+if __name__ == '__main__':
+    sys.exit(0 if run_checks() else 1)
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import argparse
+import numpy as np
+
+import output_ovf as oo
+import calc_field as cf
+
+# max / RMS relative error per component that each (reference, candidate) pair of engine presets may reach
+ORACLE_TOLERANCES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'oracle_tolerances.json')
+# engine preset every candidate is compared with: the closed-form strip field sampled at the cell centers
+ORACLE_REFERENCE = 'direct'
+# pairs checked on random meshes and antenna angles
+ORACLE_PAIRS = [
+    ('direct', 'direct_tiers'),
+    ('direct', 'cell_average'),
+    ('direct', 'segment'),
+    ('direct', 'lut')
+]
+# pairs checked on antennas at multiples of 90 deg only: the rotate engine interpolates a map rotated to the antenna
+# angle, whose error at other angles depends on the mesh; at these angles the map lies on the mesh and must be exact
+ORACLE_AXIS_PAIRS = [
+    ('direct', 'rotate')
+]
+# random cases are throwaway: their LUT tables stay out of the disk cache
+ORACLE_FIELD_KWARGS = {'lut_cache_dir': None}
+# calibrated tolerances are the measured errors times this margin, and at least the floor
+# (pairs that agree to rounding would otherwise fail on another numpy build)
+ORACLE_MARGIN = 1.5
+ORACLE_TOLERANCE_FLOOR = 1e-9
+# float32 storage error of written outputs (relative to the largest |B|), allowed on top of the pair tolerance
+ORACLE_STORAGE_TOLERANCE = 1e-6
+
+def get_random_case(rng, axis_aligned=False):
+    # random mesh, 1-3 antennas at random positions and angles, and one z-slice of it;
+    # the antennas are at least a few cells wide, as in production meshes.
+    # axis_aligned: angles rounded down to multiples of 90 deg (the same random draws otherwise)
+    n_x, n_y = (int(n) for n in rng.integers(16, 97, 2))
+    n_z = int(rng.integers(1, 5))
+    size_cell = 10 ** rng.uniform(-8.5, -7.5)
+    size = (n_x * size_cell, n_y * size_cell, n_z * size_cell * rng.uniform(0.2, 1))
+
+    ant_dicts = []
+    for _ in range(int(rng.integers(1, 4))):
+        ant_width = size_cell * 10 ** rng.uniform(0.6, 1.5)
+        ant_dicts.append({
+            'ant_width': ant_width,
+            'ant_thickness': ant_width * 10 ** rng.uniform(-1.5, -0.3),
+            'ant_position_x': rng.uniform(0, size[0]),
+            'ant_position_y': rng.uniform(0, size[1]),
+            'distance': size_cell * 10 ** rng.uniform(-1, 1),
+            'current_direction': rng.uniform(0, 360) // 90 * 90 if axis_aligned else rng.uniform(0, 360),
+            'input_current': rng.uniform(-0.05, 0.05)
+        })
+
+    case = {
+        'n': (n_x, n_y, n_z),
+        'size': size,
+        'ant_dicts': ant_dicts,
+        'current_step': int(rng.integers(n_z))
+    }
+    return case
+
+def compare_fields(B_reference, B_candidate):
+    # max and RMS error of each component relative to the largest |B| of the reference
+    B_reference = np.asarray(B_reference, dtype=np.float64)
+    B_candidate = np.asarray(B_candidate, dtype=np.float64)
+    B_scale = np.max(np.sqrt(np.sum(B_reference**2, axis=0)))
+    if B_scale == 0:
+        B_scale = 1.
+
+    error = np.abs(B_candidate - B_reference).reshape(3, -1) / B_scale
+    return {
+        'max': [float(e) for e in np.max(error, axis=1)],
+        'rms': [float(e) for e in np.sqrt(np.mean(error**2, axis=1))]
+    }
+
+def merge_errors(errors, new_errors):
+    # componentwise worst case
+    if errors is None:
+        return new_errors
+    return {key: [max(e, n) for e, n in zip(errors[key], new_errors[key])] for key in errors}
+
+def get_pair_key(reference: str, candidate: str) -> str:
+    return f"{reference}->{candidate}"
+
+def load_tolerances(filename=ORACLE_TOLERANCES_FILE):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def is_axis_aligned(ant_dicts) -> bool:
+    # every antenna is a polyline (always computed exactly) or runs along x or y
+    return all(ant_dict.get('ant_type') == 'polyline' or float(ant_dict.get('current_direction', 0)) % 90 == 0 for ant_dict in ant_dicts)
+
+def get_verify_reference(candidate: str, ant_dicts) -> str:
+    # the oracle reference, except for rotate outputs of rotated antennas: those are recomputed with rotate itself,
+    # which checks the written output (storage, merge, scaling) to float32 precision; the engine is checked by check_oracle
+    if candidate in {c for _, c in ORACLE_AXIS_PAIRS} and not is_axis_aligned(ant_dicts):
+        return candidate
+    return ORACLE_REFERENCE
+
+def get_tolerance(tolerances, reference: str, candidate: str):
+    # float32 storage is the only difference between an engine and itself
+    if reference == candidate:
+        return {'max': [ORACLE_STORAGE_TOLERANCE] * 3, 'rms': [ORACLE_STORAGE_TOLERANCE] * 3}
+    return tolerances.get(get_pair_key(reference, candidate))
+
+def check_errors(errors, tolerance) -> bool:
+    if tolerance is None:
+        return False
+    return all(e <= t for key in ('max', 'rms') for e, t in zip(errors[key], tolerance[key]))
+
+def run_oracle(pairs=ORACLE_PAIRS, n_cases=20, seed=0, axis_aligned=False):
+    # worst errors of each pair over n_cases random cases; every preset is evaluated once per case
+    rng = np.random.default_rng(seed)
+    presets = sorted({preset for pair in pairs for preset in pair})
+    errors = {get_pair_key(*pair): None for pair in pairs}
+
+    for _ in range(n_cases):
+        case = get_random_case(rng, axis_aligned)
+        B = {preset: cf.get_magnetic_field(*case['n'], *case['size'], case['ant_dicts'], current_step=case['current_step'], **cf.ENGINE_PRESETS[preset], **ORACLE_FIELD_KWARGS) for preset in presets}
+        for reference, candidate in pairs:
+            key = get_pair_key(reference, candidate)
+            errors[key] = merge_errors(errors[key], compare_fields(B[reference], B[candidate]))
+    return errors
+
+def run_all_oracles(n_cases=20, seed=0):
+    # ORACLE_PAIRS on random cases and ORACLE_AXIS_PAIRS on axis-aligned ones
+    errors = run_oracle(ORACLE_PAIRS, n_cases, seed)
+    errors.update(run_oracle(ORACLE_AXIS_PAIRS, n_cases, seed, axis_aligned=True))
+    return errors
+
+def format_errors(errors) -> str:
+    return " ".join(f"{key}=[{', '.join(f'{e:.2e}' for e in errors[key])}]" for key in ('max', 'rms'))
+
+def check_oracle(n_cases=20, seed=0, tolerances_filename=ORACLE_TOLERANCES_FILE):
+    # every pair against its stored tolerance; returns (passed, lines to print)
+    tolerances = load_tolerances(tolerances_filename)
+    passed = True
+    lines = []
+    for key, errors in run_all_oracles(n_cases, seed).items():
+        reference, candidate = key.split('->')
+        pair_passed = check_errors(errors, get_tolerance(tolerances, reference, candidate))
+        passed &= pair_passed
+        lines.append(f"{key}: {format_errors(errors)} ({'ok' if pair_passed else 'REGRESSION'})")
+    return passed, lines
+
+def calibrate_tolerances(n_cases=40, seed=0, margin=ORACLE_MARGIN, tolerances_filename=ORACLE_TOLERANCES_FILE):
+    # store the measured errors (times margin, rounded up to 2 digits, at least ORACLE_TOLERANCE_FLOOR) as the new tolerances
+    def round_up(value):
+        if value <= ORACLE_TOLERANCE_FLOOR:
+            return ORACLE_TOLERANCE_FLOOR
+        exponent = np.floor(np.log10(value)) - 1
+        return float(f"{np.ceil(value / 10**exponent) * 10**exponent:.2g}")
+
+    tolerances = {key: {k: [round_up(margin * e) for e in errors[k]] for k in errors} for key, errors in run_all_oracles(n_cases, seed).items()}
+    with open(tolerances_filename, 'w') as f:
+        json.dump(tolerances, f, indent=4, sort_keys=True)
+        f.write("\n")
+    return tolerances
+
+def verify_output(output_filename: str, n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dicts, candidate: str, reference=None, n_slices=2, seed=0):
+    # recompute n_slices random z-slices of a written output with the reference preset (default: get_verify_reference) and compare
+    if reference is None:
+        reference = get_verify_reference(candidate, ant_dicts)
+    _, read_slice = oo.get_ovf_slice_reader(output_filename)
+    rng = np.random.default_rng(seed)
+    steps = sorted(rng.choice(n_z, size=min(n_slices, n_z), replace=False).tolist())
+
+    errors = None
+    for step in steps:
+        B_reference = cf.get_magnetic_field(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, current_step=step, **cf.ENGINE_PRESETS[reference])
+        B_written = np.moveaxis(np.asarray(read_slice(step), dtype=np.float64), -1, 0)
+        errors = merge_errors(errors, compare_fields(B_reference, B_written))
+
+    tolerance = get_tolerance(load_tolerances(), reference, candidate)
+    if tolerance is not None and reference != candidate:
+        tolerance = {key: [t + ORACLE_STORAGE_TOLERANCE for t in tolerance[key]] for key in tolerance}
+    return check_errors(errors, tolerance), steps, errors
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare engine presets on random meshes against stored tolerances.")
+    parser.add_argument('--cases', type=int, default=20, help="random cases (meshes, antennas, z-slices)")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random cases")
+    parser.add_argument('--calibrate', action='store_true', help="store the measured errors as the new tolerances")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        calibrate_tolerances(args.cases, args.seed)
+        print(f"tolerances written to {ORACLE_TOLERANCES_FILE}")
+        sys.exit(0)
+
+    oracle_passed, oracle_lines = check_oracle(args.cases, args.seed)
+    for line in oracle_lines:
+        print(line)
+    sys.exit(0 if oracle_passed else 1)
@@ -1,11 +1,28 @@
+import os
+import json
 import struct
+import zlib
+import importlib.util
+import numpy as np
 
-def get_header(n_x: int, n_y: int, n_z: int) -> str:
+try:
+    import zstandard
+    zstd_available = True
+except ImportError:
+    zstd_available = False
+
+# h5py は解析用出力でのみ使うので、起動時には存在だけ確認して読み込みは遅らせる
+h5py_available = importlib.util.find_spec('h5py') is not None
+
+FINGERPRINT_DESC_PREFIX = "fingerprint "
+
+def get_header(n_x: int, n_y: int, n_z: int, desc_lines=None) -> str:
+    desc = "".join(f"# Desc: {line}\n" for line in (desc_lines or []))
     header = f"""# OOMMF OVF 2.0
 # Segment count: 1
 # Begin: Segment
 # Begin: Header
-# valuedim: 3
+{desc}# valuedim: 3
 # valueunits: 1 1 1
 # xnodes: {n_x}
 # ynodes: {n_y}
@@ -23,6 +40,9 @@ def get_footer() -> str:
 """
     return footer
 
+def get_fingerprint_desc(fingerprint: str) -> list:
+    return [FINGERPRINT_DESC_PREFIX + fingerprint]
+
 def write_oommf_file(output_filename: str, n_x: int, n_y: int, n_z: int, B_pump_x_list, B_pump_y_list, B_pump_z_list) -> None:
 
     header = get_header(n_x, n_y, n_z)
@@ -46,9 +66,14 @@ def write_oommf_file(output_filename: str, n_x: int, n_y: int, n_z: int, B_pump_
 # OVF2のバイナリフォーマットで必要なコントロールナンバー
 OVF_CONTROL_NUMBER_4 = 1234567.0  # 4バイト用コントロールナンバー
 
+def get_slice_bytes(B_pump_x_array, B_pump_y_array, B_pump_z_array, endianness='<f') -> bytes:
+    # (y, x) の順に Bx, By, Bz を交互に並べた4バイト浮動小数点のバイト列
+    dtype = np.dtype(endianness[0] + 'f4')
+    return np.stack([B_pump_x_array, B_pump_y_array, B_pump_z_array], axis=-1).astype(dtype).tobytes()
+
 def write_oommf_binary_file(output_filename: str, n_x: int, n_y: int, n_z: int, 
                             B_pump_x_list, B_pump_y_list, B_pump_z_list, 
-                            endianness='<f') -> None:
+                            endianness='<f', desc_lines=None) -> None:
     """
     バイナリ形式でOOMMFファイルを書き出す。
 
@@ -70,10 +95,12 @@ def write_oommf_binary_file(output_filename: str, n_x: int, n_y: int, n_z: int,
         z方向のスカラーデータリスト
     endianness : str
         エンディアン（デフォルトはリトルエンディアン `<f`）
+    desc_lines : list
+        ヘッダーに `# Desc:` として書き込む行（フィンガープリントなど）
     """
     
     # ヘッダーを生成（メタデータに基づくヘッダー生成関数が必要）
-    header = get_header(n_x, n_y, n_z)
+    header = get_header(n_x, n_y, n_z, desc_lines)
     footer = get_footer()
 
     # バイナリファイルを書き込みモードで開く
@@ -86,22 +113,14 @@ def write_oommf_binary_file(output_filename: str, n_x: int, n_y: int, n_z: int,
         
         # スカラーデータをバイナリ形式で書き込み
         for z in range(n_z):
-            B_pump_x = B_pump_x_list[z]
-            B_pump_y = B_pump_y_list[z]
-            B_pump_z = B_pump_z_list[z]
-
-            for y in range(n_y):
-                for x in range(n_x):
-                    # x, y, z 各方向のスカラー値をバイナリ形式で書き込む
-                    file.write(struct.pack(endianness, B_pump_x[y][x]))
-                    file.write(struct.pack(endianness, B_pump_y[y][x]))
-                    file.write(struct.pack(endianness, B_pump_z[y][x]))
+            # x, y, z 各方向のスカラー値をバイナリ形式で書き込む
+            file.write(get_slice_bytes(B_pump_x_list[z], B_pump_y_list[z], B_pump_z_list[z], endianness))
 
         # フッターを書き込み
         file.write(footer.encode('utf-8'))
 
 def write_oommf_binary_file_step(current_z: int, output_filename: str, n_x: int, n_y: int, n_z: int, 
-                                B_pump_x_array, B_pump_y_array, B_pump_z_array, endianness='<f') -> None:
+                                B_pump_x_array, B_pump_y_array, B_pump_z_array, endianness='<f', desc_lines=None) -> None:
     """
     バイナリ形式でOOMMFファイルを書き出す。
 
@@ -125,16 +144,18 @@ def write_oommf_binary_file_step(current_z: int, output_filename: str, n_x: int,
         Bzのスカラーデータ配列
     endianness : str
         エンディアン（デフォルトはリトルエンディアン `<f`）
+    desc_lines : list
+        ヘッダーに `# Desc:` として書き込む行（フィンガープリントなど）
     """
 
     # ヘッダーとフッターの生成
     if current_z == 0:
-        header = get_header(n_x, n_y, n_z)
+        header = get_header(n_x, n_y, n_z, desc_lines)
     if current_z + 1 == n_z:
         footer = get_footer()
 
     # ファイルモードを決定
-    mode = 'wb' if current_z == 0 else 'ab'
+    mode = 'w+b' if current_z == 0 else 'ab'
 
     # バイナリファイルを開く
     with open(output_filename, mode) as file:
@@ -147,17 +168,482 @@ def write_oommf_binary_file_step(current_z: int, output_filename: str, n_x: int,
         
 
         # current_z の層のデータをバイナリ形式で書き込み
-        B_pump_x = B_pump_x_array
-        B_pump_y = B_pump_y_array
-        B_pump_z = B_pump_z_array
-
-        for y in range(n_y):
-            for x in range(n_x):
-                # x, y, z 各方向のスカラー値をバイナリ形式で書き込む
-                file.write(struct.pack(endianness, B_pump_x[y][x]))
-                file.write(struct.pack(endianness, B_pump_y[y][x]))
-                file.write(struct.pack(endianness, B_pump_z[y][x]))
+        file.write(get_slice_bytes(B_pump_x_array, B_pump_y_array, B_pump_z_array, endianness))
 
         # フッターを追加（最後の層のみ）
         if current_z + 1 == n_z:
             file.write(footer.encode('utf-8'))
+
+def get_basis_filename(output_filename: str, r: int) -> str:
+    # mumax3 の loadfile で直接読むため、基底は常に通常のOVFで書き出す
+    root, ext = os.path.splitext(output_filename)
+    if ext == COMPRESSED_OVF_EXTENSION:
+        ext = ".ovf"
+    return f"{root}_basis{r}{ext}"
+
+def get_basis_text_filename(output_filename: str) -> str:
+    # mumax3 の行を保存するテキストファイルのパス
+    return os.path.splitext(output_filename)[0] + "_basis.txt"
+
+def is_basis_up_to_date(output_filename: str, fingerprint: str) -> bool:
+    # テキストファイルに並ぶすべての基底OVFが、このフィンガープリントの条件から書き出されていれば True
+    try:
+        with open(get_basis_text_filename(output_filename), 'r', encoding='utf-8') as file:
+            n_basis = sum(line.startswith("B_ext.add(") for line in file)
+    except FileNotFoundError:
+        return False
+    return n_basis > 0 and all(read_ovf_fingerprint(get_basis_filename(output_filename, r)) == fingerprint for r in range(n_basis))
+
+def get_mumax_basis_lines(output_filename: str, basis_expressions) -> list:
+    """
+    基底ごとのmumax3の励起磁場の行を生成する。
+
+    Parameters
+    ----------
+    output_filename : str
+        基底を分割する前の出力ファイルのパス
+    basis_expressions : list
+        各基底の時間関数（mumax3の式）
+    """
+    lines = []
+    for r, expression in enumerate(basis_expressions):
+        basis_name = os.path.basename(get_basis_filename(output_filename, r))
+        lines.append(f'B_ext.add(loadfile("{basis_name}"), {expression})')
+    return lines
+
+def write_basis_files(output_filename: str, n_x: int, n_y: int, n_z: int, basis_list, basis_expressions, desc_lines=None) -> list:
+    """
+    空間基底ごとにOVFファイルを書き出し、mumax3の行をテキストファイルに保存する。
+
+    Parameters
+    ----------
+    output_filename : str
+        基底を分割する前の出力ファイルのパス（基底rは *_basis{r}.ovf に書き出す）
+    n_x : int
+        x方向のノード数
+    n_y : int
+        y方向のノード数
+    n_z : int
+        z方向のノード数
+    basis_list : list
+        各基底の (B_pump_x_list, B_pump_y_list, B_pump_z_list)
+    basis_expressions : list
+        各基底の時間関数（mumax3の式）
+    desc_lines : list
+        各基底OVFのヘッダーに `# Desc:` として書き込む行（フィンガープリントなど）
+    """
+    for r, (B_pump_x_list, B_pump_y_list, B_pump_z_list) in enumerate(basis_list):
+        write_oommf_binary_file(get_basis_filename(output_filename, r), n_x, n_y, n_z, B_pump_x_list, B_pump_y_list, B_pump_z_list, desc_lines=desc_lines)
+
+    lines = get_mumax_basis_lines(output_filename, basis_expressions)
+    with open(get_basis_text_filename(output_filename), 'w', encoding='utf-8') as file:
+        file.write("// rf excitation field\n")
+        file.write("\n".join(lines) + "\n")
+
+    return lines
+
+# 圧縮OVFコンテナ（z層ごとに圧縮したチャンクと末尾のインデックス）
+COMPRESSED_OVF_EXTENSION = ".ovfz"
+COMPRESSED_OVF_MAGIC = b"OVFZ\x01\n"
+COMPRESSED_OVF_INDEX_MAGIC = b"OVFZIDX\n"
+
+def get_default_codec() -> str:
+    return "zstd" if zstd_available else "gzip"
+
+def compress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return zlib.compress(data, 6)
+
+def decompress_bytes(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+def write_compressed_ovf_step(current_z: int, output_filename: str, n_x: int, n_y: int, n_z: int, 
+                              B_pump_x_array, B_pump_y_array, B_pump_z_array, codec=None, endianness='<f', desc_lines=None) -> None:
+    """
+    z層ごとに圧縮した圧縮OVFコンテナ（.ovfz）を書き出す。
+
+    レイアウト: マジック | コーデック名 | ヘッダー長 + OVFヘッダー（コントロールナンバー込み） |
+    (チャンク長 + 圧縮されたz層) x n_z | インデックス(JSON) | インデックス位置 | インデックスマジック
+
+    Parameters
+    ----------
+    current_z : int
+        保存するz方向の層の値
+    output_filename : str
+        出力ファイルのパス
+    n_x : int
+        x方向のノード数
+    n_y : int
+        y方向のノード数
+    n_z : int
+        z方向のノード数
+    B_pump_x_array : 2D array
+        Bxのスカラーデータ配列
+    B_pump_y_array : 2D array
+        Byのスカラーデータ配列
+    B_pump_z_array : 2D array
+        Bzのスカラーデータ配列
+    codec : str
+        "zstd" または "gzip"（デフォルトは zstandard があれば "zstd"）
+    endianness : str
+        エンディアン（デフォルトはリトルエンディアン `<f`）
+    desc_lines : list
+        ヘッダーに `# Desc:` として書き込む行（フィンガープリントなど）
+    """
+
+    if codec is None:
+        codec = get_default_codec()
+
+    # 最後の層ではチャンク長を読み返して索引を作るため、n_z == 1 でも読み書き両用で開く
+    mode = 'w+b' if current_z == 0 else 'r+b'
+
+    with open(output_filename, mode) as file:
+        if current_z == 0:
+            header = get_header(n_x, n_y, n_z, desc_lines).encode('utf-8') + struct.pack(endianness, OVF_CONTROL_NUMBER_4)
+            file.write(COMPRESSED_OVF_MAGIC)
+            file.write(codec.encode('ascii') + b"\n")
+            file.write(struct.pack('<Q', len(header)))
+            file.write(header)
+        else:
+            file.seek(0, os.SEEK_END)
+
+        chunk = compress_bytes(get_slice_bytes(B_pump_x_array, B_pump_y_array, B_pump_z_array, endianness), codec)
+        file.write(struct.pack('<Q', len(chunk)))
+        file.write(chunk)
+
+        # 最後の層でチャンクを辿ってインデックスを追加
+        if current_z + 1 == n_z:
+            file.seek(0)
+            file.readline()
+            file.readline()
+            header_len = struct.unpack('<Q', file.read(8))[0]
+            header = file.read(header_len)
+
+            chunks = []
+            for _ in range(n_z):
+                chunk_len = struct.unpack('<Q', file.read(8))[0]
+                chunks.append([file.tell(), chunk_len])
+                file.seek(chunk_len, os.SEEK_CUR)
+
+            index = {
+                'codec': codec,
+                'n_x': n_x,
+                'n_y': n_y,
+                'n_z': n_z,
+                'endianness': endianness,
+                'header': header[:-4].decode('utf-8'),
+                'footer': get_footer(),
+                'chunks': chunks
+            }
+            index_offset = file.tell()
+            file.write(json.dumps(index).encode('utf-8'))
+            file.write(struct.pack('<Q', index_offset))
+            file.write(COMPRESSED_OVF_INDEX_MAGIC)
+            file.truncate()
+
+def read_compressed_ovf_index(input_filename: str) -> dict:
+    with open(input_filename, 'rb') as file:
+        if file.read(len(COMPRESSED_OVF_MAGIC)) != COMPRESSED_OVF_MAGIC:
+            raise ValueError(f"{input_filename} is not a compressed OVF file")
+        file.seek(-8 - len(COMPRESSED_OVF_INDEX_MAGIC), os.SEEK_END)
+        index_offset = struct.unpack('<Q', file.read(8))[0]
+        if file.read() != COMPRESSED_OVF_INDEX_MAGIC:
+            raise ValueError(f"{input_filename} is incomplete (no index)")
+        file.seek(index_offset)
+        index_len = os.path.getsize(input_filename) - index_offset - 8 - len(COMPRESSED_OVF_INDEX_MAGIC)
+        return json.loads(file.read(index_len).decode('utf-8'))
+
+def read_ovf_header(input_filename: str) -> dict:
+    """
+    OVFファイル（バイナリ4バイト）または圧縮OVFコンテナのヘッダーを読む。
+
+    Returns
+    -------
+    dict
+        n_x, n_y, n_z, header（テキスト）, compressed, data_offset（非圧縮のみ）, codec, chunks（圧縮のみ）
+    """
+    with open(input_filename, 'rb') as file:
+        compressed = file.read(len(COMPRESSED_OVF_MAGIC)) == COMPRESSED_OVF_MAGIC
+
+    if compressed:
+        index = read_compressed_ovf_index(input_filename)
+        header_info = {
+            'n_x': index['n_x'],
+            'n_y': index['n_y'],
+            'n_z': index['n_z'],
+            'header': index['header'],
+            'compressed': True,
+            'codec': index['codec'],
+            'endianness': index['endianness'],
+            'chunks': index['chunks']
+        }
+        return header_info
+
+    header_lines = []
+    with open(input_filename, 'rb') as file:
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"{input_filename} has no binary data segment")
+            header_lines.append(line.decode('utf-8'))
+            if line.startswith(b"# Begin: Data Binary 4"):
+                break
+        control_number = struct.unpack('<f', file.read(4))[0]
+        data_offset = file.tell()
+
+    if control_number != OVF_CONTROL_NUMBER_4:
+        raise ValueError(f"{input_filename} is not a little-endian 4-byte binary OVF file")
+
+    nodes = {}
+    for line in header_lines:
+        for key in ('xnodes', 'ynodes', 'znodes'):
+            if line.startswith(f"# {key}:"):
+                nodes[key] = int(line.split(':')[1])
+
+    header_info = {
+        'n_x': nodes['xnodes'],
+        'n_y': nodes['ynodes'],
+        'n_z': nodes['znodes'],
+        'header': "".join(header_lines),
+        'compressed': False,
+        'endianness': '<f',
+        'data_offset': data_offset
+    }
+    return header_info
+
+def read_ovf_fingerprint(input_filename: str):
+    # ヘッダーだけを読み、最後まで書き出されたファイルのフィンガープリントを返す（なければ None）
+    if not os.path.isfile(input_filename):
+        return None
+    try:
+        header_info = read_ovf_header(input_filename)
+    except (ValueError, KeyError, OSError, struct.error):
+        return None
+
+    if not header_info['compressed']:
+        data_size = header_info['n_x'] * header_info['n_y'] * header_info['n_z'] * 3 * 4
+        if os.path.getsize(input_filename) != header_info['data_offset'] + data_size + len(get_footer().encode('utf-8')):
+            return None
+
+    desc_prefix = "# Desc: " + FINGERPRINT_DESC_PREFIX
+    for line in header_info['header'].splitlines():
+        if line.startswith(desc_prefix):
+            return line[len(desc_prefix):].strip()
+    return None
+
+def get_ovf_slice_reader(input_filename: str):
+    """
+    z層をランダムアクセスで読む関数を返す（非圧縮はメモリマップ、圧縮はチャンクごとに展開）。
+
+    Returns
+    -------
+    (dict, function)
+        read_ovf_header のヘッダー情報と、z層の番号から (n_y, n_x, 3) の float32 配列を返す関数
+    """
+    header_info = read_ovf_header(input_filename)
+    n_x = header_info['n_x']
+    n_y = header_info['n_y']
+    n_z = header_info['n_z']
+    dtype = np.dtype(header_info['endianness'][0] + 'f4')
+
+    if header_info['compressed']:
+        def read_slice(z):
+            offset, chunk_len = header_info['chunks'][z]
+            with open(input_filename, 'rb') as file:
+                file.seek(offset)
+                data = decompress_bytes(file.read(chunk_len), header_info['codec'])
+            return np.frombuffer(data, dtype=dtype).reshape(n_y, n_x, 3)
+    else:
+        data = np.memmap(input_filename, dtype=dtype, mode='r', offset=header_info['data_offset'], shape=(n_z, n_y, n_x, 3))
+        def read_slice(z):
+            return data[z]
+
+    return header_info, read_slice
+
+def read_ovf_array(input_filename: str):
+    """
+    OVFファイル全体を (n_z, n_y, n_x, 3) の配列として返す（非圧縮はメモリマップ、圧縮は全層を展開）。
+    全z層にまたがる一括アクセス（ラインプロファイルなど）用。
+
+    Returns
+    -------
+    (dict, ndarray)
+        read_ovf_header のヘッダー情報と (n_z, n_y, n_x, 3) の float32 配列
+    """
+    header_info, read_slice = get_ovf_slice_reader(input_filename)
+    if header_info['compressed']:
+        return header_info, np.stack([read_slice(z) for z in range(header_info['n_z'])])
+
+    dtype = np.dtype(header_info['endianness'][0] + 'f4')
+    shape = (header_info['n_z'], header_info['n_y'], header_info['n_x'], 3)
+    return header_info, np.memmap(input_filename, dtype=dtype, mode='r', offset=header_info['data_offset'], shape=shape)
+
+def iter_ovf_slices(input_filename: str):
+    """
+    OVFファイルまたは圧縮OVFコンテナからz層を1つずつ読み出す（圧縮はストリーム展開）。
+
+    Yields
+    ------
+    (int, ndarray)
+        z層の番号と (n_y, n_x, 3) の float32 配列
+    """
+    header_info, read_slice = get_ovf_slice_reader(input_filename)
+    for z in range(header_info['n_z']):
+        yield z, read_slice(z)
+
+def inflate_compressed_ovf(input_filename: str, output_filename: str) -> None:
+    # mumax3に渡す直前に圧縮OVFコンテナを通常のOVFに展開する
+    index = read_compressed_ovf_index(input_filename)
+
+    with open(input_filename, 'rb') as file, open(output_filename, 'wb') as out_file:
+        out_file.write(index['header'].encode('utf-8'))
+        out_file.write(struct.pack(index['endianness'], OVF_CONTROL_NUMBER_4))
+        for offset, chunk_len in index['chunks']:
+            file.seek(offset)
+            out_file.write(decompress_bytes(file.read(chunk_len), index['codec']))
+        out_file.write(index['footer'].encode('utf-8'))
+
+def write_ovf_step(current_z: int, output_filename: str, n_x: int, n_y: int, n_z: int, 
+                   B_pump_x_array, B_pump_y_array, B_pump_z_array, desc_lines=None, analysis_filename=None, size=None, analysis_attrs=None) -> None:
+    # 拡張子が .ovfz なら圧縮OVFコンテナ、それ以外は通常のバイナリOVF
+    # analysis_filename を指定すると同じz層を解析用HDF5にも書き込む（1回の計算で両方を出力）
+    if output_filename.endswith(COMPRESSED_OVF_EXTENSION):
+        write_compressed_ovf_step(current_z, output_filename, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array, desc_lines=desc_lines)
+    else:
+        write_oommf_binary_file_step(current_z, output_filename, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array, desc_lines=desc_lines)
+
+    if analysis_filename is not None:
+        write_hdf5_step(current_z, analysis_filename, n_x, n_y, n_z, B_pump_x_array, B_pump_y_array, B_pump_z_array, size, analysis_attrs)
+
+ANALYSIS_EXTENSION = ".h5"
+# 1チャンク = 1成分の1層の (HDF5_CHUNK_XY x HDF5_CHUNK_XY) セル
+HDF5_CHUNK_XY = 256
+HDF5_COMPRESSION = "lzf"
+HDF5_COMPONENTS = ("Bx", "By", "Bz")
+
+def get_analysis_filename(output_filename: str) -> str:
+    # OVFの出力パスに対応する解析用HDF5のパス
+    root, extension = os.path.splitext(output_filename)
+    if extension not in (".ovf", COMPRESSED_OVF_EXTENSION):
+        root = output_filename
+    return root + ANALYSIS_EXTENSION
+
+def write_hdf5_step(current_z: int, output_filename: str, n_x: int, n_y: int, n_z: int,
+                    B_pump_x_array, B_pump_y_array, B_pump_z_array, size=None, attrs=None) -> None:
+    """
+    z層を1つずつ解析用HDF5に書き込む（成分ごとに (n_z, n_y, n_x) のチャンク圧縮データセット）。
+
+    Parameters
+    ----------
+    current_z : int
+        書き込むz層の番号（0 のときにファイルを作成する）
+    output_filename : str
+        出力ファイルのパス（.h5）
+    n_x, n_y, n_z : int
+        ノード数
+    B_pump_x_array, B_pump_y_array, B_pump_z_array : ndarray
+        z層の磁場 (n_y, n_x) [T]
+    size : tuple
+        試料サイズ (size_x, size_y, size_z) [m]。指定するとセル中心の座標 x, y, z を書き込む
+    attrs : dict
+        ファイルの属性（フィンガープリント、条件など。dict や list は JSON 文字列で保存）
+    """
+    import h5py
+
+    mode = 'w' if current_z == 0 else 'r+'
+    with h5py.File(output_filename, mode) as file:
+        if current_z == 0:
+            chunks = (1, min(n_y, HDF5_CHUNK_XY), min(n_x, HDF5_CHUNK_XY))
+            for component in HDF5_COMPONENTS:
+                dataset = file.create_dataset(component, shape=(n_z, n_y, n_x), dtype='<f4', chunks=chunks, compression=HDF5_COMPRESSION, shuffle=True)
+                dataset.attrs['units'] = "T"
+                dataset.dims[0].label = "z"
+                dataset.dims[1].label = "y"
+                dataset.dims[2].label = "x"
+
+            if size is not None:
+                for axis, n, axis_size in zip("xyz", (n_x, n_y, n_z), size):
+                    file.create_dataset(axis, data=np.linspace(axis_size / n / 2, axis_size - axis_size / n / 2, n))
+                    file[axis].attrs['units'] = "m"
+                file.attrs['size'] = np.asarray(size, dtype=np.float64)
+
+            file.attrs['n'] = np.array([n_x, n_y, n_z])
+            for key, value in (attrs or {}).items():
+                file.attrs[key] = json.dumps(value) if isinstance(value, (dict, list)) else value
+            file.attrs['complete'] = False
+
+        for component, B_pump in zip(HDF5_COMPONENTS, (B_pump_x_array, B_pump_y_array, B_pump_z_array)):
+            file[component][current_z] = B_pump
+
+        # 最後の層を書き終えたファイルだけが完全
+        if current_z + 1 == n_z:
+            file.attrs['complete'] = True
+
+def read_hdf5_fingerprint(input_filename: str):
+    # 最後まで書き出された解析用HDF5のフィンガープリントを返す（なければ None）
+    if not h5py_available or not os.path.isfile(input_filename):
+        return None
+    import h5py
+
+    try:
+        with h5py.File(input_filename, 'r') as file:
+            if not file.attrs.get('complete', False):
+                return None
+            fingerprint = file.attrs.get('fingerprint')
+    except OSError:
+        return None
+    return None if fingerprint is None else str(fingerprint)
+
+def read_hdf5_slice(input_filename: str, component: str, z: int, y_range=None, x_range=None):
+    """
+    解析用HDF5から1成分の1層（またはその一部）だけを読む。必要なチャンクだけが展開される。
+
+    Parameters
+    ----------
+    component : str
+        "Bx", "By", "Bz" のいずれか
+    z : int
+        z層の番号
+    y_range, x_range : tuple
+        読み出す範囲 (begin, end)（デフォルトは全体）
+
+    Returns
+    -------
+    ndarray
+        (n_y, n_x) の float32 配列 [T]
+    """
+    import h5py
+
+    y_slice = slice(*y_range) if y_range is not None else slice(None)
+    x_slice = slice(*x_range) if x_range is not None else slice(None)
+    with h5py.File(input_filename, 'r') as file:
+        return file[component][z, y_slice, x_slice]
+
+def combine_ovf_files(output_filename: str, input_filenames, weights=None) -> None:
+    """
+    複数のOVFファイル（圧縮OVFコンテナも可）をz層ごとにストリームで読み、重み付きで足し合わせて書き出す。
+
+    Parameters
+    ----------
+    output_filename : str
+        出力ファイルのパス（.ovfz なら圧縮OVFコンテナ）
+    input_filenames : list
+        入力ファイルのパス（全て同じノード数）
+    weights : list
+        各入力の重み（デフォルトは全て1）
+    """
+    if weights is None:
+        weights = [1.] * len(input_filenames)
+
+    header_infos = [read_ovf_header(input_filename) for input_filename in input_filenames]
+    n_x, n_y, n_z = header_infos[0]['n_x'], header_infos[0]['n_y'], header_infos[0]['n_z']
+    if any((info['n_x'], info['n_y'], info['n_z']) != (n_x, n_y, n_z) for info in header_infos):
+        raise ValueError("OVF files to combine must have the same number of nodes")
+
+    slice_iters = [iter_ovf_slices(input_filename) for input_filename in input_filenames]
+    for z in range(n_z):
+        B_pump = sum(weight * next(slice_iter)[1].astype(np.float64) for weight, slice_iter in zip(weights, slice_iters))
+        write_ovf_step(z, output_filename, n_x, n_y, n_z, B_pump[:, :, 0], B_pump[:, :, 1], B_pump[:, :, 2])
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import tracemalloc
+import argparse
+import numpy as np
+
+import calc_field as cf
+import output_ovf as oo
+
+# per-machine cost model written by --calibrate
+COST_MODEL_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'antenna_field', 'cost_model.json')
+# cost model of a typical desktop, used until the machine is calibrated
+DEFAULT_COST_MODEL = {
+    'rotate_seconds_per_wide_cell': 1.4e-7,
+    'rotate_bytes_per_wide_cell': 45.,
+    'direct_seconds_per_cell': 1.2e-7,
+    'cell_average_seconds_per_cell': 8e-7,
+    'lut_seconds_per_cell': 6e-8,
+    'segment_seconds_per_pair': 7e-7,
+    'write_bytes_per_second': 5e8
+}
+# bytes per cell of one slice held outside the kernel: three float64 components and the float32 slice written
+SLICE_BYTES_PER_CELL = 3 * 8 + 3 * 4
+# work queue tasks are sized to take about this long [s]
+TARGET_TASK_SECONDS = 60.
+# the planner keeps this fraction of the physical memory for the run unless a budget is given
+MEMORY_FRACTION = 0.5
+
+def get_physical_memory():
+    # physical memory [bytes], None if it cannot be determined
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, AttributeError, OSError):
+        pass
+    try:
+        import ctypes
+
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [('dwLength', ctypes.c_ulong), ('dwMemoryLoad', ctypes.c_ulong), ('ullTotalPhys', ctypes.c_ulonglong), ('ullAvailPhys', ctypes.c_ulonglong), ('ullTotalPageFile', ctypes.c_ulonglong), ('ullAvailPageFile', ctypes.c_ulonglong), ('ullTotalVirtual', ctypes.c_ulonglong), ('ullAvailVirtual', ctypes.c_ulonglong), ('ullAvailExtendedVirtual', ctypes.c_ulonglong)]
+
+        status = MEMORYSTATUSEX()
+        status.dwLength = ctypes.sizeof(MEMORYSTATUSEX)
+        ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(status))
+        return int(status.ullTotalPhys)
+    except (AttributeError, OSError):
+        return None
+
+def load_cost_model(filename=COST_MODEL_FILE):
+    cost_model = dict(DEFAULT_COST_MODEL)
+    if os.path.isfile(filename):
+        with open(filename, 'r') as f:
+            cost_model.update(json.load(f))
+    return cost_model
+
+def get_mesh_arrays(n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float):
+    return cf.get_cell_centers(n_x, size_x), cf.get_cell_centers(n_y, size_y), cf.get_cell_centers(n_z, size_z)
+
+def get_wide_shape(n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dict, decay_tol=cf.FIELD_DECAY_TOL):
+    # (rows, columns) of the padded map the rotate engine builds for one antenna or parallel group (deepest slice, the widest)
+    x_arr, y_arr, z_arr = get_mesh_arrays(n_x, n_y, n_z, size_x, size_y, size_z)
+    size_cell_x, size_cell_y = size_x / n_x, size_y / n_y
+    z_value = ant_dict['ant_thickness'] / 2 + ant_dict['distance'] + z_arr[-1]
+    decay_distance = cf.get_decay_distance(cf.get_antenna_extent(ant_dict), ant_dict['ant_thickness'], z_value, decay_tol)
+    wide_x_arr, wide_y_arr = cf.get_wide_domain(x_arr, y_arr, size_cell_x, size_cell_y, min(size_cell_x, size_cell_y), ant_dict['ant_position_x'], ant_dict['ant_position_y'], ant_dict['current_direction'], decay_distance)
+    return len(wide_y_arr), len(wide_x_arr)
+
+def get_output_bytes(n_x: int, n_y: int, n_z: int, output_extension='.ovf', export_hdf5=False) -> int:
+    # upper bound: the .ovfz and .h5 compression is not predicted
+    data_bytes = n_x * n_y * n_z * 3 * 4
+    output_bytes = len(oo.get_header(n_x, n_y, n_z).encode('utf-8')) + 4 + data_bytes + len(oo.get_footer().encode('utf-8'))
+    if export_hdf5:
+        output_bytes += data_bytes
+    return output_bytes
+
+def estimate_slice(n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dicts, engine: str, cost_model, memory_budget=cf.TILE_MEMORY_BUDGET):
+    # kernel evaluations, seconds and peak bytes of one z-slice with an engine preset
+    field_kwargs = cf.ENGINE_PRESETS[engine]
+    engine_name = field_kwargs.get('engine', 'rotate')
+    n_cells = n_x * n_y
+
+    # the rotate engine evaluates parallel straight antennas as one group
+    if engine_name == 'rotate':
+        ant_dicts = [ant_dict for ant_dict in ant_dicts if ant_dict.get('ant_type') == 'polyline'] + cf.get_parallel_groups([ant_dict for ant_dict in ant_dicts if ant_dict.get('ant_type') != 'polyline'])
+
+    evaluations = 0
+    seconds = 0.
+    kernel_bytes = 0
+    for ant_dict in ant_dicts:
+        if ant_dict.get('ant_type') == 'polyline' or engine_name == 'segment':
+            n_bars = len(ant_dict['vertices']) - 1 if ant_dict.get('ant_type') == 'polyline' else len(cf.get_antenna_conductors(ant_dict))
+            evaluations += n_cells * n_bars
+            seconds += n_cells * n_bars * cost_model['segment_seconds_per_pair']
+            kernel_bytes = max(kernel_bytes, min(n_cells * cf.TILE_BYTES_PER_CELL, memory_budget))
+        elif engine_name == 'rotate':
+            n_conductors = len(cf.get_antenna_conductors(ant_dict))
+            wide_n_y, wide_n_x = get_wide_shape(n_x, n_y, n_z, size_x, size_y, size_z, ant_dict)
+            # each conductor is evaluated on one column of the padded map, which is then rotated
+            evaluations += 2 * wide_n_y * n_conductors
+            seconds += wide_n_y * n_conductors * cost_model['direct_seconds_per_cell'] + wide_n_y * wide_n_x * cost_model['rotate_seconds_per_wide_cell']
+            kernel_bytes = max(kernel_bytes, wide_n_y * wide_n_x * cost_model['rotate_bytes_per_wide_cell'])
+        else:
+            n_conductors = len(cf.get_antenna_conductors(ant_dict))
+            if engine_name == 'lut':
+                seconds_per_cell = cost_model['lut_seconds_per_cell']
+            elif field_kwargs.get('sampling') == 'cell_average':
+                seconds_per_cell = cost_model['cell_average_seconds_per_cell']
+            else:
+                seconds_per_cell = cost_model['direct_seconds_per_cell']
+            evaluations += n_cells * n_conductors
+            seconds += n_cells * n_conductors * seconds_per_cell
+            kernel_bytes = max(kernel_bytes, min(n_cells * cf.TILE_BYTES_PER_CELL, memory_budget))
+
+    peak_bytes = kernel_bytes + n_cells * SLICE_BYTES_PER_CELL
+    return evaluations, seconds, peak_bytes
+
+def plan_run(n_x: int, n_y: int, n_z: int, size_x: float, size_y: float, size_z: float, ant_dicts, engine='rotate', output_extension='.ovf', export_hdf5=False, memory_budget=None, cost_model=None):
+    # Predict a run slice by slice (as the GUI, headless and work queue generate it) and choose its strategy:
+    # the engine (the padded rotate map is replaced by the tiled direct engine if it does not fit),
+    # the tile budget, the local worker count and the slices per work queue task.
+    if cost_model is None:
+        cost_model = load_cost_model()
+    if memory_budget is None:
+        physical_memory = get_physical_memory()
+        memory_budget = int(MEMORY_FRACTION * physical_memory) if physical_memory else 8 * 2**30
+
+    notes = []
+    slice_memory = n_x * n_y * SLICE_BYTES_PER_CELL
+    tile_budget = int(min(cf.TILE_MEMORY_BUDGET, max(memory_budget - slice_memory, 2**16)))
+
+    evaluations, slice_seconds, peak_bytes = estimate_slice(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, engine, cost_model, tile_budget)
+    if engine == 'rotate' and peak_bytes > memory_budget:
+        direct = estimate_slice(n_x, n_y, n_z, size_x, size_y, size_z, ant_dicts, 'direct', cost_model, tile_budget)
+        if direct[2] < peak_bytes:
+            notes.append(f"padded rotate map needs {format_bytes(peak_bytes)} > budget {format_bytes(memory_budget)}: using the tiled direct engine")
+            engine = 'direct'
+            evaluations, slice_seconds, peak_bytes = direct
+
+    write_seconds = n_x * n_y * 3 * 4 * (2 if export_hdf5 else 1) / cost_model['write_bytes_per_second']
+    slice_seconds += write_seconds
+
+    fits = peak_bytes <= memory_budget
+    if not fits:
+        notes.append(f"one slice needs {format_bytes(peak_bytes)} > budget {format_bytes(memory_budget)}")
+
+    workers = int(max(1, min(os.cpu_count() or 1, n_z, memory_budget // max(peak_bytes, 1))))
+    slices_per_task = int(max(1, min(n_z, np.ceil(TARGET_TASK_SECONDS / max(slice_seconds, 1e-9)))))
+
+    plan = {
+        'engine': engine,
+        'memory_budget': memory_budget,
+        'tile_memory_budget': tile_budget,
+        'workers': workers,
+        'slices_per_task': slices_per_task,
+        'dtype': '<f4',
+        'kernel_evaluations': int(evaluations * n_z),
+        'peak_bytes': int(peak_bytes),
+        'output_bytes': get_output_bytes(n_x, n_y, n_z, output_extension, export_hdf5),
+        'seconds': slice_seconds * n_z,
+        'fits': fits,
+        'notes': notes
+    }
+    return plan
+
+def format_bytes(n_bytes: float) -> str:
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if n_bytes < 1024:
+            return f"{n_bytes:.0f} {unit}" if unit == 'B' else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TiB"
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f} s"
+    if seconds < 3600:
+        return f"{seconds / 60:.1f} min"
+    return f"{seconds / 3600:.1f} h"
+
+def format_plan(plan) -> str:
+    text = f"{plan['engine']} engine, {plan['kernel_evaluations']:.2e} kernel evaluations, ~{format_seconds(plan['seconds'])}, peak {format_bytes(plan['peak_bytes'])} of {format_bytes(plan['memory_budget'])}, output {format_bytes(plan['output_bytes'])}"
+    for note in plan['notes']:
+        text += f"\n{note}"
+    return text
+
+def calibrate_cost_model(filename=COST_MODEL_FILE):
+    # time each engine on small meshes of this machine and store the coefficients
+    ant_dict = {'ant_width': 1e-6, 'ant_thickness': 1e-7, 'ant_position_x': 2e-6, 'ant_position_y': 2e-6, 'distance': 1e-7, 'current_direction': 30., 'input_current': 0.01}
+    n, size = 256, 4e-6
+    mesh = (n, n, 2, size, size, 2e-8)
+    cost_model = {}
+
+    def time_engine(engine, repeat=3):
+        cf.get_magnetic_field(*mesh, [ant_dict], current_step=1, lut_cache_dir=None, **cf.ENGINE_PRESETS[engine])
+        t0 = time.perf_counter()
+        for _ in range(repeat):
+            cf.get_magnetic_field(*mesh, [ant_dict], current_step=1, lut_cache_dir=None, **cf.ENGINE_PRESETS[engine])
+        return (time.perf_counter() - t0) / repeat
+
+    wide_cells = int(np.prod(get_wide_shape(*mesh, ant_dict)))
+    cost_model['rotate_seconds_per_wide_cell'] = time_engine('rotate') / wide_cells
+    tracemalloc.start()
+    cf.get_magnetic_field(*mesh, [ant_dict], current_step=1)
+    cost_model['rotate_bytes_per_wide_cell'] = (tracemalloc.get_traced_memory()[1] - n * n * SLICE_BYTES_PER_CELL) / wide_cells
+    tracemalloc.stop()
+
+    cost_model['direct_seconds_per_cell'] = time_engine('direct') / n**2
+    cost_model['cell_average_seconds_per_cell'] = time_engine('cell_average') / n**2
+    cost_model['lut_seconds_per_cell'] = time_engine('lut') / n**2
+    cost_model['segment_seconds_per_pair'] = time_engine('segment') / n**2
+
+    B_pump = [np.zeros((n, n)) for _ in range(3)]
+    output_filename = os.path.join(os.path.dirname(filename) or '.', 'calibration.ovf')
+    os.makedirs(os.path.dirname(output_filename), exist_ok=True)
+    t0 = time.perf_counter()
+    for step in range(8):
+        oo.write_ovf_step(step, output_filename, n, n, 8, *B_pump)
+    cost_model['write_bytes_per_second'] = 8 * n * n * 3 * 4 / (time.perf_counter() - t0)
+    os.remove(output_filename)
+
+    with open(filename, 'w') as f:
+        json.dump(cost_model, f, indent=4)
+    return cost_model
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Calibrate the cost model of the preflight planner on this machine.")
+    parser.add_argument('--calibrate', action='store_true', help=f"measure the engines and write {COST_MODEL_FILE}")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        for key, value in calibrate_cost_model().items():
+            print(f"{key}: {value:.3e}")
+    else:
+        print(json.dumps(load_cost_model(), indent=4))
+    sys.exit(0)
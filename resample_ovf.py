@@ -0,0 +1,73 @@
+import os
+import numpy as np
+
+import output_ovf as oo
+import calc_field as cf
+
+def calc_antennas_field_at_points(x_pts, y_pts, z, ant_dicts):
+    # analytic field of all antennas at points of the sample depth z (cell-center convention of get_magnetic_field)
+    B_ref = [np.zeros(len(x_pts)) for _ in range(3)]
+    for ant_dict in ant_dicts:
+        z_value = ant_dict['ant_thickness'] / 2 + ant_dict['distance'] + z
+        for c, B in enumerate(cf.calc_antenna_field_direct(x_pts, y_pts, z_value, ant_dict)):
+            B_ref[c] += B
+    return B_ref
+
+def resample_ovf_file(input_filename: str, output_filename: str, size_x: float, size_y: float, size_z: float, new_n_x: int, new_n_y: int, new_n_z: int, new_size_x=None, new_size_y=None, new_size_z=None, ant_dicts=None, n_check=256, seed=0):
+    # Resample an OVF file (or .ovfz container) onto a new mesh without recomputing the field.
+    # The source is read slice by slice through a memory map: each target slice is interpolated
+    # linearly in z between its two bracketing source slices and bilinearly in x, y.
+    # size_*: sample size of the source mesh (the OVF header holds only the node counts).
+    # new_size_*: sample size of the target mesh (default: the source size).
+    # ant_dicts: if given, n_check random target cells are compared with the analytic field.
+    new_size_x = size_x if new_size_x is None else new_size_x
+    new_size_y = size_y if new_size_y is None else new_size_y
+    new_size_z = size_z if new_size_z is None else new_size_z
+
+    header_info, read_slice = oo.get_ovf_slice_reader(input_filename)
+    n_x, n_y, n_z = header_info['n_x'], header_info['n_y'], header_info['n_z']
+
+    x_arr, y_arr, z_arr = cf.get_cell_centers(n_x, size_x), cf.get_cell_centers(n_y, size_y), cf.get_cell_centers(n_z, size_z)
+    new_x_arr, new_y_arr, new_z_arr = cf.get_cell_centers(new_n_x, new_size_x), cf.get_cell_centers(new_n_y, new_size_y), cf.get_cell_centers(new_n_z, new_size_z)
+    slice_weights = cf.get_slice_interpolation_weights(z_arr, new_z_arr)
+
+    # target cells beyond the outermost source cell centers take the edge value
+    inside_cells = 1
+    for arr, new_arr in ((x_arr, new_x_arr), (y_arr, new_y_arr), (z_arr, new_z_arr)):
+        inside_cells *= int(np.count_nonzero((new_arr >= arr[0]) & (new_arr <= arr[-1])))
+
+    report = {
+        'clamped_cells': new_n_x * new_n_y * new_n_z - inside_cells,
+        'checked_cells': 0,
+        'max_error': 0.,
+        'max_field': 0.
+    }
+
+    rng = np.random.default_rng(seed)
+    check_x = rng.integers(new_n_x, size=n_check)
+    check_y = rng.integers(new_n_y, size=n_check)
+    check_z = rng.integers(new_n_z, size=n_check)
+
+    desc_lines = [f"resampled from {os.path.basename(input_filename)} ({n_x}x{n_y}x{n_z} cells, {size_x:g}x{size_y:g}x{size_z:g} m)"]
+
+    source_slices = {}
+    for new_z, (z_lower, z_upper, weight) in enumerate(slice_weights):
+        # keep only the two source slices needed for this target slice
+        source_slices = {z: source_slices[z] if z in source_slices else np.asarray(read_slice(z), dtype=np.float64) for z in (z_lower, z_upper)}
+        B_slice = (1 - weight) * source_slices[z_lower] + weight * source_slices[z_upper]
+
+        B_new = [cf.resample_2d_array_interpolate(B_slice[:, :, c], y_arr, x_arr, new_y_arr, new_x_arr) for c in range(3)]
+        oo.write_ovf_step(new_z, output_filename, new_n_x, new_n_y, new_n_z, B_new[0], B_new[1], B_new[2], desc_lines)
+
+        check = check_z == new_z
+        if ant_dicts and np.any(check):
+            B_ref = calc_antennas_field_at_points(new_x_arr[check_x[check]], new_y_arr[check_y[check]], new_z_arr[new_z], ant_dicts)
+            for c in range(3):
+                report['max_error'] = max(report['max_error'], float(np.max(np.abs(B_new[c][check_y[check], check_x[check]] - B_ref[c]))))
+            report['max_field'] = max(report['max_field'], float(np.max(np.sqrt(B_ref[0]**2 + B_ref[1]**2 + B_ref[2]**2))))
+            report['checked_cells'] += int(np.count_nonzero(check))
+
+    if report['checked_cells'] > 0:
+        report['relative_error'] = report['max_error'] / report['max_field'] if report['max_field'] > 0 else 0.
+
+    return report
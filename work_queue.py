@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import socket
+import hashlib
+import subprocess
+import numpy as np
+
+import output_ovf as oo
+import calc_field as cf
+import planner
+from conditions import load_condition_file
+
+# A queue is a directory on a filesystem shared by all hosts:
+#   jobs/<job_id>.json             one output file: mesh, antennas, output path and fingerprint
+#   pending/<job_id>_<z0>-<z1>.json  tasks (z-slice ranges) waiting for a worker
+#   claimed/...                    tasks being computed; the file mtime is the worker's lease
+#   done/...                       finished tasks
+#   parts/<job_id>/<z>.npy         computed slices, (n_y, n_x, 3) float32
+#   merging/<job_id>.<worker>.json job being assembled into its OVF by one process; the file mtime is its lease
+# Every state change is a rename within the queue directory, which is atomic on POSIX and NFS,
+# so exactly one worker wins each claim. Leases compare file mtimes across hosts, so their clocks
+# must be synchronized (NTP) to well within the lease timeout.
+QUEUE_SUBDIRS = ('jobs', 'pending', 'claimed', 'done', 'parts', 'merging')
+
+# a claimed task (a merging job) whose lease was not renewed for this long [s] goes back to pending (jobs)
+LEASE_TIMEOUT = 600.
+# idle workers look for new tasks this often [s]
+POLL_INTERVAL = 2.
+
+def init_queue(queue_dir: str) -> None:
+    for subdir in QUEUE_SUBDIRS:
+        os.makedirs(os.path.join(queue_dir, subdir), exist_ok=True)
+
+def write_json_atomic(path: str, data) -> None:
+    # readers never see a partially written file
+    tmp_path = f"{path}.{socket.gethostname()}-{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+def get_job_id(output_path: str, fingerprint: str) -> str:
+    return hashlib.sha256((os.path.abspath(output_path) + fingerprint).encode('utf-8')).hexdigest()[:16]
+
+def submit_conditions(queue_dir: str, condition_filenames, slices_per_task=None, force=False, dir_path=None, engine='rotate'):
+    # split each condition file into tasks of slices_per_task z-slices; returns the submitted job ids.
+    # slices_per_task None: as many as the preflight plan predicts for a task of about planner.TARGET_TASK_SECONDS.
+    # engine: preset of cf.ENGINE_PRESETS; the job keeps the engine of the preflight plan, as 'headless.py run' does
+    init_queue(queue_dir)
+    job_ids = []
+    for condition_filename in condition_filenames:
+        condition = load_condition_file(condition_filename, dir_path)
+        if condition['export_basis']:
+            raise ValueError(f"{condition_filename}: basis export needs all slices at once; use 'headless.py run'")
+
+        n_x, n_y, n_z = condition['n_x'], condition['n_y'], condition['n_z']
+        size_x, size_y, size_z = condition['size_x'], condition['size_y'], condition['size_z']
+        output_path = os.path.abspath(condition['output_path'])
+        plan = planner.plan_run(n_x, n_y, n_z, size_x, size_y, size_z, condition['ant_dicts'], engine, os.path.splitext(output_path)[1])
+        fingerprint = cf.get_condition_fingerprint(n_x, n_y, n_z, size_x, size_y, size_z, condition['ant_dicts'], **cf.ENGINE_PRESETS[plan['engine']])
+        if not force and oo.read_ovf_fingerprint(output_path) == fingerprint:
+            print(f"{output_path} is up to date (skipped)")
+            continue
+
+        job_id = get_job_id(output_path, fingerprint)
+        job_slices_per_task = slices_per_task
+        if job_slices_per_task is None:
+            job_slices_per_task = plan['slices_per_task']
+        job = {
+            'job_id': job_id,
+            'condition_filename': os.path.abspath(condition_filename),
+            'n': [n_x, n_y, n_z],
+            'size': [size_x, size_y, size_z],
+            'ant_dicts': condition['ant_dicts'],
+            'output_path': output_path,
+            'engine': plan['engine'],
+            'fingerprint': fingerprint
+        }
+        os.makedirs(os.path.join(queue_dir, 'parts', job_id), exist_ok=True)
+        write_json_atomic(os.path.join(queue_dir, 'jobs', job_id + '.json'), job)
+
+        for z_begin in range(0, n_z, job_slices_per_task):
+            z_end = min(z_begin + job_slices_per_task, n_z)
+            task_name = f"{job_id}_{z_begin:06d}-{z_end:06d}.json"
+            # a resubmitted job keeps its finished and running tasks
+            if any(os.path.exists(os.path.join(queue_dir, state, task_name)) for state in ('claimed', 'done')):
+                continue
+            write_json_atomic(os.path.join(queue_dir, 'pending', task_name), {'job_id': job_id, 'z_begin': z_begin, 'z_end': z_end})
+        job_ids.append(job_id)
+        print(f"{output_path}: job {job_id}, {-(-n_z // job_slices_per_task)} tasks")
+    return job_ids
+
+def recover_expired(queue_dir: str, state: str, target_state: str, lease_timeout=LEASE_TIMEOUT, get_target_name=None) -> int:
+    # move the files of dead processes (lease not renewed within lease_timeout) from state back to target_state;
+    # get_target_name: name in target_state of a file of state (the same name if None)
+    recovered = 0
+    state_dir = os.path.join(queue_dir, state)
+    now = time.time()
+    for name in os.listdir(state_dir):
+        if not name.endswith('.json'):
+            continue
+        state_path = os.path.join(state_dir, name)
+        try:
+            if now - os.path.getmtime(state_path) > lease_timeout:
+                target_name = name if get_target_name is None else get_target_name(name)
+                os.rename(state_path, os.path.join(queue_dir, target_state, target_name))
+                recovered += 1
+        except FileNotFoundError:
+            # finished or recovered by another process meanwhile
+            continue
+    return recovered
+
+def recover_expired_tasks(queue_dir: str, lease_timeout=LEASE_TIMEOUT) -> int:
+    # put tasks of dead workers back to pending
+    return recover_expired(queue_dir, 'claimed', 'pending', lease_timeout)
+
+def recover_expired_merges(queue_dir: str, lease_timeout=LEASE_TIMEOUT) -> int:
+    # put jobs of dead mergers back to jobs; the next merger rewrites the OVF from its first slice
+    return recover_expired(queue_dir, 'merging', 'jobs', lease_timeout, get_target_name=lambda name: name.split('.')[0] + '.json')
+
+def get_merge_lease_path(queue_dir: str, job_id: str) -> str:
+    # one lease file per merger, so a merger whose lease expired can never renew or release the lease of the next one
+    return os.path.join(queue_dir, 'merging', f"{job_id}.{get_worker_id()}.json")
+
+def claim_task(queue_dir: str):
+    # move one pending task to claimed; returns its name, or None if nothing is pending
+    for task_name in sorted(os.listdir(os.path.join(queue_dir, 'pending'))):
+        if not task_name.endswith('.json'):
+            continue
+        claimed_path = os.path.join(queue_dir, 'claimed', task_name)
+        try:
+            os.rename(os.path.join(queue_dir, 'pending', task_name), claimed_path)
+        except FileNotFoundError:
+            # another worker was faster
+            continue
+        # the lease starts now, not when the task was submitted
+        os.utime(claimed_path)
+        return task_name
+    return None
+
+def renew_lease(queue_dir: str, task_name: str) -> bool:
+    # False if the task was recovered by another process (the slices are still written, they are identical)
+    try:
+        os.utime(os.path.join(queue_dir, 'claimed', task_name))
+        return True
+    except FileNotFoundError:
+        return False
+
+def get_part_path(queue_dir: str, job_id: str, z: int) -> str:
+    return os.path.join(queue_dir, 'parts', job_id, f"{z:06d}.npy")
+
+def run_task(queue_dir: str, task_name: str) -> None:
+    with open(os.path.join(queue_dir, 'claimed', task_name), 'r') as f:
+        task = json.load(f)
+    with open(os.path.join(queue_dir, 'jobs', task['job_id'] + '.json'), 'r') as f:
+        job = json.load(f)
+
+    # the engine of the submitted plan, so the output is the one a local run writes
+    field_kwargs = cf.ENGINE_PRESETS[job['engine']]
+    for z in range(task['z_begin'], task['z_end']):
+        B_pump_x, B_pump_y, B_pump_z = cf.get_magnetic_field(*job['n'], *job['size'], job['ant_dicts'], current_step=z, **field_kwargs)
+        # float32 like the OVF data, so the merged file is identical to a single-host run
+        part = np.stack((B_pump_x, B_pump_y, B_pump_z), axis=-1).astype(np.float32)
+        part_path = get_part_path(queue_dir, task['job_id'], z)
+        tmp_path = f"{part_path}.{get_worker_id()}.tmp.npy"
+        np.save(tmp_path, part)
+        os.replace(tmp_path, part_path)
+        renew_lease(queue_dir, task_name)
+
+    try:
+        os.rename(os.path.join(queue_dir, 'claimed', task_name), os.path.join(queue_dir, 'done', task_name))
+    except FileNotFoundError:
+        pass
+
+def merge_job(queue_dir: str, job_id: str) -> bool:
+    # assemble the OVF of a job whose slices are all written; False if it is incomplete or merged elsewhere
+    job_path = os.path.join(queue_dir, 'jobs', job_id + '.json')
+    try:
+        with open(job_path, 'r') as f:
+            job = json.load(f)
+    except FileNotFoundError:
+        return False
+
+    n_x, n_y, n_z = job['n']
+    part_paths = [get_part_path(queue_dir, job_id, z) for z in range(n_z)]
+    if not all(os.path.exists(part_path) for part_path in part_paths):
+        return False
+
+    lease_path = get_merge_lease_path(queue_dir, job_id)
+    try:
+        os.rename(job_path, lease_path)
+    except FileNotFoundError:
+        return False
+    # the lease starts now, not when the job was submitted
+    os.utime(lease_path)
+
+    # slices go to a file of this merger and replace the output only once the job is finished, so a merger that
+    # lost its lease never writes into the output of the one that took the job over
+    root, extension = os.path.splitext(job['output_path'])
+    tmp_path = f"{root}.{get_worker_id()}.tmp{extension}"
+    desc_lines = oo.get_fingerprint_desc(job['fingerprint'])
+    try:
+        for z, part_path in enumerate(part_paths):
+            # renew the lease; gone once it expired and the job was handed to another merger, which rewrites the whole file
+            os.utime(lease_path)
+            part = np.load(part_path)
+            oo.write_ovf_step(z, tmp_path, n_x, n_y, n_z, part[:, :, 0], part[:, :, 1], part[:, :, 2], desc_lines)
+        # releasing the lease is the ownership check of the cleanup: the job is finished once it leaves merging.
+        # After a crash below, resubmitting the condition merges the kept parts again
+        os.remove(lease_path)
+    except FileNotFoundError:
+        # lease taken over, or parts removed by a merger that finished the job
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+    os.replace(tmp_path, job['output_path'])
+
+    for part_path in part_paths:
+        os.remove(part_path)
+    os.rmdir(os.path.join(queue_dir, 'parts', job_id))
+    # a later submission of the same job starts from scratch
+    for task_name in os.listdir(os.path.join(queue_dir, 'done')):
+        if task_name.startswith(job_id + '_'):
+            os.remove(os.path.join(queue_dir, 'done', task_name))
+    print(f"{job['output_path']} written", flush=True)
+    return True
+
+def merge_ready_jobs(queue_dir: str, lease_timeout=LEASE_TIMEOUT) -> int:
+    # merges of dead processes are taken over first
+    recover_expired_merges(queue_dir, lease_timeout)
+    merged = 0
+    for job_name in sorted(os.listdir(os.path.join(queue_dir, 'jobs'))):
+        if job_name.endswith('.json') and merge_job(queue_dir, job_name[:-len('.json')]):
+            merged += 1
+    return merged
+
+def run_worker(queue_dir: str, lease_timeout=LEASE_TIMEOUT, poll_interval=POLL_INTERVAL, wait=False) -> int:
+    # claim and compute tasks until the queue is empty; the last worker to finish a job merges it.
+    # wait: keep polling for new tasks instead of exiting when nothing is pending or claimed.
+    init_queue(queue_dir)
+    worker_id = get_worker_id()
+    n_tasks = 0
+    while True:
+        recover_expired_tasks(queue_dir, lease_timeout)
+        task_name = claim_task(queue_dir)
+        if task_name is not None:
+            run_task(queue_dir, task_name)
+            n_tasks += 1
+            print(f"{worker_id}: {task_name} done", flush=True)
+            merge_ready_jobs(queue_dir, lease_timeout)
+            continue
+
+        merge_ready_jobs(queue_dir, lease_timeout)
+        # tasks claimed by others may still come back to pending if their worker dies
+        if not wait and len(os.listdir(os.path.join(queue_dir, 'claimed'))) == 0:
+            return n_tasks
+        time.sleep(poll_interval)
+
+def run_local_workers(queue_dir: str, n_workers: int, lease_timeout=LEASE_TIMEOUT) -> None:
+    # n_workers worker processes on this host, e.g. to test a queue before using the cluster
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'headless.py')
+    workers = [subprocess.Popen([sys.executable, script, 'worker', queue_dir, '--lease-timeout', str(lease_timeout)]) for _ in range(n_workers)]
+    for worker in workers:
+        worker.wait()
+    merge_ready_jobs(queue_dir, lease_timeout)